@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# LLVM bindings benchmark
+#
+# Emits a function of arithmetic through the builder, as the emitter does,
+# reporting binding calls per second with the direct wrappers and with the
+# instrumented ones, with and without debug logging. Then emits a whole
+# program with each.
+
+import os
+import sys
+import time
+import logging
+from io import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compiler import jam, lekvar, llvm, session
+from compiler.llvm import bindings
+
+REPEAT = 5
+INSTRUCTIONS = 2000
+SOURCE = "".join("puts(({} + 1) as Real)\n".format(i) for i in range(200))
+
+# Build a function, returns the number of binding calls made
+def build():
+    i32 = bindings.Int.new(32)
+    module = bindings.Module.fromName("benchmark")
+    builder = bindings.Builder.new()
+
+    function = module.addFunction("f", bindings.Function.new(i32, [i32], False))
+    builder.positionAtEnd(function.appendBlock("entry"))
+    calls = 6
+
+    value = function.getParam(0)
+    for _ in range(INSTRUCTIONS):
+        one = bindings.Value.constInt(i32, 1, False)
+        value = builder.iAdd(value, one, "")
+        calls += 2
+
+    builder.ret(value)
+    return calls + 1
+
+def callsPerSecond():
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        calls = build()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return calls / best
+
+def emission():
+    best = None
+    for _ in range(REPEAT):
+        # A session emits a single module, the builtins keep their values
+        with lekvar.use(jam, llvm):
+            module = lekvar._verify(StringIO(SOURCE), jam)
+            start = time.perf_counter()
+            # Without optimisation, only emission is measured
+            llvm.emit(module, opt_level=0)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    logger = logging.getLogger("benchmark")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    for name, instrumented, level in [
+            ("direct", False, logging.WARNING),
+            ("instrumented", True, logging.WARNING),
+            ("instrumented, debug", True, logging.DEBUG)]:
+        bindings.instrument(instrumented)
+        logger.setLevel(level)
+        session.current().logger = logger
+
+        print("{}:".format(name))
+        print("  builder: {:>12.0f} calls/s".format(callsPerSecond()))
+        if level != logging.DEBUG:
+            print("  program: {:>12.2f} ms".format(emission() * 1000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# Overload dispatch benchmark
+#
+# Verifies a program calling a function with an overload for every pair of
+# builtin types, once per overload, reporting verification time per call.
+
+import os
+import sys
+import time
+import itertools
+from io import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compiler import jam, lekvar, interpreter
+
+REPEAT = 5
+CALLS = 50
+VALUES = {"Int": "1", "Real": "1.5", "String": "\"a\"", "Bool": "true"}
+
+def program():
+    pairs = list(itertools.product(VALUES, VALUES))
+
+    source = ""
+    for lhs, rhs in pairs:
+        source += "def g(x:{}, y:{}) -> Int\n    return 1\nend\n".format(lhs, rhs)
+    for _ in range(CALLS):
+        for lhs, rhs in pairs:
+            source += "g({}, {})\n".format(VALUES[lhs], VALUES[rhs])
+
+    return source, len(pairs), len(pairs) * CALLS
+
+def main():
+    source, overloads, calls = program()
+
+    with lekvar.use(jam, interpreter):
+        best = None
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            lekvar._verify(StringIO(source), jam)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+    print("{} calls to a method of {} overloads, best of {}".format(calls, overloads, REPEAT))
+    print("verification: {:>8.2f} ms".format(best * 1000))
+    print("per call:     {:>8.2f} us".format(best / calls * 10**6))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Lexer throughput benchmark
+#
+# Lexes every test program and the builtins with both the reference tree
+# walking lexer and the determinized lexer, reporting tokens per second.
+# Then lexes increasingly large string literals, which should scale linearly.
+
+import os
+import sys
+import time
+from io import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "test"))
+
+from compiler.jam.lexer import Lexer
+from compiler.jam.builtins import BUILTINS_PATH
+from nfa_lexer import NFALexer
+
+TESTS_PATH = os.path.join(os.path.dirname(__file__), "..", "test", "programs")
+REPEAT = 20
+LITERAL_SIZES = [10**4, 10**5, 10**6]
+
+def sources():
+    paths = [BUILTINS_PATH]
+    for root, dirs, files in os.walk(TESTS_PATH):
+        paths += [os.path.join(root, file) for file in files if file.endswith(".jm")]
+
+    # Skip sources that don't lex
+    out = []
+    for path in paths:
+        with open(path, "r") as f:
+            source = f.read()
+        try:
+            count(Lexer, source)
+        except Exception:
+            continue
+        out.append(source)
+    return out
+
+def count(lexer_class, source):
+    lexer = lexer_class(StringIO(source))
+    tokens = 0
+    while lexer.lex() is not None:
+        tokens += 1
+    return tokens
+
+def benchmark(lexer_class, sources):
+    tokens = 0
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        for source in sources:
+            tokens += count(lexer_class, source)
+    return tokens / (time.perf_counter() - start)
+
+def benchmarkLiteral(size):
+    source = "x = `{}`\n".format("a" * size)
+
+    start = time.perf_counter()
+    lexer = Lexer(StringIO(source))
+    while lexer.lex() is not None:
+        pass
+    return len(source) / (time.perf_counter() - start)
+
+def main():
+    data = sources()
+    before = benchmark(NFALexer, data)
+    after = benchmark(Lexer, data)
+
+    print("{} sources, {} repetitions".format(len(data), REPEAT))
+    print("tree lexer: {:>12.0f} tokens/s".format(before))
+    print("dfa lexer:  {:>12.0f} tokens/s".format(after))
+    print("speedup:    {:>12.2f}x".format(after / before))
+
+    print()
+    for size in LITERAL_SIZES:
+        print("{:>8} character literal: {:>12.0f} characters/s".format(size, benchmarkLiteral(size)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# Token memory benchmark
+#
+# Parses a large generated module, reporting the peak memory used while
+# parsing and the memory retained by its tokens. For comparison, the same
+# tokens are also materialized as individual objects, as the lexer used to.
+
+import os
+import sys
+import logging
+import tracemalloc
+from io import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compiler.jam import parser
+from compiler.jam.lexer import Lexer
+
+FUNCTIONS = 2000
+
+FUNCTION = """
+def function{0}(a:Int, b:Int) -> Int
+    c = a * {0} + b // 2 - (a % 3)
+    if c > 100 && b != {0}
+        puts("large {{c}}")
+    end
+    return c
+end
+"""
+
+# Equivalent of a token as a full python object
+class ObjectToken:
+    def __init__(self, type, start, end, data):
+        self.type = type
+        self.start = start
+        self.end = end
+        self.data = data
+
+def source():
+    return "".join(FUNCTION.format(i) for i in range(FUNCTIONS))
+
+def measure(function):
+    tracemalloc.start()
+    result = function()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+def lexStore(data):
+    lexer = Lexer(StringIO(data))
+    while lexer.lex() is not None:
+        pass
+    return lexer.store
+
+def lexObjects(data):
+    lexer = Lexer(StringIO(data))
+    tokens = []
+    token = lexer.lex()
+    while token is not None:
+        tokens.append(ObjectToken(token.type, token.start, token.end, token.data))
+        token = lexer.lex()
+    return tokens
+
+def main():
+    data = source()
+    print("{} functions, {} characters".format(FUNCTIONS, len(data)))
+
+    module, current, peak = measure(lambda: parser.parseFile(StringIO(data), logging.getLogger()))
+    print("parsing:        peak {:>8.1f} KiB, kept {:>8.1f} KiB".format(peak / 1024, current / 1024))
+
+    store, current, peak = measure(lambda: lexStore(data))
+    print("token store:    kept {:>8.1f} KiB for {} tokens".format(current / 1024, len(store)))
+
+    tokens, current, peak = measure(lambda: lexObjects(data))
+    print("token objects:  kept {:>8.1f} KiB for {} tokens".format(current / 1024, len(tokens)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# Startup benchmark
+#
+# Runs hello world with the interpreter, including setting up the builtins,
+# as a new process would without builtin snapshots, as a new process would
+# with them on disk and as later runs within the same process do. Both with
+# builtins verified on demand and with everything verified.
+
+import os
+import sys
+import time
+import tempfile
+from io import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# Keep the cache entries of the benchmark to itself
+os.environ["JAM_CACHE"] = tempfile.mkdtemp()
+
+from compiler import jam, lekvar, interpreter
+from compiler.lekvar import snapshot
+
+REPEAT = 20
+SOURCE = "puts(\"Hello, World!\")\n"
+
+jam_builtins = sys.modules["compiler.jam.builtins"]
+
+def run():
+    start = time.perf_counter()
+    with lekvar.use(jam, interpreter):
+        lekvar.run(StringIO(SOURCE), jam, interpreter)
+    return time.perf_counter() - start
+
+# A new process has nothing in memory, only the cache on disk
+def newProcess():
+    jam_builtins.builtin_cache = None
+    snapshot.snapshots.clear()
+    return run()
+
+def benchmark():
+    snapshot.enabled = False
+    try:
+        newProcess()
+        parsed = min(newProcess() for _ in range(REPEAT))
+    finally:
+        snapshot.enabled = True
+
+    newProcess()
+    disk = min(newProcess() for _ in range(REPEAT))
+    memory = min(run() for _ in range(REPEAT))
+    return parsed, disk, memory
+
+def main():
+    print("hello world, best of {}".format(REPEAT))
+
+    for verify_all in (False, True):
+        lekvar.State.verify_all = verify_all
+        parsed, disk, memory = benchmark()
+
+        print("verifying {}:".format("all" if verify_all else "on demand"))
+        print("  without snapshot: {:>8.2f} ms".format(parsed * 1000))
+        print("  from disk:        {:>8.2f} ms".format(disk * 1000))
+        print("  from memory:      {:>8.2f} ms".format(memory * 1000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# Verification benchmark
+#
+# Verifies the builtins with and without memoized compatibility checks,
+# reporting the median time spent and the time saved by the memo table.
+
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compiler import jam, lekvar
+from compiler.lekvar import util
+
+REPEAT = 20
+
+def verifyBuiltins():
+    builtins = jam.builtins()
+    builtins.context.addChild(lekvar.ForwardObject(builtins, "_builtins"))
+    # Pragmas within the builtins expect them to be in use
+    lekvar.State.builtins = builtins
+
+    start = time.perf_counter()
+    # Verify every builtin, not only the ones used
+    with lekvar.State.verifyingAll():
+        lekvar.verify(builtins)
+    return time.perf_counter() - start
+
+def verifyWith(memoize):
+    previous = util.memoize_compatibility
+    util.memoize_compatibility = memoize
+    try:
+        return verifyBuiltins()
+    finally:
+        util.memoize_compatibility = previous
+
+def main():
+    # Warm up the builtin parse cache
+    verifyBuiltins()
+
+    # Runs with and without the memo are interleaved, alternating which goes
+    # first, so that drift in the machine's speed affects both alike
+    times = {False: [], True: []}
+    for run in range(REPEAT):
+        for memoize in ([False, True] if run % 2 == 0 else [True, False]):
+            times[memoize].append(verifyWith(memoize))
+            if memoize:
+                hits, misses = lekvar.State.compatibility_hits, lekvar.State.compatibility_misses
+
+    before = statistics.median(times[False])
+    after = statistics.median(times[True])
+
+    print("builtins.jm, median of {} interleaved runs".format(REPEAT))
+    print("without memo: {:>8.2f} ms".format(before * 1000))
+    print("with memo:    {:>8.2f} ms".format(after * 1000))
+    print("saved:        {:>8.2f} ms ({:.1%})".format((before - after) * 1000, 1 - after / before))
+    print("compatibility checks: {} memoized, {} computed".format(hits, misses))
+
+if __name__ == "__main__":
+    main()
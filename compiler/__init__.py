@@ -1,2 +1,3 @@
+from . import session
 from . import jam, lekvar, llvm
 from .errors import *
@@ -0,0 +1,59 @@
+import os
+import platform
+
+from . import cache
+
+# Cache of compiled programs, such as the IR and executables of `jam compile`.
+#
+# Artifacts depend on their source, on the options they were compiled with and
+# on the files their source imports. Those files are only known once a program
+# is verified, so every source and set of options has a manifest listing the
+# paths they depended on last time. An artifact is keyed by the manifest's key
+# along with the current content of every file in the manifest, so any change
+# to them, including files appearing or disappearing, misses the cache.
+
+MANIFEST_CACHE = "manifests"
+ARTIFACT_CACHE = "artifacts"
+
+# The key of a source file compiled with a set of options.
+# Returns None if the source isn't a regular file, or if the cache is disabled.
+def key(source, *options) -> str:
+    if not cache.enabled: return None
+
+    name = getattr(source, "name", None)
+    if not isinstance(name, str) or not os.path.isfile(name):
+        return None
+
+    with open(name, "rb") as f:
+        data = f.read()
+
+    # Imports are found relative to the source
+    directory = os.path.dirname(os.path.abspath(name))
+    return cache.hashKey(data, directory, platform.machine(), *map(str, options))
+
+# The key of an artifact, from the current content of its dependencies
+def _artifactKey(key:str, dependencies:[str]) -> str:
+    parts = [key]
+    for path in dependencies:
+        try:
+            with open(path, "rb") as f:
+                content = cache.hashKey(f.read())
+        except OSError:
+            content = ""
+        parts += [path, content]
+    return cache.hashKey(*parts)
+
+# Load a cached artifact, None if it isn't cached or out of date
+def load(key:str) -> bytes:
+    manifest = cache.read(MANIFEST_CACHE, key)
+    if manifest is None: return None
+
+    dependencies = manifest.decode("UTF-8").split("\n") if manifest else []
+    return cache.read(ARTIFACT_CACHE, _artifactKey(key, dependencies))
+
+def store(key:str, dependencies:[str], artifact:bytes):
+    # Files may be looked for more than once
+    dependencies = list(dict.fromkeys(dependencies))
+
+    cache.write(MANIFEST_CACHE, key, "\n".join(dependencies).encode("UTF-8"))
+    cache.write(ARTIFACT_CACHE, _artifactKey(key, dependencies), artifact)
@@ -0,0 +1,169 @@
+import os
+import sys
+import hashlib
+import logging
+import tempfile
+
+# On-disk cache for compilation results, shared between runs.
+#
+# Entries are grouped by kind and keyed by a hash of their inputs. All entries
+# live in a directory specific to the compiler version, which is a hash of the
+# compiler's own source, so any change to the compiler invalidates them. The
+# directories of other versions are never touched, so that different
+# checkouts of the compiler can share a cache.
+#
+# The size of each version's entries is limited. A running total is kept in an
+# index, so that writes don't have to walk the cache. Reading an entry marks
+# it as used, the least recently used entries are evicted once the limit is
+# exceeded.
+
+# The cache is opt-in, it is enabled by setting JAM_CACHE to its location
+CACHE_PATH = os.environ.get("JAM_CACHE", "")
+enabled = bool(CACHE_PATH)
+
+# The size limit of the cache in MiB, set by JAM_CACHE_SIZE
+size_limit = int(os.environ.get("JAM_CACHE_SIZE", 512)) * 1024 * 1024
+
+logger = logging.getLogger("cache")
+
+COMPILER_PATH = os.path.dirname(os.path.abspath(__file__))
+COMPILER_SOURCE_EXTENSIONS = (".py", ".jm")
+
+_version = None
+
+# A hash identifying the compiler, its source and the python version
+def version():
+    global _version
+    if _version is not None:
+        return _version
+
+    hash = hashlib.sha256(sys.version.encode("UTF-8"))
+
+    paths = []
+    for root, dirs, files in os.walk(COMPILER_PATH):
+        paths += [os.path.join(root, file) for file in files
+                  if file.endswith(COMPILER_SOURCE_EXTENSIONS)]
+
+    for path in sorted(paths):
+        hash.update(os.path.relpath(path, COMPILER_PATH).encode("UTF-8"))
+        with open(path, "rb") as f:
+            hash.update(f.read())
+
+    _version = hash.hexdigest()
+    return _version
+
+# Hash a set of strings or bytes into a cache key
+def hashKey(*parts):
+    hash = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("UTF-8")
+        # Prefix lengths so that part boundaries are unambiguous
+        hash.update(str(len(part)).encode("UTF-8") + b":")
+        hash.update(part)
+    return hash.hexdigest()
+
+def _versionPath():
+    return os.path.join(os.path.expanduser(CACHE_PATH), version()[:32])
+
+def path(kind:str, key:str):
+    return os.path.join(_versionPath(), kind, key)
+
+# Read a cache entry, returns None if it does not exist
+def read(kind:str, key:str):
+    if not enabled: return None
+
+    entry_path = path(kind, key)
+    try:
+        with open(entry_path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    # Mark the entry as recently used
+    try:
+        os.utime(entry_path)
+    except OSError:
+        pass
+    return data
+
+# Write a cache entry, failing silently
+def write(kind:str, key:str, data:bytes):
+    if not enabled: return
+
+    target = path(kind, key)
+
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+
+        # Overwritten entries no longer count towards the size
+        try:
+            replaced = os.stat(target).st_size
+        except OSError:
+            replaced = 0
+
+        # Write atomically, so concurrent compilers never see partial entries
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, target)
+    except OSError as e:
+        logger.debug("Failed to write cache entry {}/{}: {}".format(kind, key, e))
+        return
+
+    total = _readSize() + len(data) - replaced
+    if total > size_limit:
+        total = _evict()
+    _writeSize(total)
+
+INDEX_FILE = "size"
+
+# The total size of the entries, as recorded in the index. Concurrent writers
+# may lose updates to it, so it is only an estimate. It is corrected whenever
+# the cache is evicted.
+def _readSize() -> int:
+    try:
+        with open(os.path.join(_versionPath(), INDEX_FILE), "r") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 0
+
+def _writeSize(total:int):
+    index_path = os.path.join(_versionPath(), INDEX_FILE)
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=_versionPath())
+        with os.fdopen(fd, "w") as f:
+            f.write(str(total))
+        os.replace(temp_path, index_path)
+    except OSError as e:
+        logger.debug("Failed to write cache index: {}".format(e))
+
+# Remove the least recently used entries, until the cache fits its size limit.
+# Returns the size of the remaining entries.
+def _evict() -> int:
+    entries = []
+    total = 0
+    for root, dirs, files in os.walk(_versionPath()):
+        # Skip the index, along with any temporary files
+        if root == _versionPath(): continue
+
+        for file in files:
+            try:
+                stat = os.stat(os.path.join(root, file))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, os.path.join(root, file)))
+            total += stat.st_size
+
+    if total <= size_limit: return total
+
+    for mtime, size, entry_path in sorted(entries):
+        try:
+            os.remove(entry_path)
+        except OSError:
+            continue
+
+        logger.debug("Evicted cache entry {}".format(entry_path))
+        total -= size
+        if total <= size_limit: break
+    return total
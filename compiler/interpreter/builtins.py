@@ -8,9 +8,6 @@ from .state import State
 from .. import lekvar
 
 def builtins(logger = logging.getLogger()):
-    global printf
-    printf = None
-
     string = PyType("String", str)
     size = PyType("Int64", int)
     ints = [
@@ -99,7 +96,10 @@ def builtins(logger = logging.getLogger()):
     builtin_objects.append(PyFunction("ptrOffset", [void, size], void, lambda ptr, s: ptr.offset(s)))
 
     module = lekvar.Module("_builtins", builtin_objects)
-    module.verify()
+    # Backend builtins are only resolved through targeting, so none of them
+    # would be verified on demand
+    with lekvar.State.verifyingAll():
+        module.verify()
     return module
 
 class PyPointer:
@@ -185,6 +185,9 @@ class PyType(lekvar.Type, lekvar.BoundObject):
                 return True
         return False
 
+    def resolveNominal(self):
+        return (PyType, self.name)
+
     def eval(self):
         return None
 
@@ -179,7 +179,7 @@ def Module_eval(self):
     for instr in self.main:
         instr.eval()
 
-    for obj in self.context:
+    for obj in self.context.verifiedChildren():
         obj.eval()
 
     return self
@@ -246,7 +246,7 @@ def Method_evalContext(self):
 
 @patch
 def Method_evalCall(self, values):
-    call = lekvar.FunctionType([value.resolveType() for value in values])
+    call = lekvar.FunctionType.canonical([value.resolveType() for value in values])
     call.verify()
     function = self.resolveCall(call)
 
@@ -272,7 +272,7 @@ def MethodInstance_eval(self):
 def MethodInstance_evalCall(self, values):
     method = State.self
 
-    call = lekvar.FunctionType([value.resolveType() for value in values])
+    call = lekvar.FunctionType.canonical([value.resolveType() for value in values])
     function = method.resolveCall(call)
 
     return function.evalCall(values)
@@ -401,7 +401,7 @@ def Constructor_evalCall(self, values):
 
 @patch
 def ForwardTarget_eval(self):
-    with self.target():
+    with self.instantiate():
         result = self.value.eval()
 
     if result is self.value:
@@ -414,7 +414,7 @@ def ForwardTarget_evalContext(self):
 
 @patch
 def ForwardTarget_evalCall(self, values):
-    with self.target():
+    with self.instantiate():
         return self.value.evalCall(values)
 
 @patch
@@ -423,7 +423,7 @@ def ForwardTarget_evalAssign(self, value):
 
 @patch
 def ForwardTarget_evalNewValue(self):
-    with self.target():
+    with self.instantiate():
         return self.value.evalNewValue()
 
 #
@@ -478,7 +478,7 @@ def Call_eval(self):
     # Hack, for now
     scope = ExitStack()
     if isinstance(self.function, lekvar.ForwardTarget):
-        scope = self.function.target()
+        scope = self.function.instantiate()
 
     with scope:
         argument_types = self.function.resolveType().extractValue().arguments
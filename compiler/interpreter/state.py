@@ -1,6 +1,9 @@
 from contextlib import contextmanager
 
-class State:
+from ..session import SessionState
+
+# The global state for the interpreter, kept per compilation session
+class State(metaclass=SessionState):
     self = None
     stdout = None
 
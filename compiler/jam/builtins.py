@@ -15,6 +15,7 @@ builtin_cache = None
 # Builtins uses the pickling module
 # to avoid parsing the builtin file more than once
 def builtins(logger = logging.getLogger()):
+    global builtin_cache
     if builtin_cache is not None:
         return pickle.loads(builtin_cache)
 
@@ -49,7 +50,6 @@ def builtins(logger = logging.getLogger()):
         sizeof = lekvar.SizeOf("sizeOf", lekvar.VoidType(), lekvar.Identifier("Int"))
         ir.context.addChild(sizeof)
 
-    global builtin_cache
     builtin_cache = pickle.dumps(ir)
 
     return ir
@@ -48,6 +48,7 @@ class Import(lekvar.Link, lekvar.BoundObject):
             while index < len(self.path):
                 path = os.path.join(path, self.path[index])
                 index += 1
+                lekvar.State.dependencies.append(os.path.abspath(path + ".jm"))
                 if os.path.isfile(path + ".jm"):
                     with open(path + ".jm", "r") as f:
                         self.parseSource(f)
@@ -81,7 +82,8 @@ class Import(lekvar.Link, lekvar.BoundObject):
             self.value = parser.parseFile(file, lekvar.State.logger)
             lekvar.State.sources = tuple(list(lekvar.State.sources) + [(file, module)])
             # Must verify the module here, or imports in said module may use a closed file (self.source)
-            self.value.verify()
+            with lekvar.State.verifyingAll():
+                self.value.verify()
 
         lekvar.State.sources = previous_sources
 
@@ -1,8 +1,10 @@
 from enum import Enum
 import string
 from io import IOBase
+from array import array
 
 from ..errors import *
+from .source import SourceBuffer
 
 #
 # Constants
@@ -27,14 +29,6 @@ class Node:
                 out.append(target)
         return out
 
-    def getToken(self, start, stop, value):
-        if self.verify is not None:
-            value = self.verify(value)
-
-        assert self.token_type is not None
-
-        return Token(self.token_type, start, stop, value)
-
     def __repr__(self):
         return "Node(token:{})".format(self.token_type, self.links)
 
@@ -119,6 +113,12 @@ node.links.append((node, lambda c: c != NEWLINE_CHAR))
 node.links.append((newline_node, lambda c: c == NEWLINE_CHAR or c is None))
 
 # Strings
+
+# Remove the surrounding quotes of a string token.
+# Named, so that tokens using it can be pickled
+def stripQuotes(value):
+    return value[1:-1]
+
 FORMAT_STRING_CHAR = "\""
 FORMAT_STRING_ESCAPE_CHAR = "\\"
 
@@ -130,7 +130,7 @@ escape = Node()
 node.links.append((escape, lambda c: c == FORMAT_STRING_ESCAPE_CHAR))
 escape.links.append((node, lambda c: True))
 
-end_node = Node(token_type=Tokens.format_string, verify=lambda s: s[1:-1])
+end_node = Node(token_type=Tokens.format_string, verify=stripQuotes)
 node.links.append((end_node, lambda c: c == FORMAT_STRING_CHAR))
 
 # WYSIWYG Strings
@@ -139,7 +139,7 @@ WYSIWYG_STRING_CHAR = "`"
 node = Node()
 TREE.links.append((node, lambda c: c == WYSIWYG_STRING_CHAR))
 node.links.append((node, lambda c: c != WYSIWYG_STRING_CHAR))
-end_node = Node(token_type=Tokens.string, verify=lambda s: s[1:-1])
+end_node = Node(token_type=Tokens.string, verify=stripQuotes)
 node.links.append((end_node, lambda c: c == WYSIWYG_STRING_CHAR))
 
 # Direct maps
@@ -230,35 +230,192 @@ node.links.append((end_node, lambda c: c in DIGIT_CHARACTERS))
 end_node.links.append((underscore_node, lambda c: c == "_"))
 end_node.links.append((end_node, lambda c: c in DIGIT_CHARACTERS))
 
+#
+# DFA
+#
+# The tree above is a non-deterministic automaton. Rather than walking every
+# active node for every character, it is determinized once on import into a
+# dense transition table indexed by state and character class.
+
+# All link conditions only ever test against ascii characters, so any other
+# character behaves the same as this one
+OTHER_CHARACTER = "\u0080"
+# The lexer reads an empty string at the end of the input
+EOF_CHARACTER = ""
+
+DEAD_STATE = -1
+START_STATE = 0
+
+def _gatherNodes(root:Node):
+    nodes = [root]
+    index = 0
+    while index < len(nodes):
+        for target, condition in nodes[index].links:
+            if target not in nodes:
+                nodes.append(target)
+        index += 1
+    return nodes
+
+# Group characters into classes of characters for which all link conditions
+# evaluate the same. Returns a mapping of character to class and a
+# representative character for each class
+def _characterClasses(nodes:[Node]):
+    conditions = [condition for node in nodes for target, condition in node.links]
+    characters = [EOF_CHARACTER, OTHER_CHARACTER] + [chr(i) for i in range(128)]
+
+    classes = {}
+    signatures = {}
+    representatives = []
+    for char in characters:
+        signature = tuple(bool(condition(char)) for condition in conditions)
+        if signature not in signatures:
+            signatures[signature] = len(representatives)
+            representatives.append(char)
+        classes[char] = signatures[signature]
+    return classes, representatives
+
+# Subset construction. Each state is an ordered tuple of nodes, order
+# determining which token type takes precedence.
+def _determinize(root:Node, representatives:[str]):
+    states = [(root,)]
+    state_indices = {states[0]: START_STATE}
+    transitions = []
+
+    index = 0
+    while index < len(states):
+        for char in representatives:
+            next_nodes = []
+            for node in states[index]:
+                for target in node.evaluate(char):
+                    if target not in next_nodes:
+                        next_nodes.append(target)
+
+            if len(next_nodes) == 0:
+                transitions.append(DEAD_STATE)
+                continue
+
+            next_state = tuple(next_nodes)
+            if next_state not in state_indices:
+                state_indices[next_state] = len(states)
+                states.append(next_state)
+            transitions.append(state_indices[next_state])
+        index += 1
+
+    # The node producing the token for each state
+    accepting = []
+    for state in states:
+        accepting.append(next((node for node in state if node.token_type is not None), None))
+
+    return transitions, accepting
+
+_nodes = _gatherNodes(TREE)
+CHARACTER_CLASSES, _representatives = _characterClasses(_nodes)
+OTHER_CLASS = CHARACTER_CLASSES[OTHER_CHARACTER]
+CLASS_COUNT = len(_representatives)
+# Flat table of the next state, indexed by state * CLASS_COUNT + class
+TRANSITIONS, ACCEPTING = _determinize(TREE, _representatives)
+
+# Functions transforming the raw data of a token, by token type
+VERIFIERS = {node.token_type: node.verify for node in _nodes if node.verify is not None}
+
 #
 # Lexer
 #
 
+# Token types by their code in a TokenStore. 0 is used for untyped tokens
+TOKEN_TYPES = [None] + list(Tokens)
+
+# Compact storage for all the tokens lexed from a single source.
+# Token types and offsets are kept in parallel arrays, rather than as objects.
+class TokenStore:
+    buffer = None
+    types = None
+    starts = None
+    ends = None
+
+    def __init__(self, buffer:SourceBuffer):
+        self.buffer = buffer
+        self.types = array("i")
+        self.starts = array("i")
+        self.ends = array("i")
+
+    # Add a token, returning a handle to it
+    def append(self, type:Tokens, start:int, end:int):
+        self.types.append(0 if type is None else type.value)
+        self.starts.append(start)
+        self.ends.append(end)
+        return Token(self, len(self.types) - 1)
+
+    def __getitem__(self, index:int):
+        return Token(self, index)
+
+    def __len__(self):
+        return len(self.types)
+
+# A lightweight handle to a token in a TokenStore.
+# The token's data is sliced out of the source buffer when accessed.
 class Token:
-    def __init__(self, type:Tokens, start:int, end:int, data:str = None):
-        self.type = type
-        self.start = start
-        self.end = end
-        self.data = data
+    __slots__ = ("store", "index")
+
+    def __init__(self, store:TokenStore, index:int):
+        self.store = store
+        self.index = index
+
+    @property
+    def type(self):
+        return TOKEN_TYPES[self.store.types[self.index]]
+
+    @property
+    def start(self):
+        return self.store.starts[self.index]
+
+    @property
+    def end(self):
+        return self.store.ends[self.index]
+
+    @property
+    def data(self):
+        data = self.store.buffer.slice(self.start, self.end)
+
+        verify = VERIFIERS.get(self.type)
+        if verify is not None:
+            data = verify(data)
+        return data
 
     def __repr__(self):
-        if self.data is None:
+        if self.type is None:
             return str(self.type)
         return "{}({})".format(self.type, self.data)
 
 class Lexer:
     source = None
+    buffer = None
+    store = None
     current = None
     position = 0
+    # The chunk of the buffer being lexed, and its offset
+    chunk = ""
+    chunk_start = 0
 
     def __init__(self, source:IOBase):
         self.source = source
+        self.buffer = SourceBuffer(source)
+        self.store = TokenStore(self.buffer)
         self.next()
 
     # Read the next character into current
     def next(self):
-        self.current = self.source.read(1)
-        self.position += 1
+        position = self.position
+        self.position = position + 1
+
+        offset = position - self.chunk_start
+        if offset < len(self.chunk):
+            self.current = self.chunk[offset]
+        elif position < len(self.buffer) or self.buffer.fill():
+            self.chunk_start, self.chunk = self.buffer.chunkAt(position)
+            self.current = self.chunk[position - self.chunk_start]
+        else:
+            self.current = ""
 
     #
     # Lexing Methods
@@ -267,38 +424,32 @@ class Lexer:
     # Lex a single token
     def lex(self):
         token_start = self.position - 1
-        token_data = ""
-        current_nodes = [TREE]
+        state = START_STATE
 
         while True:
-            next_nodes = []
-
-            for node in current_nodes:
-                next_nodes += node.evaluate(self.current)
+            character_class = CHARACTER_CLASSES.get(self.current, OTHER_CLASS)
+            next_state = TRANSITIONS[state * CLASS_COUNT + character_class]
 
-            if len(next_nodes) == 0:
-                if len(current_nodes) > 0:
-                    return self.outputNode(current_nodes, token_start, token_data)
-                raise InternalError("Zero current nodes in lex tree.")
+            if next_state == DEAD_STATE:
+                return self.outputState(state, token_start)
 
-            elif len(next_nodes) == 1 and next_nodes[0] is TREE:
+            elif next_state == START_STATE:
                 # Restart
                 token_start = self.position
-                token_data = ""
-                current_nodes = [TREE]
-            else:
-                token_data += self.current
 
             if not self.current:
                 return None
             self.next()
 
-            current_nodes = next_nodes
+            state = next_state
 
-    def outputNode(self, nodes, start, data):
-        for node in nodes:
-            if node.token_type is not None:
-                return node.getToken(start, self.position - 1, data)
-            elif node is TREE and not self.current:
-                return None
-        raise SyntaxError(message="Unexpected character").add(content=self.current, tokens=[Token(None, self.position - 1, self.position)], source=self.source)
+    def outputState(self, state, start):
+        node = ACCEPTING[state]
+        if node is not None:
+            return self.store.append(node.token_type, start, self.position - 1)
+        elif state == START_STATE and not self.current:
+            return None
+        self.unexpectedCharacter()
+
+    def unexpectedCharacter(self):
+        raise SyntaxError(message="Unexpected character").add(content=self.current, tokens=[self.store.append(None, self.position - 1, self.position)], source=self.source)
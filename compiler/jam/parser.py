@@ -1,9 +1,12 @@
+import io
+import pickle
 import logging
 from io import IOBase
 from copy import copy
 
 from .. errors import *
 from .. import lekvar
+from .. import cache
 
 from .lexer import Lexer, Tokens
 from . import pragma
@@ -15,7 +18,18 @@ from . import pragma
 def parseFile(source:IOBase, logger=logging.getLogger()):
     with lekvar.State.ioSource(source):
         try:
-            module = Parser(Lexer(source), logger).parseModule(False)
+            lexer = Lexer(source)
+
+            # Only sources which have been read entirely can be cached
+            key = None
+            if cache.enabled and lexer.buffer.eof:
+                key = cache.hashKey(lexer.buffer.data)
+
+            module = loadParsed(key, source) if key else None
+            if module is None:
+                module = Parser(lexer, logger).parseModule(False)
+                if key: storeParsed(key, source, module)
+
             if hasattr(source, "name"): module.name = source.name
             return module
         except CompilerError as e:
@@ -23,6 +37,47 @@ def parseFile(source:IOBase, logger=logging.getLogger()):
             e.format()
             raise e
 
+PARSE_CACHE = "parse"
+
+# Objects reference their source, which usually can't be pickled.
+# Pickle it by reference, rebinding the objects to the source being parsed.
+class SourcePickler(pickle.Pickler):
+    def __init__(self, file, source):
+        pickle.Pickler.__init__(self, file, pickle.HIGHEST_PROTOCOL)
+        self.source = source
+
+    def persistent_id(self, obj):
+        return "source" if obj is self.source else None
+
+class SourceUnpickler(pickle.Unpickler):
+    def __init__(self, file, source):
+        pickle.Unpickler.__init__(self, file)
+        self.source = source
+
+    def persistent_load(self, id):
+        assert id == "source"
+        return self.source
+
+# Load a parsed module from the cache, None if it isn't cached
+def loadParsed(key:str, source:IOBase):
+    data = cache.read(PARSE_CACHE, key)
+    if data is None: return None
+
+    try:
+        return SourceUnpickler(io.BytesIO(data), source).load()
+    except Exception:
+        # Treat broken entries as missing, they are overwritten on store
+        return None
+
+def storeParsed(key:str, source:IOBase, module:lekvar.Module):
+    data = io.BytesIO()
+    try:
+        SourcePickler(data, source).dump(module)
+    except Exception:
+        # Not every module can be pickled, eg. overly deep ones
+        return
+    cache.write(PARSE_CACHE, key, data.getvalue())
+
 def anonymousFn(args, value, tokens):
     instruction = lekvar.Return(value, tokens)
     return lekvar.Lambda("", args, [instruction], tokens = tokens)
@@ -44,6 +99,11 @@ BINARY_OPERATIONS = [
 
 BINARY_OPERATION_TOKENS = { type for operation in BINARY_OPERATIONS for type in operation }
 
+# Precedence of each binary operation token, higher binding tighter
+BINARY_PRECEDENCES = { type: index + 1 for index, operation in enumerate(BINARY_OPERATIONS) for type in operation }
+ASSIGN_BINARY_PRECEDENCES = dict(BINARY_PRECEDENCES)
+ASSIGN_BINARY_PRECEDENCES[Tokens.assign] = 0
+
 BINARY_OPERATION_FUNCTIONS = {
     Tokens.logical_and: "&&",
     Tokens.logical_or: "||",
@@ -173,7 +233,9 @@ class Parser:
             if self.parseInstructionOrChild(instructions, children) is None:
                 break
 
-        return lekvar.Module(module_name, list(children.values()), instructions, tokens)
+        # Modules run their main instructions, so are always verified
+        roots = [name for name, child in children.items() if isinstance(child, (lekvar.Module, lekvar.Import))]
+        return lekvar.Module(module_name, list(children.values()), instructions, tokens, roots)
 
     def parseLine(self):
         # Parse a line. The line may not exist
@@ -199,81 +261,52 @@ class Parser:
         return value
 
     def parseValue(self, allow_assign = False):
-        values = [self.parseUnaryOperation()]
-        operations = []
+        precedences = ASSIGN_BINARY_PRECEDENCES if allow_assign else BINARY_PRECEDENCES
 
-        binary_operation_tokens = BINARY_OPERATION_TOKENS
-        if allow_assign:
-            binary_operation_tokens = {Tokens.assign} | binary_operation_tokens
+        return self.parseBinaryOperation(self.parseUnaryOperation(), precedences)
 
+    # Precedence climbing. Parses binary operations with at least the given
+    # precedence onto lhs, grouping operations of the same precedence left to right
+    def parseBinaryOperation(self, lhs, precedences, min_precedence = 0):
         while True:
             token = self.lookAhead()
+            if token is None or token.type not in precedences:
+                break
 
-            if token and token.type in binary_operation_tokens:
-                operations.append(self.next())
-                values.append(self.parseUnaryOperation())
-            else:
+            precedence = precedences[token.type]
+            if precedence < min_precedence:
                 break
+            operation = self.next()
 
-        return self.parseBinaryOperation(values, operations, allow_assign = allow_assign)
-
-    def parseBinaryOperation(self, values, operations, operation_index = 0, allow_assign = False):
-        if len(values) == 1:
-            return values[0]
-
-        binary_operations = BINARY_OPERATIONS
-        if allow_assign:
-            binary_operations = [{Tokens.assign}] + binary_operations
-
-        if operation_index == len(binary_operations):
-            raise InternalError("Unparsed operation {}".format(values))
-
-        # Accumulate values from higher order operations
-        # Separated by current order operations
-        operation_values = []
-        operation_operations = []
-
-        previous_index = 0
-        for index, operation in enumerate(operations):
-            if operation.type in binary_operations[operation_index]:
-                operation_operations.append(operation)
-
-                operation_values.append(self.parseBinaryOperation(
-                    values[previous_index:index + 1],
-                    operations[previous_index:index],
-                    operation_index + 1,
-                    allow_assign,
-                ))
-                previous_index = index + 1
-        operation_values.append(self.parseBinaryOperation(
-            values[previous_index:],
-            operations[previous_index:],
-            operation_index + 1,
-            allow_assign,
-        ))
-
-        # Accumulate operations (left to right)
-        lhs = operation_values[0]
-        for index, operation in enumerate(operation_operations):
-            rhs = operation_values[index + 1]
-
-            # Specialcases
-            if operation.type == Tokens.assign:
-                lhs = lekvar.Assignment(lhs, rhs, [operation])
-                continue
-            elif operation.type == Tokens.function:
-                raise InternalError("Not Implemented")
-                #TODO: Lambdas
-                lhs = anonymousFn(lhs, rhs, [operation])
+            rhs = self.parseUnaryOperation()
 
-            # Some operations are attributes of the lhs, others are global functions
-            if operation.type in BINARY_OPERATION_FUNCTIONS:
-                lhs = lekvar.Operation(lekvar.Identifier(BINARY_OPERATION_FUNCTIONS[operation.type]), [lhs, rhs], None, [operation])
-            else:
-                lhs = lekvar.Operation(lekvar.Attribute(lhs, operation.data), [rhs], None, [operation])
+            # Let tighter binding operations take the rhs
+            while True:
+                token = self.lookAhead()
+                if token is None or token.type not in precedences:
+                    break
+                if precedences[token.type] <= precedence:
+                    break
+                rhs = self.parseBinaryOperation(rhs, precedences, precedence + 1)
+
+            lhs = self.makeBinaryOperation(lhs, operation, rhs)
 
         return lhs
 
+    def makeBinaryOperation(self, lhs, operation, rhs):
+        # Specialcases
+        if operation.type == Tokens.assign:
+            return lekvar.Assignment(lhs, rhs, [operation])
+        elif operation.type == Tokens.function:
+            raise InternalError("Not Implemented")
+            #TODO: Lambdas
+            return anonymousFn(lhs, rhs, [operation])
+
+        # Some operations are attributes of the lhs, others are global functions
+        if operation.type in BINARY_OPERATION_FUNCTIONS:
+            return lekvar.Operation(lekvar.Identifier(BINARY_OPERATION_FUNCTIONS[operation.type]), [lhs, rhs], None, [operation])
+        return lekvar.Operation(lekvar.Attribute(lhs, operation.data), [rhs], None, [operation])
+
     def parseUnaryOperation(self):
         # Collect prefix unary operations
         operations = []
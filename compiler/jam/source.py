@@ -0,0 +1,124 @@
+import os
+import io
+import stat
+import mmap
+from bisect import bisect_right
+
+# In-memory buffer of a source, which the lexer walks by index.
+#
+# Regular files are memory mapped and decoded in one go. Other io streams are
+# read whole in a single call, or a line at a time when interactive. Anything
+# else only needs a read(n) method, returning an empty string or None on EOF.
+#
+# Each read is kept as a chunk of its own, along with the offset it starts at,
+# rather than being appended to the rest. Readers may return a character at a
+# time, which would make appending quadratic.
+class SourceBuffer:
+    source = None
+    chunks = None
+    starts = None
+    length = 0
+    eof = False
+
+    def __init__(self, source):
+        self.source = source
+        self.chunks = []
+        self.starts = []
+
+        if not isinstance(source, io.IOBase):
+            # Unknown readers, such as the interactive prompt, may block
+            # waiting for input. Only ask for what is needed.
+            self._read = lambda: source.read(1)
+        elif source.isatty():
+            self._read = source.readline
+        else:
+            data = self._mapFile(source)
+            self._append(source.read() if data is None else data)
+            self.eof = True
+
+    # Read the entirety of a regular file through a memory map.
+    # Returns None if the source is not a regular file.
+    def _mapFile(self, source):
+        if not isinstance(source, io.TextIOWrapper):
+            return None
+
+        try:
+            fileno = source.fileno()
+            if not stat.S_ISREG(os.fstat(fileno).st_mode) or source.tell() != 0:
+                return None
+        except (OSError, io.UnsupportedOperation):
+            return None
+
+        if os.fstat(fileno).st_size == 0:
+            return ""
+
+        with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as mapped:
+            data = str(mapped, source.encoding, source.errors)
+
+        # Match the universal newline translation of text files
+        if "\r" in data:
+            data = data.replace("\r\n", "\n").replace("\r", "\n")
+        return data
+
+    # Read more of the source into the buffer.
+    # Returns whether or not anything was read.
+    def fill(self):
+        if self.eof:
+            return False
+
+        data = self._read()
+        if not data:
+            self.eof = True
+            return False
+
+        self._append(data)
+        return True
+
+    def _append(self, data:str):
+        if data:
+            self.chunks.append(data)
+            self.starts.append(self.length)
+            self.length += len(data)
+
+    def __len__(self):
+        return self.length
+
+    # The offset and contents of the chunk holding a position within the
+    # buffer, for walking it chunk by chunk
+    def chunkAt(self, position:int):
+        index = bisect_right(self.starts, position) - 1
+        return self.starts[index], self.chunks[index]
+
+    # Slice the read data, which may span chunks
+    def slice(self, start:int, end:int):
+        index = bisect_right(self.starts, start) - 1
+        if index < 0:
+            return ""
+
+        offset = self.starts[index]
+        chunk = self.chunks[index]
+        if end - offset <= len(chunk):
+            return chunk[start - offset:end - offset]
+
+        parts = []
+        while start < end and index < len(self.chunks):
+            offset = self.starts[index]
+            part = self.chunks[index][start - offset:end - offset]
+            parts.append(part)
+            start += len(part)
+            index += 1
+        return "".join(parts)
+
+    # All of the read data. The chunks are joined into one when accessed
+    @property
+    def data(self):
+        if len(self.chunks) > 1:
+            self.chunks = ["".join(self.chunks)]
+            self.starts = [0]
+        return self.chunks[0] if self.chunks else ""
+
+    # Only the read data is kept when pickled, sources usually can't be
+    def __getstate__(self):
+        data = self.data
+        return {"chunks": [data] if data else [], "starts": [0] if data else [],
+                "length": self.length, "eof": True}
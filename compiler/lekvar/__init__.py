@@ -25,6 +25,7 @@ from .size_of import SizeOf
 from . import stats
 from . import util
 from . import forward
+from . import snapshot
 
 def _verify(source, frontend, logger = logging.getLogger()):
     logger.info("Parsing")
@@ -35,23 +36,31 @@ def _verify(source, frontend, logger = logging.getLogger()):
 
     return module
 
-def compile(source, frontend, backend, logger = logging.getLogger(), opt_level = 0):
+# Any further options are passed on to the backend's emit
+def compile(source, frontend, backend, logger = logging.getLogger(), opt_level = 0, **options):
     module = _verify(source, frontend, logger)
 
     logger.info("Generating Code")
-    return backend.emit(module, logger, opt_level)
+    code = backend.emit(module, logger, opt_level, **options)
+
+    _logInstantiations()
+    return code
 
 def run(source, frontend, backend, logger = logging.getLogger(), opt_level = 0):
     module = _verify(source, frontend, logger)
 
     logger.info("Running")
-    return backend.run(module)
+    output = backend.run(module)
+
+    _logInstantiations()
+    return output
 
 def verify(module:Module, logger = logging.getLogger()):
     # Set up the initial state before verifying
     State.init(logger.getChild("lekvar"))
 
     State.logger.info(module.context)
+    stats.reset()
 
     try:
         module.verify()
@@ -59,6 +68,22 @@ def verify(module:Module, logger = logging.getLogger()):
         e.format()
         raise e
 
+    _logCacheStats("Identifier resolution", State.resolution_hits, State.resolution_misses)
+    _logCacheStats("Compatibility check", State.compatibility_hits, State.compatibility_misses)
+
+    if stats.enabled:
+        stats.report(State.logger.getChild("stats"))
+
+def _logCacheStats(name, hits, misses):
+    lookups = hits + misses
+    if lookups > 0:
+        State.logger.info("{}: {} lookups, {:.1%} cache hit rate".format(name, lookups, hits / lookups))
+
+def _logInstantiations():
+    if State.instantiation_uses > 0:
+        State.logger.info("Instantiations: {} materialized, {} uses".format(
+            State.instantiations, State.instantiation_uses))
+
 @contextmanager
 def use(frontend, backend, logger = logging.getLogger()):
     with useFrontend(frontend, logger), useBackend(backend, logger):
@@ -66,14 +91,27 @@ def use(frontend, backend, logger = logging.getLogger()):
 
 @contextmanager
 def useFrontend(frontend, logger = logging.getLogger()):
-    builtins = frontend.builtins(logger)
-    # Hack backend into frontend builtins
-    builtins.context.addChild(ForwardObject(builtins, "_builtins"))
+    # Start from a snapshot of the verified builtins, if there is one
+    key = snapshot.key(frontend)
+    builtins = snapshot.load(key)
+    fresh = builtins is None
+
+    if fresh:
+        builtins = frontend.builtins(logger)
 
     try:
         old_builtins = State.builtins
         State.builtins = builtins
-        verify(builtins)
+
+        # Objects created alongside the builtins belong to their source
+        with State.ioSource(builtins.source):
+            if fresh:
+                # Hack backend into frontend builtins
+                builtins.context.addChild(ForwardObject(builtins, "_builtins"))
+            verify(builtins)
+
+        if fresh:
+            snapshot.store(key, builtins)
 
         yield
     finally:
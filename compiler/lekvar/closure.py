@@ -2,6 +2,8 @@ from contextlib import contextmanager, ExitStack
 
 from .core import Object, Context, BoundObject, SoftScope, Scope
 from .links import Link, BoundLink, ContextLink
+from . import forward
+from . import stats
 
 class Closure(Scope):
     closed_context = None
@@ -11,7 +13,7 @@ class Closure(Scope):
 
         self.closed_context = Context(self, [])
 
-    def resolveIdentifier(self, name:str, exclude = []):
+    def _resolveIdentifier(self, name:str, exclude = []):
         found = BoundObject.resolveIdentifier(self, name, exclude)
 
         # Collect externally identifier, non-statics in the closed context
@@ -25,9 +27,13 @@ class Closure(Scope):
                 else:
                     found[index] = match = ClosedLink(match)
                     self.closed_context.addChild(match)
+                    if stats.enabled: stats.count("closure captures")
 
         return found + SoftScope.resolveIdentifier(self, name, exclude)
 
+    def _resolutionContexts(self):
+        return [self.local_context, self.closed_context]
+
 class ClosedLink(BoundLink):
     bound_context = None
 
@@ -46,12 +52,8 @@ class ClosedTarget(Link):
 
     @contextmanager
     def target(self):
-        stack = ExitStack()
-
-        for target, value in self.targets:
-            stack.enter_context(target.resolveValue().targetValue(value))
-
-        with stack:
+        targets = ((target.resolveValue(), value) for target, value in self.targets)
+        with forward.target(targets):
             yield
 
     def retarget(self, value:Object):
@@ -100,6 +102,9 @@ class ClosedTarget(Link):
     def resolveValue(self):
         return self
 
+    def resolveNominal(self):
+        return None
+
 class ClosedTargetContext(ContextLink):
     targeter = None
 
@@ -0,0 +1,143 @@
+from .state import State
+from .core import Type
+from .util import checkCompatibility
+
+# The constraints on the types a forward object may be targeted at. Every
+# constraint is a tuple of alternative types, exactly one of which has to be
+# compatible with the target.
+#
+# For checks, the constraints are indexed for the current targeting generation.
+# Alternatives which resolve to the same value are merged into one class, so
+# that equivalent constraints are only checked once. Single constraints are
+# then grouped by the nominal key of their class, which rules out every target
+# with a different key without checking it.
+class ConstraintStore:
+    constraints = None
+
+    _index = None
+    _generation = None
+
+    def __init__(self):
+        self.constraints = set()
+
+    # Add a constraint, returns whether or not it is new
+    def add(self, types:(Type,)):
+        if types in self.constraints:
+            return False
+
+        self.constraints.add(types)
+        self._index = None
+        return True
+
+    def __contains__(self, types:(Type,)):
+        return types in self.constraints
+
+    def __iter__(self):
+        return iter(self.constraints)
+
+    def __len__(self):
+        return len(self.constraints)
+
+    @property
+    def index(self):
+        if self._index is None or self._generation != State.targeting_generation:
+            self._index = ConstraintIndex(self.constraints)
+            self._generation = State.targeting_generation
+        return self._index
+
+    # Check whether a non-forward type satisfies every constraint.
+    # check_cache holds the types already checked, which count as matches.
+    def check(self, other:Type, cache:set, check_cache:dict):
+        return self.index.check(other, cache, check_cache)
+
+    # Rebuild the constraints, see ForwardObject.rehash
+    def rehash(self):
+        self.constraints = set(list(self.constraints))
+        self._index = None
+
+    def __getstate__(self):
+        return {"constraints": self.constraints}
+
+class ConstraintIndex:
+    # Single constraints, by nominal key, each a list of classes
+    singles = None
+    # Single constraints of types without a nominal key
+    unkeyed = None
+    # Constraints with multiple alternatives, as tuples of classes
+    switches = None
+    # Memoized results of checks with a fresh check cache
+    results = None
+
+    def __init__(self, constraints:{(Type,)}):
+        self.singles = {}
+        self.unkeyed = []
+        self.switches = []
+        self.results = {}
+
+        # The class of each resolved value, as (representative, nominal key)
+        classes = {}
+        def find(type):
+            value = type.resolveValue()
+            cls = classes.get(id(value))
+            if cls is None:
+                cls = classes[id(value)] = (type, value.resolveNominal())
+            return cls
+
+        seen = set()
+        for types in constraints:
+            alternatives = tuple(find(type) for type in types)
+            key = tuple(id(cls[0]) for cls in alternatives)
+            if key in seen: continue
+            seen.add(key)
+
+            if len(alternatives) > 1:
+                self.switches.append(alternatives)
+            elif alternatives[0][1] is None:
+                self.unkeyed.append(alternatives)
+            else:
+                self.singles.setdefault(alternatives[0][1], []).append(alternatives)
+
+    def check(self, other:Type, cache:set, check_cache:dict):
+        memoize = len(cache) == 0 and len(check_cache) == 1 and not State.type_switching
+        if memoize:
+            key = (id(other), id(State.scope))
+            entry = self.results.get(key)
+            if entry is not None and entry[0] is other and entry[1] is State.scope:
+                return entry[2]
+
+        generation = State.targeting_generation
+        result = self._check(other, cache, check_cache)
+
+        if memoize and State.targeting_generation == generation:
+            # Keep the objects alive, so that their ids are not reused
+            self.results[key] = (other, State.scope, result)
+        return result
+
+    def _check(self, other:Type, cache:set, check_cache:dict):
+        nominal = other.resolveNominal()
+
+        if nominal is None:
+            constraints = [c for group in self.singles.values() for c in group]
+        else:
+            # Any single constraint of a different key can never match
+            if len(self.singles) > (nominal in self.singles):
+                return False
+            constraints = self.singles.get(nominal, [])
+
+        for alternatives in constraints + self.unkeyed + self.switches:
+            matches = 0
+            with State.type_switch():
+                for type, key in alternatives:
+                    if nominal is not None and key is not None and key != nominal:
+                        continue
+
+                    if type in cache:
+                        matches += 1
+                    else:
+                        cache.add(type)
+                        if checkCompatibility(type, other, check_cache):
+                            matches += 1
+
+            if matches != 1:
+                return False
+        return True
@@ -4,6 +4,7 @@ from ..errors import *
 
 from .state import State
 from .stats import Stats, SoftScopeStats, ScopeStats
+from . import stats
 
 # Python predefines
 Object = None
@@ -32,15 +33,24 @@ class Context:
         for child in self:
             child.verify()
 
+    # The verified children. Objects without a verified flag are verified
+    # along with their parents.
+    def verifiedChildren(self):
+        return [child for child in self if getattr(child, "verified", True)]
+
     # Doubly link a child to the context
     def addChild(self, child):
         self.children[child.name] = child
+        State.invalidateResolution(self, child.name)
         self.fakeChild(child)
 
     # Bind the child to the context, but not the context to the child
     # Useful for setting up "parenting" for internal objects
     def fakeChild(self, child):
         assert hasattr(child, "bound_context")
+        if child.bound_context is not self:
+            # Anything resolved through the child now resolves elsewhere
+            State.invalidateResolutions(child)
         child.bound_context = self
 
     def __contains__(self, name:str):
@@ -51,6 +61,7 @@ class Context:
 
     def __setitem__(self, name:str, value:BoundObject):
         self.children[name] = value
+        State.invalidateResolution(self, name)
 
     # Iterate through the children (not their names)
     def __iter__(self):
@@ -98,6 +109,11 @@ class Object(ABC):
     def extractValue(self) -> Object:
         return self
 
+    # Resolve a key for types which are only compatible with types of an equal
+    # key. Used to index overloads, so None unless certain.
+    def resolveNominal(self):
+        return None
+
     # Resolves a call operation using this object's type.
     # May be overridden for more specific behaviour
     def resolveCall(self, call:FunctionType) -> Function:
@@ -161,9 +177,92 @@ class SoftScope(Object):
 
 # A bound object that has a local context of all of its children
 class Scope(SoftScope, BoundObject):
+    # Memoized resolutions by name, for the session they were made in
+    _resolutions = None
+    _resolution_session = None
+
+    # Resolutions are memoized until something they were resolved through
+    # changes, see State.dependOnResolution. Binding a name only invalidates
+    # the scopes which resolved it through the context it was bound in, and
+    # those that resolved it through them in turn.
     def resolveIdentifier(self, name:str, exclude = []):
+        if stats.enabled: stats.count("scopes searched")
+
+        if exclude or not self._dependOnResolution(name):
+            return self._resolveIdentifier(name, exclude)
+
+        if self._resolution_session is not State.resolution_dependents:
+            self._resolutions = {}
+            self._resolution_session = State.resolution_dependents
+
+        cached = self._resolutions.get(name)
+        if cached is not None:
+            State.resolution_hits += 1
+            return list(cached)
+
+        State.resolution_misses += 1
+        # Mark the resolution as pending. If it is invalidated while resolving,
+        # the result may be out of date, so it isn't kept.
+        self._resolutions[name] = None
+        found = self._resolveIdentifier(name, exclude)
+        if name in self._resolutions:
+            self._resolutions[name] = tuple(found)
+        return found
+
+    def _resolveIdentifier(self, name:str, exclude = []):
         return BoundObject.resolveIdentifier(self, name, exclude) + SoftScope.resolveIdentifier(self, name, exclude)
 
+    # The contexts the scope itself resolves identifiers in
+    def _resolutionContexts(self):
+        return [self.local_context]
+
+    # Register what resolving a name depends on: the scope's own contexts,
+    # and the objects up to the nearest scope it is resolved through.
+    # Returns False if it may depend on anything else, which isn't memoized.
+    def _dependOnResolution(self, name:str):
+        if State.resolution_dependents is None: return False
+
+        contexts = self._resolutionContexts()
+        parent = self.parent
+        while parent is not None and type(parent).resolveIdentifier is BoundObject.resolveIdentifier:
+            parent = parent.parent
+
+        if parent is not None and type(parent).resolveIdentifier is SoftScope.resolveIdentifier:
+            contexts.append(parent.local_context)
+        elif parent is not None and type(parent).resolveIdentifier is not Scope.resolveIdentifier:
+            return False
+
+        # Contexts which only link to others can't be tracked
+        if any(context is not None and type(context) is not Context for context in contexts):
+            return False
+
+        for context in contexts:
+            if context is not None:
+                State.dependOnResolution(context, name, self)
+
+        parent = self.parent
+        while parent is not None:
+            State.dependOnResolution(parent, name, self)
+            if isinstance(parent, SoftScope): break
+            parent = parent.parent
+        return True
+
+    # Forget memoized resolutions, of a single name or of every name
+    def invalidateResolution(self, name:str = None):
+        if self._resolutions is None: return
+
+        if name is None:
+            self._resolutions = {}
+        else:
+            self._resolutions.pop(name, None)
+
+    # Resolutions are only meaningful within a session
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_resolutions", None)
+        state.pop("_resolution_session", None)
+        return state
+
 # A type object that is used to describe certain behaviour of an object.
 class Type(Object):
     def resolveType(self):
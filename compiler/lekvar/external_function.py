@@ -24,7 +24,8 @@ class ExternalFunction(BoundObject):
         self.stats.static = True
         self.stats.forward = False
 
-        self.type.verify()
+        with State.parentScoped(self):
+            self.type.verify()
 
     def resolveType(self):
         return self.type
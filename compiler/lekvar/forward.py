@@ -1,4 +1,5 @@
-from contextlib import contextmanager, ExitStack
+from contextlib import contextmanager
+from collections import deque
 from itertools import chain
 
 from ..errors import *
@@ -6,27 +7,60 @@ from ..errors import *
 from .state import State
 from .core import Context, Object, BoundObject, Scope, Type
 from .stats import Stats
+from . import stats
 from .util import inScope, checkCompatibility
 from .links import Link
+from .constraints import ConstraintStore
 
 # Python Predefines
 ForwardObject = None
 
-# Apply targeting to a set of forward objects and their dependencies
+# Apply targeting to a set of forward objects and their dependencies, for the
+# duration of the context. All changes are undone afterwards, even on errors.
 @contextmanager
 def target(objects:[(ForwardObject, Object)], checkTypes = True):
-    with ExitStack() as stack:
-        dependencies = iter(objects)
-        while True:
-            dep = next(dependencies, 0)
-            if dep is 0: break
+    trail = []
+    state = State.targetingState()
+    State.targeting_trails.append(trail)
+    try:
+        apply(objects, trail, checkTypes)
+        yield
+    finally:
+        undo(trail)
+        State.targeting_trails.pop()
+        State.restoreTargeting(state)
+
+# Target a set of objects, through a worklist of their dependencies.
+# Dependencies are targeted in the order they are found, each object returning
+# its own dependencies once targeted. Every change is recorded on the trail as
+# a pair of the object and its previous target.
+def apply(objects:[(ForwardObject, Object)], trail:list, checkTypes = True):
+    worklist = deque([iter(objects)])
+    while len(worklist) > 0:
+        for dep in worklist[0]:
             if dep is None: continue
 
             object, target = dep
-            next_dependencies = object.targetAt(target, checkTypes)
-            dependencies = chain(dependencies, stack.enter_context(next_dependencies))
-
-        yield
+            worklist.append(iter(object.targetAt(target, trail, checkTypes)))
+        worklist.popleft()
+
+# The active trail an object was targeted on, None if it isn't targeted
+def targetingTrail(object:Object):
+    for trail in reversed(State.targeting_trails):
+        if any(targeted is object for targeted, previous_target in trail):
+            return trail
+    return None
+
+# Undo the changes recorded on a trail, in reverse order.
+# Returns the undone targets, in the order they were made.
+def undo(trail:list):
+    targets = []
+    while len(trail) > 0:
+        object, previous_target = trail.pop()
+        targets.append((object, object.swapTarget(previous_target)))
+
+    targets.reverse()
+    return targets
 
 # A forward object is a collector for behaviour
 # Initially the object is used like any other, creating dependencies
@@ -63,7 +97,7 @@ class ForwardObject(Type, BoundObject):
 
         self.resolved_calls = dict()
         self.resolved_instance_calls = dict()
-        self.compatible_types = set()
+        self.compatible_types = ConstraintStore()
         self.switches = []
 
     def __eq__(self, other):
@@ -103,9 +137,16 @@ class ForwardObject(Type, BoundObject):
             return self
         return self.target
 
-    # Targets this forward object
-    @contextmanager
-    def targetAt(self, target, checkTypes = True):
+    def resolveNominal(self):
+        if self.target is None:
+            return None
+        return self.target.resolveNominal()
+
+    # Targets this forward object, recording the change on the trail.
+    # Returns the dependencies to be targeted alongside it.
+    def targetAt(self, target, trail:list, checkTypes = True):
+        if stats.enabled: stats.count("forward targetings")
+
         if isinstance(target, ForwardObject):
             target = target.resolveValue()
 
@@ -114,15 +155,13 @@ class ForwardObject(Type, BoundObject):
         # Escape recursion
         if self.target is not None:
             if self.target is target:
-                yield []
-                return
+                return ()
 
             #TODO: There should be a safer way to handle this
 
         # Escape more recursion
         if target is self:
-            yield []
-            return
+            return ()
 
         # Local checks
         if checkTypes and not self.checkLockedCompatibility(target):
@@ -131,10 +170,10 @@ class ForwardObject(Type, BoundObject):
         # Pass on dependency checks
         def target_generator():
             if self._context is not None:
-                yield self.context, target.context
+                yield self._context, target.context
 
             if self._instance_context is not None:
-                yield self.instance_context, target.instance_context
+                yield self._instance_context, target.instance_context
 
             if self.resolved_type is not None:
                 yield self.resolved_type, target.resolveType()
@@ -153,10 +192,15 @@ class ForwardObject(Type, BoundObject):
 
                 yield self._return_type, target.return_type
 
+        trail.append((self, self.swapTarget(target)))
+        State.retarget(self, target)
+        return target_generator()
+
+    # Replace the target, returning the previous one
+    def swapTarget(self, target):
         previous_target = self.target
         self.target = target
-        yield target_generator()
-        self.target = previous_target
+        return previous_target
 
     def _targetCall(self, target, calls, resolution_function):
         for call, obj in calls.items():
@@ -185,6 +229,13 @@ class ForwardObject(Type, BoundObject):
 
         return self, target
 
+    # Rebuild the containers keyed by types. Types are hashed by value, which
+    # may be incomplete while they are unpickled, see snapshot.load
+    def rehash(self):
+        # Copying a dict directly would keep its hashes
+        self.resolved_calls = dict(list(self.resolved_calls.items()))
+        self.resolved_instance_calls = dict(list(self.resolved_instance_calls.items()))
+
     # Create and cache dependencies for standard object functionality
     @property
     def context(self):
@@ -203,10 +254,23 @@ class ForwardObject(Type, BoundObject):
         return self.resolved_type
 
     def resolveCall(self, call):
-        return self.resolved_calls.setdefault(call, ForwardObject(self.scope))
+        return self._resolveCall(call, self.resolved_calls, lambda c: c.resolveCall)
 
     def resolveInstanceCall(self, call):
-        return self.resolved_instance_calls.setdefault(call, ForwardObject(self.scope))
+        return self._resolveCall(call, self.resolved_instance_calls, lambda o: o.resolveInstanceCall)
+
+    # Objects verified on demand may make new calls while this object is
+    # already targeted. The calls are targeted right away, on the same trail,
+    # so that they follow this object when it is targeted elsewhere.
+    def _resolveCall(self, call, calls, resolution_function):
+        if call in calls:
+            return calls[call]
+
+        obj = calls[call] = ForwardObject(self.scope)
+        if self.target is not None:
+            apply(self._targetCall(self.target, {call: obj}, resolution_function),
+                  targetingTrail(self), False)
+        return obj
 
     @property
     def stats(self):
@@ -236,8 +300,9 @@ class ForwardObject(Type, BoundObject):
             self.compatible_type_switch = self.compatible_type_switch or []
             self.compatible_type_switch.append(other)
             State.type_switch_cleanups.append(self.typeSwitchCleanup)
-        else:
-            self.compatible_types.add((other,))
+        elif self.compatible_types.add((other,)):
+            # New constraints change the result of locked checks
+            State.invalidateCompatibility()
         return True
 
     def revCheckCompatibility(self, other:Type, check_cache = None):
@@ -257,24 +322,25 @@ class ForwardObject(Type, BoundObject):
             cache.add(other)
             return True
 
+        if len(self.compatible_types) == 0:
+            return True
+        if not other.stats.forward:
+            return self.compatible_types.check(other, cache, check_cache)
+
+        # Forward types gain constraints from the checks themselves, so every
+        # alternative needs checking
         for types in self.compatible_types:
-            matches = []
             with State.type_switch():
                 for type in types:
-                    if type in cache:
-                        matches.append(type)
-                    else:
+                    if type not in cache:
                         cache.add(type)
-                        if checkCompatibility(type, other, check_cache):
-                            matches.append(type)
-
-            if not other.stats.forward and len(matches) != 1:
-                return False
+                        checkCompatibility(type, other, check_cache)
         return True
 
     def typeSwitchCleanup(self):
         if self.compatible_type_switch is None: return
         self.compatible_types.add(tuple(self.compatible_type_switch))
+        State.invalidateCompatibility()
         self.compatible_type_switch = None
 
     def __repr__(self):
@@ -283,18 +349,84 @@ class ForwardObject(Type, BoundObject):
 class ForwardTarget(Link):
     dependencies = None
 
+    instantiations = None
+
     def __init__(self, value:Object, dependencies:[(ForwardObject, Object)], tokens = None):
         Link.__init__(self, value, tokens)
         self.dependencies = dependencies
+        self.instantiations = {}
+
+    # Instantiations are by targeting generation, which are only meaningful
+    # within a session
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["instantiations"] = {}
+        return state
 
     @contextmanager
     def target(self):
         with target(self.dependencies):
             yield
 
+    # Apply the instantiation of this target in the current targeting.
+    # Only for use after verification, when dependencies no longer change.
+    @contextmanager
+    def instantiate(self):
+        with self.instantiation.target():
+            # Instantiating again from within changes nothing
+            self.instantiations.setdefault(State.targeting_generation, Instantiation([]))
+            yield
+
+    # The materialized instantiation of this target in the current targeting
+    @property
+    def instantiation(self):
+        generation = State.targeting_generation
+        instantiation = self.instantiations.get(generation)
+
+        if instantiation is None:
+            trail = []
+            state = State.targetingState()
+            State.targeting_trails.append(trail)
+            try:
+                apply(self.dependencies, trail)
+            finally:
+                targets = undo(trail)
+                State.targeting_trails.pop()
+                State.restoreTargeting(state)
+
+            instantiation = self.instantiations[generation] = Instantiation(targets)
+            State.instantiations += 1
+
+        State.instantiation_uses += 1
+        return instantiation
+
     def __repr__(self):
         return "FT({}, {})".format(self.value, self.dependencies)
 
+# A materialized instantiation of a forward target. This is the complete set of
+# targets its dependencies resolved to, which are applied directly without
+# resolving dependencies or checking types again.
+class Instantiation:
+    targets = None
+
+    def __init__(self, targets:[(Object, Object)]):
+        self.targets = targets
+
+    @contextmanager
+    def target(self):
+        trail = []
+        state = State.targetingState()
+        State.targeting_trails.append(trail)
+        try:
+            for object, target in self.targets:
+                trail.append((object, object.swapTarget(target)))
+                State.retarget(object, target)
+            yield
+        finally:
+            undo(trail)
+            State.targeting_trails.pop()
+            State.restoreTargeting(state)
+
 # The forward context compliments the forward object with the creation
 # of dependencies for contexts.
 class ForwardContext(Context):
@@ -302,14 +434,34 @@ class ForwardContext(Context):
         Context.__init__(self, scope, [])
 
     def __contains__(self, name:str):
+        if self.scope.target is not None:
+            return name in self.children or name in self._targetContext()
         if self.locked: return Context.__contains__(self, name)
         return True
 
     def __getitem__(self, name:str):
-        if not self.locked and name not in self.children:
-            self.addChild(ForwardObject(self.scope.scope, name))
+        if name not in self.children:
+            if self.scope.target is not None:
+                self._addTargetedChild(name)
+            elif not self.locked:
+                self.addChild(ForwardObject(self.scope.scope, name))
         return self.children[name]
 
+    # The context this context is targeted at, through its forward object
+    def _targetContext(self):
+        if self is self.scope._instance_context:
+            return self.scope.target.instance_context
+        return self.scope.target.context
+
+    # Like calls, see ForwardObject._resolveCall, attributes resolved while the
+    # forward object is targeted are targeted right away
+    def _addTargetedChild(self, name:str):
+        target = self._targetContext()[name]
+
+        child = ForwardObject(self.scope.scope, name)
+        self.addChild(child)
+        apply([(child, target)], targetingTrail(self.scope), False)
+
     def __setitem__(self, name:str, value:BoundObject):
         raise InternalError("Not Implemented.")
 
@@ -317,8 +469,8 @@ class ForwardContext(Context):
     def locked(self):
         return self.scope.locked
 
-    @contextmanager
-    def targetAt(self, target, checkTypes = True):
+    # Targets the children of this context, the context itself is never changed
+    def targetAt(self, target, trail:list, checkTypes = True):
         def target_generator():
             if isinstance(target, ForwardContext) and self.scope.scope is target.scope.scope:
                 target.scope._instance_context = self
@@ -330,4 +482,4 @@ class ForwardContext(Context):
                     raise (DependencyError(message="Forward target context does not have attribute")
                            .add(content=name).add(message="", object=target.scope))
                 yield self[name], target[name]
-        yield target_generator()
+        return target_generator()
@@ -3,11 +3,13 @@ from ..errors import *
 from .util import *
 from .state import State
 from .stats import Stats, ScopeStats
+from . import stats
 from .core import Context, Object, BoundObject, SoftScope, Scope, Type
 from .util import checkCompatibility
 from .links import BoundLink
 from .closure import Closure
 from .variable import Variable
+from .identifier import Identifier
 from .forward import ForwardObject, ForwardTarget
 
 # Python Predefines
@@ -46,12 +48,18 @@ class Function(Closure):
         if self.verified: return
         self.verified = True
 
+        # Functions verified on demand may be resolved before their parents
+        if self.parent is not None:
+            self.parent.verify()
+
         self._stats = ScopeStats(self.parent)
         self.stats.static_transitive = False
 
-        self.unscopedVerify()
-        with State.scoped(self):
-            self.scopedVerify()
+        with stats.verifying(self):
+            with State.parentScoped(self):
+                self.unscopedVerify()
+            with State.scoped(self):
+                self.scopedVerify()
 
     def unscopedVerify(self):
         # Arguments are considered to be already assigned
@@ -105,13 +113,39 @@ class FunctionType(Type):
     return_type = None
 
     verified = False
+    _stats_generation = None
 
     def __init__(self, arguments:[Type], return_type:Type = None, tokens = None):
         Type.__init__(self, tokens)
         self.arguments = arguments
         self.return_type = return_type
 
+    # Get the canonical function type for the given argument and return types,
+    # by identity. Canonical types are shared, so they must not be modified.
+    # Use for the types of calls, rather than of functions.
+    @classmethod
+    def canonical(cls, arguments:[Type], return_type:Type = None):
+        if State.function_types is None:
+            return cls(arguments, return_type)
+
+        key = (tuple(id(cls._canonicalArgument(arg)) for arg in arguments), id(return_type))
+        type = State.function_types.get(key)
+
+        # Canonical types keep their argument types alive, so ids are not reused
+        if type is None:
+            type = State.function_types[key] = cls(arguments, return_type)
+        return type
+
+    # Identifiers of the same value are interchangeable, such as the types of
+    # literals, which have an identifier each
+    @staticmethod
+    def _canonicalArgument(argument:Type):
+        if type(argument) is Identifier and argument.value is not None:
+            return argument.value
+        return argument
+
     def __eq__(self, other):
+        if self is other: return True
         return self.checkCompatibility(other)
 
     def __hash__(self):
@@ -127,9 +161,6 @@ class FunctionType(Type):
         for arg in self.arguments:
             arg.verify()
 
-            if arg.stats.forward:
-                self.stats.forward = True
-
             if not isinstance(arg.resolveValue(), Type):
                 raise TypeError(object=arg).add(message="cannot be used as a type for").add(object=self)
 
@@ -139,6 +170,16 @@ class FunctionType(Type):
             if not isinstance(self.return_type.resolveValue(), Type):
                 raise TypeError(object=self.return_type).add(message="is not a valid return type")
 
+    # Arguments may be forward depending on their targeting, which may differ
+    # between uses of canonical types
+    @property
+    def stats(self):
+        type_stats = Type.stats.fget(self)
+        if self._stats_generation != State.targeting_generation:
+            self._stats_generation = State.targeting_generation
+            type_stats.forward = any(arg.stats.forward for arg in self.arguments)
+        return type_stats
+
     def resolveType(self):
         raise InternalError("Not Implemented")
 
@@ -217,6 +258,10 @@ class Return(Object):
                 except TypeError:
                     return_type = None
                 self.function.type.return_type = return_type
+
+                # Checks against the function's type may have been memoized
+                if return_type is not None:
+                    State.invalidateCompatibility()
         # Check function types
             elif not checkCompatibility(self.value.resolveType(), self.function.type.return_type):
                 raise TypeError(object=self).add(message="return type is not compatible with").add(object=self.function.type.return_type)
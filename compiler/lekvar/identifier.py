@@ -1,6 +1,7 @@
 from ..errors import *
 
 from .state import State
+from . import stats
 from .links import BoundLink
 from .variable import Variable
 from .assignment import InferVariable
@@ -13,11 +14,16 @@ class Identifier(BoundLink):
         self.name = name
 
     def _resolveIdentifier(self):
+        if stats.enabled: stats.count("identifier lookups")
+
+        # Scopes memoize their resolutions, so these lookups are usually cheap
+        found = State.scope.resolveIdentifier(self.name)
+        if State.builtins is not None:
+            found += State.builtins.resolveIdentifier(self.name)
+
         # Use sets to ignore duplicate entries
         #TODO: Fix duplicate entries
-        found = set(State.scope.resolveIdentifier(self.name))
-        if State.builtins is not None:
-            found |= set(State.builtins.resolveIdentifier(self.name))
+        found = set(found)
 
         if len(found) > 1:
             err = AmbiguityError(message="Ambiguous reference to").add(content=self.name, object=self).addNote(message="Matches:")
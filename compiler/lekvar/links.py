@@ -41,6 +41,11 @@ class Link(Type):
     def resolveValue(self):
         return self.value.resolveValue()
 
+    def resolveNominal(self):
+        if self.value is None:
+            return None
+        return self.value.resolveNominal()
+
     def extractValue(self):
         return self.value.extractValue()
 
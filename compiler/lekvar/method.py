@@ -2,6 +2,7 @@ from ..errors import *
 
 from .state import State
 from .stats import Stats, ScopeStats
+from . import stats
 from .core import Context, Object, BoundObject, SoftScope, Scope, Type
 from .util import checkCompatibility
 from .function import Function, FunctionType
@@ -10,10 +11,66 @@ from .forward import ForwardObject, ForwardTarget
 # Python Predefines
 Method = None
 
+# Index of overloads by their arity and the concrete type of their first
+# argument, narrowing down the overloads that may be compatible with a call
+# without checking compatibility. Overloads keep their order.
+# Concrete types depend on targeting, so an index is only valid for the
+# targeting generation it was built in.
+class OverloadIndex:
+    generation = None
+
+    def __init__(self, overloads:[(Object, Type)]):
+        self.generation = State.targeting_generation
+
+        # Entries of overload, arity and concrete argument types
+        # Overloads with types other than function types are always candidates
+        self.entries = []
+        for overload, type in overloads:
+            if isinstance(type, FunctionType):
+                nominals = tuple(arg.resolveNominal() for arg in type.arguments)
+                self.entries.append((overload, len(nominals), nominals))
+            else:
+                self.entries.append((overload, None, None))
+
+        self.buckets = {}
+
+    # Overloads possibly compatible with a call, in order
+    def candidates(self, call:FunctionType) -> [Object]:
+        nominals = [arg.resolveNominal() for arg in call.arguments]
+        bucket = self._bucket(len(nominals), nominals[0] if nominals else None)
+
+        if len(nominals) < 2:
+            return [overload for overload, overload_nominals in bucket]
+
+        return [overload for overload, overload_nominals in bucket
+                if overload_nominals is None or all(
+                    nominal is None or overload_nominal is None or nominal == overload_nominal
+                    for nominal, overload_nominal in zip(nominals[1:], overload_nominals[1:]))]
+
+    def _bucket(self, arity:int, first:Type):
+        key = (arity, first)
+        bucket = self.buckets.get(key)
+
+        if bucket is None:
+            bucket = []
+            for overload, overload_arity, nominals in self.entries:
+                if overload_arity is None:
+                    bucket.append((overload, None))
+                elif overload_arity == arity:
+                    if first is None or arity == 0 or nominals[0] is None or nominals[0] == first:
+                        bucket.append((overload, nominals))
+            self.buckets[key] = bucket
+
+        return bucket
+
 class Method(Scope):
     verified = False
     overload_context = None
 
+    # Dispatch index and resolved calls, see resolveCall
+    _index = None
+    _resolved_calls = None
+
     def __init__(self, name:str, overloads:[Function], tokens = None):
         BoundObject.__init__(self, name, tokens)
 
@@ -26,6 +83,9 @@ class Method(Scope):
         overload.name = str(len(self.overload_context))
         self.overload_context.addChild(overload)
 
+        self._index = None
+        self._resolved_calls = None
+
     # Pre-verification method
     def assimilate(self, other:Method):
         for overload in other.overload_context:
@@ -43,12 +103,41 @@ class Method(Scope):
     def resolveType(self):
         return MethodType([fn.resolveType() for fn in self.overload_context])
 
+    # Calls are resolved per call type, while neither the targeting nor any
+    # forward constraints change. Calls with forward types are never cached,
+    # as they create switches.
     def resolveCall(self, call:FunctionType):
+        if not call.verified or call.stats.forward:
+            return self._resolveCall(call)
+
+        if self._resolved_calls is None:
+            self._resolved_calls = {}
+
+        scope = State.scope
+        generation = State.targeting_generation
+
+        entry = self._resolved_calls.get(id(call))
+        if entry is not None and entry[0] == generation and entry[1] is call and entry[2] is scope:
+            return entry[3]
+
+        function = self._resolveCall(call)
+        if State.targeting_generation == generation:
+            self._resolved_calls[id(call)] = (generation, call, scope, function)
+        return function
+
+    def _resolveCall(self, call:FunctionType):
+        if self._index is None or self._index.generation != State.targeting_generation:
+            for overload in self.overload_context:
+                overload.verify()
+            self._index = OverloadIndex([(overload, overload.resolveType()) for overload in self.overload_context])
+
         matches = []
 
+        candidates = self._index.candidates(call)
+        if stats.enabled: stats.count("overloads scanned", len(candidates))
+
         # Collect overloads which match the call type
-        for overload in self.overload_context:
-            overload.verify()
+        for overload in candidates:
             if checkCompatibility(call, overload.resolveType()):
                 matches.append(overload)
 
@@ -93,12 +182,20 @@ class Method(Scope):
     def local_context(self):
         return None
 
+    # Resolved calls and the index depend on the state of the verifier
+    def __getstate__(self):
+        state = Scope.__getstate__(self)
+        state.pop("_resolved_calls", None)
+        state.pop("_index", None)
+        return state
+
     def __repr__(self):
         return "method {}".format(self.name)
 
 class MethodType(Type):
     overloads = None
     used_overloads = None
+    _index = None
 
     def __init__(self, overloads:[FunctionType], tokens = None):
         Type.__init__(self, tokens)
@@ -108,6 +205,16 @@ class MethodType(Type):
     def resolveType(self):
         raise InternalError("Not Implemented")
 
+    # Rebuild the used overloads, see ForwardObject.rehash
+    def rehash(self):
+        self.used_overloads = dict(list(self.used_overloads.items()))
+
+    # The index depends on the state of the verifier
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_index", None)
+        return state
+
     def verify(self):
         self._stats = Stats(None)
         self._stats.static = True
@@ -146,9 +253,12 @@ class MethodType(Type):
         return True
 
     def resolveInstanceCall(self, call:FunctionType):
+        if self._index is None or self._index.generation != State.targeting_generation:
+            self._index = OverloadIndex([(fn_type, fn_type) for fn_type in self.overloads])
+
         matches = []
 
-        for fn_type in self.overloads:
+        for fn_type in self._index.candidates(call):
             if fn_type.checkCompatibility(call):
                 matches.append(fn_type)
 
@@ -157,17 +267,24 @@ class MethodType(Type):
 
         if len(normal_matches) == 0:
             if len(forward_matches) == 1:
-                self.used_overloads[call] = True
+                self._useOverload(call)
                 return MethodInstance(self, call)
             else:
                 normal_matches = forward_matches
 
         elif len(normal_matches) == 1:
-            self.used_overloads[normal_matches[0]] = True
+            self._useOverload(normal_matches[0])
             return MethodInstance(self, normal_matches[0])
 
         raise TypeError(message="TODO: Write This")
 
+    def _useOverload(self, fn_type:FunctionType):
+        if self.used_overloads.get(fn_type): return
+
+        self.used_overloads[fn_type] = True
+        # Used overloads change the result of compatibility checks
+        State.invalidateCompatibility()
+
     @property
     def used_overload_types(self):
         return [type for type, used in self.used_overloads.items() if used]
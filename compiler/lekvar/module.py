@@ -2,6 +2,7 @@ from ..errors import *
 
 from .state import State
 from .stats import ScopeStats
+from . import stats
 from .core import Context, Object, BoundObject, Scope, Type
 from .function import Function
 
@@ -9,12 +10,17 @@ class Module(Type, Scope):
     verified = False
     context = None
     type = None
+    # The names of the children verified along with the main instructions,
+    # such as exported ones. Unless every child is verified, see
+    # State.verify_all, all other children are only verified once resolved.
+    roots = None
 
-    def __init__(self, name:str, children:[BoundObject], main:[Object] = [], tokens = None):
+    def __init__(self, name:str, children:[BoundObject], main:[Object] = [], tokens = None, roots:[str] = []):
         Scope.__init__(self, name, tokens)
 
         self.main = main
         self.context = Context(self, children)
+        self.roots = roots
 
     def verify(self):
         if self.verified: return
@@ -24,11 +30,15 @@ class Module(Type, Scope):
         if self.parent is None:
             self.stats.static = True
 
-        with State.scoped(self):
+        with stats.verifying(self), State.scoped(self):
             for instruction in self.main:
                 instruction.verify()
 
-            self.context.verify()
+            if State.verify_all:
+                self.context.verify()
+            else:
+                for name in self.roots:
+                    self.context[name].verify()
 
     def resolveType(self):
         return self
@@ -0,0 +1,76 @@
+import io
+import pickle
+
+from .state import State
+from .forward import ForwardObject
+from .method import MethodType
+from .constraints import ConstraintStore
+from .. import cache
+
+# Snapshots of verified builtins, see useFrontend.
+#
+# A snapshot is a pickled copy of the builtins of a frontend, as they are once
+# verified. Snapshots are kept in memory and in the cache, so that later uses
+# of a frontend only need to load a copy. The builtins of backends can't be
+# pickled, so they are still targeted on every use.
+
+# Snapshots are disabled if enabled is False
+enabled = True
+snapshots = {}
+
+BUILTINS_CACHE = "builtins"
+
+# Types are hashed by value, which is incomplete for some of them while they are
+# unpickled. Objects keeping containers keyed by types are therefore collected
+# while pickling, and rebuild them once everything is unpickled.
+class SnapshotPickler(pickle.Pickler):
+    def __init__(self, file):
+        pickle.Pickler.__init__(self, file, pickle.HIGHEST_PROTOCOL)
+        self.rehashed = {}
+
+    # Called for every reference to an object, not only the first
+    def persistent_id(self, obj):
+        if isinstance(obj, (ForwardObject, MethodType, ConstraintStore)):
+            self.rehashed[id(obj)] = obj
+        return None
+
+def key(frontend) -> str:
+    # Builtins are verified differently when verifying everything
+    return cache.hashKey(frontend.__name__, str(State.verify_all))
+
+# Load a copy of a snapshot, None if there isn't one
+def load(key:str):
+    if not enabled: return None
+
+    data = snapshots.get(key)
+    if data is None:
+        data = cache.read(BUILTINS_CACHE, key)
+        if data is None: return None
+
+    try:
+        # Pickled objects are shared between consecutive loads
+        unpickler = pickle.Unpickler(io.BytesIO(data))
+        builtins = unpickler.load()
+        for object in unpickler.load():
+            object.rehash()
+    except Exception:
+        # Treat broken entries as missing, they are overwritten on store
+        return None
+
+    snapshots[key] = data
+    return builtins
+
+def store(key:str, builtins):
+    if not enabled: return
+
+    data = io.BytesIO()
+    try:
+        pickler = SnapshotPickler(data)
+        pickler.dump(builtins)
+        pickler.dump(list(pickler.rehashed.values()))
+    except Exception:
+        # Not every module can be pickled, eg. overly deep ones
+        return
+
+    snapshots[key] = data.getvalue()
+    cache.write(BUILTINS_CACHE, key, snapshots[key])
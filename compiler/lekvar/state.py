@@ -3,6 +3,7 @@ from io import IOBase
 from contextlib import contextmanager
 
 from .. errors import *
+from .. session import SessionState
 
 # Python predefines
 Module = None
@@ -16,23 +17,74 @@ class classproperty:
     def __get__(self, _, owner):
         return self.getter(owner)
 
-# The global state for the verifier
-class State:
+# The global state for the verifier, kept per compilation session
+class State(metaclass=SessionState):
     source = None
     sources = None
     builtins = None
     logger = None
 
+    # The paths of the files looked for while verifying, whether or not they
+    # exist, as the result depends on them
+    dependencies = None
+
     scope_stack = None
 
     # Other global state
     type_switching = False
 
+    # Whether to verify every definition, rather than only those reachable
+    # from the main instructions and exports of a module
+    verify_all = True
+
+    # What memoized identifier resolutions depend on, see Scope.resolveIdentifier.
+    # Maps the ids of contexts and objects to the object, along with the scopes
+    # which resolved each name through it.
+    resolution_dependents = None
+
+    # Identifier resolution cache counters
+    resolution_hits = 0
+    resolution_misses = 0
+
+    # Memoized type compatibility checks, see util.checkCompatibility.
+    # The targeting generation identifies the current targeting of forward
+    # objects and variables, which the result of any check may depend on.
+    compatibility_cache = None
+    targetings = {}
+    # The trails of the targetings in progress, innermost last, see
+    # forward.target
+    targeting_trails = []
+    targeting_generation = 0
+    _generations = 0
+    _invalidations = 0
+    compatibility_hits = 0
+    compatibility_misses = 0
+
+    # Canonical function types by the identity of their types,
+    # see FunctionType.canonical
+    function_types = None
+
+    # Materialized instantiations of forward targets, see
+    # ForwardTarget.instantiation
+    instantiations = 0
+    instantiation_uses = 0
+
     @classmethod
     def init(cls, logger:logging.Logger):
         cls.logger = logger
         cls.scope_stack = []
         cls.sources = None
+        cls.dependencies = []
+        cls.resolution_dependents = {}
+        cls.resolution_hits = 0
+        cls.resolution_misses = 0
+        cls.compatibility_cache = {}
+        cls.targetings = {}
+        cls.compatibility_hits = 0
+        cls.compatibility_misses = 0
+        cls.instantiations = 0
+        cls.instantiation_uses = 0
+        cls.function_types = {}
 
     @classproperty
     def scope(cls):
@@ -62,6 +114,17 @@ class State:
         yield
         cls.scope_stack.pop()
 
+    # Use the scope a bound object is defined in. Objects verified on demand
+    # may be resolved from any other scope.
+    @classmethod
+    @contextmanager
+    def parentScoped(cls, object:BoundObject):
+        if object.parent is None:
+            yield
+        else:
+            with cls.scoped(object.parent):
+                yield
+
     @classmethod
     @contextmanager
     def type_switch(cls):
@@ -71,10 +134,113 @@ class State:
         cls.type_switching = False
         for fn in cls.type_switch_cleanups: fn()
 
+    # Mark a scope's resolution of a name as depending on a context or object
+    @classmethod
+    def dependOnResolution(cls, source, name:str, scope):
+        entry = cls.resolution_dependents.get(id(source))
+        if entry is None:
+            # Keep the source alive, so that its id is not reused
+            entry = cls.resolution_dependents[id(source)] = (source, {})
+        entry[1].setdefault(name, {})[id(scope)] = scope
+
+    # Invalidate the resolutions of a name which depend on a context or object
+    @classmethod
+    def invalidateResolution(cls, source, name:str):
+        if not cls.resolution_dependents: return
+
+        entry = cls.resolution_dependents.get(id(source))
+        if entry is None: return
+
+        for scope in entry[1].pop(name, {}).values():
+            scope.invalidateResolution(name)
+            cls.invalidateResolution(scope, name)
+
+    # Invalidate every resolution which depends on an object, for when it moves
+    @classmethod
+    def invalidateResolutions(cls, source):
+        if not cls.resolution_dependents: return
+
+        if hasattr(source, "invalidateResolution"):
+            source.invalidateResolution()
+
+        entry = cls.resolution_dependents.pop(id(source), None)
+        if entry is None: return
+
+        for name, scopes in entry[1].items():
+            for scope in scopes.values():
+                scope.invalidateResolution(name)
+                cls.invalidateResolution(scope, name)
+
+    # Invalidate all memoized compatibility checks, for changes that persist
+    # beyond the current targeting
+    @classmethod
+    def invalidateCompatibility(cls):
+        cls._invalidations += 1
+        cls._generations += 1
+        cls.targeting_generation = cls._generations
+
+    # The current state of targeting, which can be returned to with
+    # restoreTargeting once temporary targetings are undone
+    @classmethod
+    def targetingState(cls):
+        return cls.targeting_generation, cls._invalidations
+
+    # Mark the temporary targeting of an object at a value. Targeting the same
+    # object at the same value from the same generation gives the same
+    # generation, so checks are shared between repeated targetings.
+    @classmethod
+    def retarget(cls, object, value):
+        key = (cls.targeting_generation, id(object), id(value))
+        generation = cls.targetings.get(key)
+        if generation is None or generation[1] is not object or generation[2] is not value:
+            cls._generations += 1
+            # Keep the objects alive, so that their ids are not reused
+            generation = (cls._generations, object, value)
+            cls.targetings[key] = generation
+
+        cls.targeting_generation = generation[0]
+
+    # Return to a previous state once its targetings are undone. Unless
+    # something was invalidated meanwhile, the previous generation is restored,
+    # as the targeting is then the same as it was before.
+    @classmethod
+    def restoreTargeting(cls, state):
+        generation, invalidations = state
+        if cls._invalidations == invalidations:
+            cls.targeting_generation = generation
+        else:
+            cls._generations += 1
+            cls.targeting_generation = cls._generations
+
+    # Verify every definition within the context, for sources which can't be
+    # returned to once closed
+    @classmethod
+    @contextmanager
+    def verifyingAll(cls):
+        previous = cls.verify_all
+        cls.verify_all = True
+        try:
+            yield
+        finally:
+            cls.verify_all = previous
+
+    # Only verify definitions once they are resolved within the context
+    @classmethod
+    @contextmanager
+    def verifyingOnDemand(cls):
+        previous = cls.verify_all
+        cls.verify_all = False
+        try:
+            yield
+        finally:
+            cls.verify_all = previous
+
     @classmethod
     @contextmanager
     def ioSource(cls, source:IOBase):
         previous_source = cls.source
         cls.source = source
-        yield source
-        cls.source = previous_source
+        try:
+            yield source
+        finally:
+            cls.source = previous_source
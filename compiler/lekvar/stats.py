@@ -1,3 +1,8 @@
+from time import perf_counter
+from contextlib import contextmanager
+
+from ..session import SessionState
+
 
 class Stats:
     __attrs__ = ['static', 'forward']
@@ -38,3 +43,78 @@ class ScopeStats(SoftScopeStats):
 
     static_transitive = True
     forward_transitive = True
+
+#
+# Verifier counters
+#
+# Opt-in counters and timers for the hot paths of the verifier, attributed to
+# the function or module being verified. Counting sites check `enabled` first,
+# so they cost next to nothing while disabled. See jam --stats.
+
+enabled = False
+
+TOP_LEVEL = "<top level>"
+
+# The counters of the current compilation session
+class Counters(metaclass=SessionState):
+    # Counts by the name of what was being verified, then by counter
+    counters = {}
+    # Verification time by the name of what was being verified, in seconds.
+    # Time spent verifying anything nested is not included.
+    timers = {}
+    # Stack of what is being verified, as [name, start time]
+    verifying = []
+
+def reset():
+    Counters.counters = {}
+    Counters.timers = {}
+    Counters.verifying = []
+
+def count(counter:str, amount:int = 1):
+    stack = Counters.verifying
+    name = stack[-1][0] if len(stack) > 0 else TOP_LEVEL
+    function_counters = Counters.counters.setdefault(name, {})
+    function_counters[counter] = function_counters.get(counter, 0) + amount
+
+# Attribute counts and time to an object while verifying it
+@contextmanager
+def verifying(object):
+    if not enabled:
+        yield
+        return
+
+    stack = Counters.verifying
+    now = perf_counter()
+    if len(stack) > 0:
+        _pause(stack[-1], now)
+    stack.append([qualifiedName(object), now])
+
+    try:
+        yield
+    finally:
+        now = perf_counter()
+        _pause(stack.pop(), now)
+        if len(stack) > 0:
+            stack[-1][1] = now
+
+def _pause(entry, now):
+    name, start = entry
+    Counters.timers[name] = Counters.timers.get(name, 0) + now - start
+
+# The name of a bound object, qualified by its parents
+def qualifiedName(object):
+    names = []
+    while object is not None:
+        names.append(object.name)
+        object = object.parent
+    return ".".join(reversed(names))
+
+# Log the counters and timers, slowest first
+def report(logger):
+    counters, timers = Counters.counters, Counters.timers
+    names = set(counters) | set(timers)
+    for name in sorted(names, key=lambda name: timers.get(name, 0), reverse=True):
+        results = ["{:.2f} ms".format(timers.get(name, 0) * 1000)]
+        for counter, value in sorted(counters.get(name, {}).items()):
+            results.append("{} {}".format(value, counter))
+        logger.info("{}: {}".format(name, ", ".join(results)))
@@ -4,12 +4,48 @@ from contextlib import contextmanager
 from ..errors import *
 
 from .state import State
+from . import stats
 from .core import Object, BoundObject, Scope, Type
 
 # Python predefines
 Module = None
 
+# Whether or not to memoize compatibility checks. Off by default: the checks
+# are cheap enough that the memo costs more than it saves, see
+# benchmarks/verify.py
+memoize_compatibility = False
+
+# Checks are memoized by the identity of both types for the whole verification.
+# Forward objects are locked depending on the current scope, so that is part
+# of the key. Otherwise results only change when variables or forward objects
+# are targeted, or forward objects gain new constraints, each of which changes
+# the targeting generation.
 def checkCompatibility(type1:Type, type2:Type, check_cache = None):
+    if stats.enabled: stats.count("compatibility checks")
+
+    cache = State.compatibility_cache
+    if (cache is None or check_cache is not None or State.type_switching
+            or not memoize_compatibility):
+        return _checkCompatibility(type1, type2, check_cache)
+
+    scope = State.scope
+    key = (id(type1), id(type2), id(scope))
+    generation = State.targeting_generation
+
+    entry = cache.get(key)
+    if entry is not None and entry[0] == generation and entry[1] is type1 and entry[2] is type2 and entry[3] is scope:
+        State.compatibility_hits += 1
+        return entry[4]
+
+    State.compatibility_misses += 1
+    result = _checkCompatibility(type1, type2, check_cache)
+
+    if State.targeting_generation == generation:
+        # Keep the objects alive, so that their ids are not reused
+        cache[key] = (generation, type1, type2, scope, result)
+    return result
+
+def _checkCompatibility(type1:Type, type2:Type, check_cache = None):
     if type1.checkCompatibility(type2, check_cache):
         return True
     return type2.revCheckCompatibility(type1, check_cache)
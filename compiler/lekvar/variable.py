@@ -1,5 +1,5 @@
 from copy import copy
-from contextlib import contextmanager, ExitStack
+from contextlib import contextmanager
 
 from ..errors import *
 
@@ -95,19 +95,25 @@ class Variable(BoundObject, Type):
 
     @contextmanager
     def targetValue(self, value):
+        with forward.target([(self, value)]):
+            yield
+
+    # Targets the value of this variable, recording the change on the trail.
+    # The static value type is targeted immediately, alongside the value.
+    def targetAt(self, value, trail:list, checkTypes = True):
         value = value.resolveValue()
-        old_value = self.value
-        self.value = value
+        trail.append((self, self.swapTarget(value)))
+        State.retarget(self, value)
 
-        stack = ExitStack()
         if self._static_value_type is not None:
-            targets = [(self._static_value_type, value)]
-            stack.enter_context(forward.target(targets))
+            forward.apply([(self._static_value_type, value)], trail)
+        return ()
 
-        with stack:
-            yield
-
-        self.value = old_value
+    # Replace the value, returning the previous one
+    def swapTarget(self, value):
+        previous_value = self.value
+        self.value = value
+        return previous_value
 
     def extractValue(self):
         if self._static_value_type is not None:
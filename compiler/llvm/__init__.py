@@ -1,9 +1,10 @@
 import os
 import sys
-import uuid
 import logging
 import subprocess
-from tempfile import TemporaryDirectory
+from ctypes import CDLL
+from contextlib import contextmanager
+from tempfile import TemporaryDirectory, TemporaryFile
 
 from .. import lekvar
 from ..errors import *
@@ -12,8 +13,36 @@ from .state import State
 from .builtins import builtins
 from . import emitter
 from . import bindings
+from . import passes
 
-def emit(module:lekvar.Module, logger = logging.getLogger(), opt_level = 1):
+logger = logging.getLogger("llvm")
+
+# Whether to execute modules in process, through MCJIT. A module that crashes
+# takes the compiler with it, so JAM_JIT=0 opts out. Then, or if MCJIT is
+# unavailable, modules are executed by lli in a separate process.
+jit = os.environ.get("JAM_JIT", "1") != "0"
+
+# Emit a module as textual IR, or as bitcode if bitcode is set. The code is
+# written straight to path if given, otherwise it is returned.
+def emit(module:lekvar.Module, logger = logging.getLogger(), opt_level = 1, path = None, bitcode = False):
+    module = _build(module, logger, opt_level)
+
+    if path is None:
+        return module.toBitcode() if bitcode else module.toString()
+
+    try:
+        if bitcode:
+            module.writeBitcodeToFile(path)
+        else:
+            module.printToFile(path)
+    except OSError as e:
+        raise ExecutionError("Error writing code to {}: {}".format(path, e))
+
+def run(module:lekvar.Module, logger = logging.getLogger(), opt_level = 1):
+    return execute(_build(module, logger, opt_level))
+
+# Emit, verify and optimise a module. The result stays in State.module
+def _build(module:lekvar.Module, logger:logging.Logger, opt_level:int):
     State.logger = logger.getChild("llvm")
 
     with State.begin(logger):
@@ -21,28 +50,91 @@ def emit(module:lekvar.Module, logger = logging.getLogger(), opt_level = 1):
 
     State.module.verify()
     _optimise(State.module, opt_level, opt_level)
-    return State.module.toString()
+    return State.module
 
-def run(module:lekvar.Module, logger = logging.getLogger(), opt_level = 1):
-    code = emit(module, logger, opt_level)
+def _optimise(module:bindings.Module, level:int, size_level:int):
+    return passes.optimise(module, level, size_level, State.logger)
 
-    return interpret(code)
+# Execute an emitted module, in process if possible, otherwise through lli.
+# Returns the output of the module, stdout and stderr combined, if capture is
+# set. Otherwise the output goes straight to stdout and stderr.
+def execute(module:bindings.Module, capture = True):
+    global jit
+    if jit:
+        try:
+            bindings.initializeNativeTarget()
+        except bindings.TargetError as e:
+            # Don't bother trying again
+            jit = False
+            logger.warning("MCJIT unavailable, falling back to lli: {}".format(e))
+        else:
+            return _jit(module, capture)
 
-def _optimise(module:bindings.Module, level:int, size_level:int):
-    manager = bindings.PassManager.new()
-    manager.setOptLevel(level)
-    manager.setOptSizeLevel(size_level)
-    return bool(manager.run(module))
-
-def _get_tempname(suffix = ""):
-    name = str(uuid.uuid4())
-    # Make sure it doesn't already exist. REALLY make sure
-    while os.path.isfile(name + suffix):
-        name = str(uuid.uuid4())
-    return name + suffix
-
-# Wrapping around lli
-#TODO: Replace with direct calls to llvm
+    # lli reads bitcode quicker than text, straight out of llvm's buffer
+    buffer = module.toBitcodeBuffer()
+    if capture:
+        return interpret(buffer.view())
+    interpret_direct(buffer.view())
+
+def _jit(module:bindings.Module, capture = True):
+    try:
+        engine = bindings.ExecutionEngine.forModule(module)
+    except bindings.ExecutionEngineError as e:
+        raise ExecutionError("MCJIT error creating engine: {}".format(e))
+
+    try:
+        if not capture:
+            _runMain(engine, module)
+            return None
+
+        with TemporaryFile() as output:
+            with _redirectedOutput(output):
+                status = _runMain(engine, module)
+            output.seek(0)
+            output = output.read()
+    finally:
+        # The module is taken back before the engine is disposed, which would
+        # otherwise dispose it too
+        engine.removeModule(module)
+        engine.dispose()
+
+    # Match lli, which fails for non-zero exit codes
+    if status != 0:
+        raise ExecutionError("MCJIT error running module, exit code {}: {}".format(status, output))
+    return output
+
+def _runMain(engine:bindings.ExecutionEngine, module:bindings.Module):
+    engine.runStaticConstructors()
+    status = engine.runFunctionAsMain(module.getFunction("main"))
+    engine.runStaticDestructors()
+
+    # Write out whatever the module left in the C streams
+    _libc.fflush(None)
+    return status
+
+# The C library, for flushing the C streams of executed modules
+_libc = CDLL(None)
+
+# Redirect stdout and stderr into a file, at the file descriptor level, so
+# that the output of executed modules ends up in it
+@contextmanager
+def _redirectedOutput(file):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    _libc.fflush(None)
+
+    saved = os.dup(1), os.dup(2)
+    os.dup2(file.fileno(), 1)
+    os.dup2(file.fileno(), 2)
+    try:
+        yield
+    finally:
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        os.close(saved[0])
+        os.close(saved[1])
+
+# Wrapping around lli, for textual IR or bitcode
 def interpret(source:bytes, precommands = []):
     try:
         return subprocess.check_output(precommands + [bindings.LLI],
@@ -60,24 +152,56 @@ def interpret_direct(source:bytes):
         stderr = sys.stderr
     ).communicate(source)
 
-# Wrapping around clang
-#TODO: Replace with direct calls to llvm
+# Compile an emitted module to an executable. Object code is generated in
+# process and linked by the system's compiler driver. Falls back to clang if the
+# native target is unavailable.
+def compile_module(module:bindings.Module, opt_level = 1):
+    if bindings.LINKER is None:
+        raise ExecutionError("Failed to find a linker, install cc or clang")
+
+    try:
+        machine = bindings.TargetMachine.native(min(opt_level, 3))
+    except bindings.TargetError as e:
+        logger.warning("Native target unavailable, falling back to clang: {}".format(e))
+        return compile(module.toBitcode())
+
+    module.target_triple = machine.triple.encode("UTF-8")
+
+    with TemporaryDirectory() as build_dir:
+        try:
+            machine.emitToFile(module, os.path.join(build_dir, "module.o"))
+        except bindings.TargetError as e:
+            raise ExecutionError("llvm error generating code: {}".format(e))
+
+        try:
+            # Link relative to the build directory, so that its name doesn't
+            # end up in the executable
+            subprocess.check_output([bindings.LINKER, "-o", "module", "module.o"],
+                stderr = subprocess.STDOUT, cwd = build_dir)
+        except subprocess.CalledProcessError as e:
+            output = e.output.decode("UTF-8")
+            raise ExecutionError("Error linking module: {}".format(output))
+
+        with open(os.path.join(build_dir, "module"), "rb") as f:
+            return f.read()
+
+# Wrapping around clang, for textual IR or bitcode
 def compile(source:bytes):
+    # Names are fixed, so that they don't end up differing between builds
+    source_name = "module.bc" if bindings.isBitcode(source) else "module.ll"
+
     with TemporaryDirectory() as build_dir:
+        with open(os.path.join(build_dir, source_name), 'wb') as f:
+            f.write(source)
+
         try:
-            # Leave cleaning these up to python.
-            # They should get removed by the temporary dir anyway
-            path = os.path.join(build_dir, _get_tempname(suffix=".ll"))
-            f_in = open(path, 'wb')
-            f_in.write(source)
-            f_in.flush()
-
-            out_name = os.path.join(build_dir, _get_tempname())
             subprocess.check_output([
                     bindings.CLANG,
-                    "-v", "-o", out_name, f_in.name
-                ], stderr = subprocess.STDOUT)
-            return open(out_name, 'rb').read()
+                    "-v", "-o", "module", source_name
+                ], stderr = subprocess.STDOUT, cwd = build_dir)
         except subprocess.CalledProcessError as e:
             output = e.output.decode("UTF-8")
             raise ExecutionError("clang error compiling source {}".format(output))
+
+        with open(os.path.join(build_dir, "module"), 'rb') as f:
+            return f.read()
@@ -1,8 +1,13 @@
 import sys
 import shutil
+import platform
 from ctypes import *
 import traceback
 import logging
+import threading
+from contextlib import contextmanager
+
+from .. import session
 
 # Set platform specific constants
 if sys.platform.startswith("linux"):
@@ -32,6 +37,8 @@ def llvm_cmd(cmd, fail_ok = False):
 
 LLI = llvm_cmd("lli")
 CLANG = llvm_cmd("clang", True)
+# Links generated object code, any compiler driver will do
+LINKER = shutil.which("cc") or CLANG
 
 c_bool = c_int
 
@@ -41,6 +48,12 @@ class NullException(Exception):
 class VerificationError(Exception):
     pass
 
+class TargetError(Exception):
+    pass
+
+class ExecutionEngineError(Exception):
+    pass
+
 #
 # Wrapping tools
 #
@@ -79,13 +92,14 @@ def convertArgs(args):
 def logged(cls_name, name, check_null = True):
     def logged(func):
         def f(self, *args):
-            # Log the call, if possible. global State is set by State.begin
-            if 'State' in globals() and State.logger and State.logger.isEnabledFor(logging.DEBUG):
+            # Log the call, if possible. The logger is set by State.begin
+            logger = session.current().logger
+            if logger and logger.isEnabledFor(logging.DEBUG):
                 if isinstance(self, type):
-                    State.logger.debug("{}.{} calling {}{}".format(
+                    logger.debug("{}.{} calling {}{}".format(
                         self.__name__, cls_name, name, args), stack_info=True)
                 else:
-                    State.logger.debug("{}.{} calling {}{}".format(
+                    logger.debug("{}.{} calling {}{}".format(
                         self.__class__.__name__, cls_name, name, tuple([self] + list(args))), stack_info=True)
 
             # Perform the call
@@ -99,76 +113,199 @@ def logged(cls_name, name, check_null = True):
         return f
     return logged
 
+# Wrapped functions come in two flavours: a direct one, and an instrumented one
+# which logs calls and records debug metadata on the values they return. The
+# direct ones are used unless instrumented, see instrument.
+instrumented = False
+_flavours = []
+
+# Switch between the flavours of the wrapped functions. This is process wide,
+# the instrumented functions only log for sessions with debug logging enabled.
+# Sessions switch through instrumenting, which switches back after them.
+def instrument(enabled:bool = True):
+    global instrumented
+    if instrumented == enabled: return
+
+    instrumented = enabled
+    for cls, attr, direct, instrumented_attr in _flavours:
+        setattr(cls, attr, instrumented_attr if enabled else direct)
+
+# Use the instrumented flavour within the context, for a session with debug
+# logging. Once no such session is left, the flavour in use before the first
+# of them is restored.
+_instrumenting = 0
+_instrumenting_lock = threading.Lock()
+_instrumented_before = False
+
+@contextmanager
+def instrumenting():
+    global _instrumenting, _instrumented_before
+    with _instrumenting_lock:
+        if _instrumenting == 0:
+            _instrumented_before = instrumented
+        _instrumenting += 1
+        instrument()
+
+    try:
+        yield
+    finally:
+        with _instrumenting_lock:
+            _instrumenting -= 1
+            if _instrumenting == 0:
+                instrument(_instrumented_before)
+
+def _defineFlavours(cls, attr:str, direct, instrumented_attr):
+    _flavours.append((cls, attr, direct, instrumented_attr))
+    setattr(cls, attr, instrumented_attr if instrumented else direct)
+
+# Whether arguments of the given types need converting, see convertArgs
+def _needsConversion(types):
+    return any(isinstance(type, list) or type is c_char_p for type in types)
+
 class Wrappable:
     @classmethod
     def wrapInstanceFunc(cls, cls_name:str, name:str, args:[] = [], ret = None, check_null = True):
         setTypes(name, convertArgtypes([cls] + args), ret)
+        c_func = getattr(_lib, name)
+        check_null = check_null and ret is not None
+
+        if _needsConversion(args):
+            def direct(self, *args):
+                value = c_func(self, *convertArgs(args))
+                if check_null and value is None:
+                    raise NullException("Binding returned null")
+                return value
+        elif check_null:
+            def direct(self, *args):
+                value = c_func(self, *args)
+                if value is None:
+                    raise NullException("Binding returned null")
+                return value
+        else:
+            def direct(self, *args):
+                return c_func(self, *args)
 
-        @logged(cls_name, name, check_null and ret is not None)
+        @logged(cls_name, name, check_null)
         def func(self, *args):
-            value = getattr(_lib, name)(self, *convertArgs(args))
+            value = c_func(self, *convertArgs(args))
 
             # Set debug attributes
             if isinstance(value, Wrappable):
-                value.constructor_name = repr(self) + "." + cls_name
+                value.constructor_owner = self
+                value.constructor_name = cls_name
                 value.constructor_args = args
 
             return value
 
-        setattr(cls, cls_name, func)
+        _defineFlavours(cls, cls_name, direct, func)
 
     @classmethod
     def wrapInstanceProp(cls, cls_name:str, get_name:str, set_name:str, type, check_null = True):
         # Create getter
         setTypes(get_name, [cls], type)
+        c_get = getattr(_lib, get_name)
+
+        def direct_get(self):
+            value = c_get(self)
+            if check_null and value is None:
+                raise NullException("Binding returned null")
+            return value
+
         @logged(cls_name, get_name, check_null)
         def get(self):
-            value = getattr(_lib, get_name)(self)
+            value = c_get(self)
 
             # Set debug attributes
             if isinstance(value, Wrappable):
-                value.constructor_name = repr(self) + "." + cls_name
+                value.constructor_owner = self
+                value.constructor_name = cls_name
 
             return value
 
         # Create Setter
-        set = None
+        direct_set = set = None
         if set_name is not None:
             setTypes(set_name, [cls, type], None)
+            c_set = getattr(_lib, set_name)
+
+            def direct_set(self, val:type):
+                c_set(self, val)
+
             @logged(cls_name, set_name, False)
             def set(self, val:type):
-                getattr(_lib, set_name)(self, val)
+                c_set(self, val)
 
-        setattr(cls, cls_name, property(get, set))
+        _defineFlavours(cls, cls_name, property(direct_get, direct_set), property(get, set))
 
+    # Objects are disposed when collected, or earlier with dispose. Either way
+    # only once, as the handle is cleared.
     @classmethod
     def wrapDestructor(cls, name:str):
         setTypes(name, [cls], None)
-        cls.__del__ = lambda self: getattr(_lib, name)(self)
+
+        def dispose(self):
+            if self.value is not None:
+                getattr(_lib, name)(self)
+                self.value = None
+        cls.dispose = cls.__del__ = dispose
 
     @classmethod
     def wrapConstructor(cls, cls_name:str, name:str, args:[] = []):
         setTypes(name, convertArgtypes(args), cls)
-        @classmethod
+        c_func = getattr(_lib, name)
+
+        if _needsConversion(args):
+            def direct(cls, *args):
+                obj = c_func(*convertArgs(args))
+                if obj is None:
+                    raise NullException("Binding returned null")
+                return obj
+        else:
+            def direct(cls, *args):
+                obj = c_func(*args)
+                if obj is None:
+                    raise NullException("Binding returned null")
+                return obj
+
         @logged(cls_name, name)
         def make(cls, *args):
-            obj = getattr(_lib, name)(*convertArgs(args))
+            obj = c_func(*convertArgs(args))
             # Set debug attributes
             obj.constructor_name = cls.__name__ + "." + cls_name
             obj.constructor_args = args
 
             return obj
-        setattr(cls, cls_name, make)
 
-    # Debugging
+        _defineFlavours(cls, cls_name, classmethod(direct), classmethod(make))
+
+    # Debugging, only recorded by the instrumented wrappers. The name is
+    # relative to the owner, the object the value was got from, if any.
+    # The full name is only worked out when needed, as it recurses through
+    # the owners and arguments. Values built from long chains of instructions
+    # would recurse too deep, so only the closest REPR_DEPTH levels are named.
+    constructor_owner = None
     constructor_name = None
     constructor_args = tuple()
+    REPR_DEPTH = 8
+
     def __repr__(self):
-        if self.constructor_name is not None:
-            return "{}({})".format(self.constructor_name,
-                                   ', '.join(map(str, self.constructor_args)))
-        else:
-            return Wrappable.__repr__(self)
+        return self._repr(self.REPR_DEPTH)
+
+    def _repr(self, depth:int):
+        if self.constructor_name is None or depth == 0:
+            return "{}({})".format(self.__class__.__name__, hex(self.value or 0))
+
+        name = self.constructor_name
+        if self.constructor_owner is not None:
+            name = _repr(self.constructor_owner, depth - 1) + "." + name
+        return "{}({})".format(name, ', '.join(_repr(arg, depth - 1) for arg in self.constructor_args))
+
+def _repr(value, depth:int):
+    if isinstance(value, Wrappable):
+        return value._repr(depth)
+    elif isinstance(value, list):
+        return "[{}]".format(", ".join(_repr(item, depth) for item in value))
+    return str(value)
 
 #
 # The Actual LLVM bindings
@@ -177,6 +314,11 @@ class Wrappable:
 class Context(Wrappable, c_void_p):
     pass
 
+# A context got from something in it, or the global context. These aren't
+# owned, so they are never disposed.
+class BorrowedContext(Context):
+    pass
+
 class Module(Wrappable, c_void_p):
     pass
 
@@ -213,11 +355,27 @@ class FunctionValue(Value):
 class PassManager(Wrappable, c_void_p):
     pass
 
+class FunctionPassManager(PassManager):
+    pass
+
 class TargetData(Wrappable, c_void_p):
     pass
 
-__all__ = """Context Module Builder Type Pointer Int Float Function Block Value
-FunctionValue""".split()
+class ExecutionEngine(Wrappable, c_void_p):
+    pass
+
+class Target(Wrappable, c_void_p):
+    pass
+
+class MemoryBuffer(Wrappable, c_void_p):
+    pass
+
+class TargetMachine(Wrappable, c_void_p):
+    pass
+
+__all__ = """Context BorrowedContext Module Builder Type Pointer Int Float Function Block Value
+FunctionValue ExecutionEngine Target TargetMachine MemoryBuffer PassManager
+FunctionPassManager""".split()
 
 
 # Error message disposal function
@@ -232,9 +390,27 @@ disposeError = _lib.LLVMDisposeMessage
 
 # Constructors
 Context.wrapConstructor("new", "LLVMContextCreate")
-Context.wrapConstructor("getGlobal", "LLVMGetGlobalContext")
 Context.wrapDestructor("LLVMContextDispose")
 
+# Disposing a context disposes everything in it. Objects created in a context
+# keep it alive, and it disposes them before itself, so that neither is
+# disposed twice whatever order they are collected in.
+def Context_own(self, object:Wrappable):
+    object.owner_context = self
+    self.__dict__.setdefault("owned", []).append(object)
+    return object
+Context.own = Context_own
+
+_disposeContext = Context.dispose
+def Context_dispose(self):
+    for object in self.__dict__.get("owned", []):
+        object.dispose()
+    _disposeContext(self)
+Context.dispose = Context.__del__ = Context_dispose
+
+BorrowedContext.wrapConstructor("getGlobal", "LLVMGetGlobalContext")
+BorrowedContext.dispose = BorrowedContext.__del__ = lambda self: None
+
 #
 # Module
 #
@@ -243,12 +419,17 @@ Context.wrapDestructor("LLVMContextDispose")
 Module.wrapConstructor("fromName", "LLVMModuleCreateWithName", [c_char_p])
 Module.wrapConstructor("fromNameWithContext", "LLVMModuleCreateWithNameInContext", [c_char_p, Context])
 Module.wrapDestructor("LLVMDisposeModule")
+
+# Create a module in a context, see Context.own
+def Module_inContext(cls, name:str, context:Context):
+    return context.own(cls.fromNameWithContext(name, context))
+Module.inContext = classmethod(Module_inContext)
 #clone = Module.wrapInstanceFunc("LLVMCloneModule", [], Module) # Doesn't exist?
 
 # Properties
 Module.wrapInstanceProp("data_layout", "LLVMGetDataLayout", "LLVMSetDataLayout", c_char_p)
 Module.wrapInstanceProp("target_triple", "LLVMGetTarget", "LLVMSetTarget", c_char_p)
-Module.wrapInstanceProp("context", "LLVMGetModuleContext", None, Context)
+Module.wrapInstanceProp("context", "LLVMGetModuleContext", None, BorrowedContext)
 
 # Methods
 Module.wrapInstanceFunc("dump", "LLVMDumpModule")
@@ -257,6 +438,46 @@ Module.wrapInstanceFunc("getType", "LLVMGetTypeByName", [c_char_p], Type)
 Module.wrapInstanceFunc("addFunction", "LLVMAddFunction", [c_char_p, Function], FunctionValue)
 Module.wrapInstanceFunc("getFunction", "LLVMGetNamedFunction", [c_char_p], FunctionValue)
 Module.wrapInstanceFunc("addVariable", "LLVMAddGlobal", [Type, c_char_p], Value)
+# Raw iteration, without the overhead of wrapping every value. These are
+# separate function objects, so the types of the wrapped functions are kept.
+def rawFunction(name:str, args:[], ret = None):
+    func = _lib[name]
+    func.argtypes = args
+    func.restype = ret
+    return func
+
+_firstFunction = rawFunction("LLVMGetFirstFunction", [c_void_p], c_void_p)
+_nextFunction = rawFunction("LLVMGetNextFunction", [c_void_p], c_void_p)
+_firstBlock = rawFunction("LLVMGetFirstBasicBlock", [c_void_p], c_void_p)
+_nextBlock = rawFunction("LLVMGetNextBasicBlock", [c_void_p], c_void_p)
+_firstInstruction = rawFunction("LLVMGetFirstInstruction", [c_void_p], c_void_p)
+_nextInstruction = rawFunction("LLVMGetNextInstruction", [c_void_p], c_void_p)
+
+# The number of instructions in the module
+def Module_countInstructions(self) -> int:
+    count = 0
+    function = _firstFunction(self.value)
+    while function:
+        block = _firstBlock(function)
+        while block:
+            instruction = _firstInstruction(block)
+            while instruction:
+                count += 1
+                instruction = _nextInstruction(instruction)
+            block = _nextBlock(block)
+        function = _nextFunction(function)
+    return count
+Module.countInstructions = Module_countInstructions
+
+# The functions of the module
+def Module_functions(self) -> [FunctionValue]:
+    functions = []
+    function = _firstFunction(self.value)
+    while function:
+        functions.append(FunctionValue(function))
+        function = _nextFunction(function)
+    return functions
+Module.functions = Module_functions
 
 setTypes("LLVMVerifyModule", [Module, c_int, POINTER(c_char_p)], c_bool)
 
@@ -272,6 +493,42 @@ def Module_verify(self):
         raise VerificationError(message)
 Module.verify = Module_verify
 
+setTypes("LLVMPrintModuleToFile", [Module, c_char_p, POINTER(c_char_p)], c_bool)
+
+# Write the textual IR of the module to a file
+@logged("printToFile", "LLVMPrintModuleToFile", False)
+def Module_printToFile(self, path:str):
+    error_msg = c_char_p()
+
+    if _lib.LLVMPrintModuleToFile(self, path.encode("UTF-8"), byref(error_msg)):
+        message = error_msg.value.decode("UTF-8")
+        disposeError(error_msg)
+
+        raise OSError(message)
+Module.printToFile = Module_printToFile
+
+setTypes("LLVMWriteBitcodeToFile", [Module, c_char_p], c_int)
+
+# Write the bitcode of the module to a file
+@logged("writeBitcodeToFile", "LLVMWriteBitcodeToFile", False)
+def Module_writeBitcodeToFile(self, path:str):
+    if _lib.LLVMWriteBitcodeToFile(self, path.encode("UTF-8")) != 0:
+        raise OSError("Failed to write bitcode to {}".format(path))
+Module.writeBitcodeToFile = Module_writeBitcodeToFile
+
+Module.wrapInstanceFunc("toBitcodeBuffer", "LLVMWriteBitcodeToMemoryBuffer", [], MemoryBuffer)
+
+# The bitcode of the module
+def Module_toBitcode(self) -> bytes:
+    return self.toBitcodeBuffer().toBytes()
+Module.toBitcode = Module_toBitcode
+
+# Magic number at the start of bitcode
+BITCODE_MAGIC = b"BC\xc0\xde"
+
+def isBitcode(source:bytes):
+    return source[:4] == BITCODE_MAGIC
+
 class FailureAction:
     AbortProcessAction = 0 # verifier will print to stderr and abort()
     PrintMessageAction = 1 # verifier will print to stderr and return 1
@@ -286,6 +543,11 @@ Builder.wrapConstructor("new", "LLVMCreateBuilder")
 Builder.wrapConstructor("fromContext", "LLVMCreateBuilderInContext", [Context])
 Builder.wrapDestructor("LLVMDisposeBuilder")
 
+# Create a builder in a context, see Context.own
+def Builder_inContext(cls, context:Context):
+    return context.own(cls.fromContext(context))
+Builder.inContext = classmethod(Builder_inContext)
+
 # Functions
 Builder.wrapInstanceFunc("positionAt", "LLVMPositionBuilder", [Block, Value])
 Builder.wrapInstanceFunc("positionBefore", "LLVMPositionBuilderBefore", [Value])
@@ -387,14 +649,18 @@ Builder.wrapInstanceFunc("ptrToInt", "LLVMBuildPtrToInt", [Value, Type, c_char_p
 #
 
 Type.wrapConstructor("void", "LLVMVoidType")
+Type.wrapConstructor("voidInContext", "LLVMVoidTypeInContext", [Context])
 Type.wrapConstructor("label", "LLVMLabelType")
 
+# A void pointer, in the global context unless given one
 @staticmethod
-def Type_void_p(space = 0):
-    return Pointer.new(Int.new(8), space)
+def Type_void_p(space = 0, context:Context = None):
+    if context is None:
+        return Pointer.new(Int.new(8), space)
+    return Pointer.new(Int.newInContext(context, 8), space)
 Type.void_p = Type_void_p
 
-Type.wrapInstanceProp("context", "LLVMGetTypeContext", None, Context)
+Type.wrapInstanceProp("context", "LLVMGetTypeContext", None, BorrowedContext)
 Type.wrapInstanceProp("isSized", "LLVMTypeIsSized", None, c_bool)
 Type.wrapInstanceProp("kind", "LLVMGetTypeKind", None, c_uint)
 
@@ -433,6 +699,7 @@ Pointer.wrapInstanceProp("element_type", "LLVMGetElementType", None, Type)
 #
 
 Int.wrapConstructor("new", "LLVMIntType", [c_uint])
+Int.wrapConstructor("newInContext", "LLVMIntTypeInContext", [Context, c_uint])
 Int.wrapInstanceProp("size", "LLVMGetIntTypeWidth", None, c_uint)
 
 #
@@ -442,6 +709,9 @@ Int.wrapInstanceProp("size", "LLVMGetIntTypeWidth", None, c_uint)
 Float.wrapConstructor("half", "LLVMHalfType")
 Float.wrapConstructor("float", "LLVMFloatType")
 Float.wrapConstructor("double", "LLVMDoubleType")
+Float.wrapConstructor("halfInContext", "LLVMHalfTypeInContext", [Context])
+Float.wrapConstructor("floatInContext", "LLVMFloatTypeInContext", [Context])
+Float.wrapConstructor("doubleInContext", "LLVMDoubleTypeInContext", [Context])
 
 #
 # Function Types
@@ -457,6 +727,7 @@ Function.wrapInstanceProp("return_type", "LLVMGetReturnType", None, Type)
 
 Struct.wrapConstructor("new", "LLVMStructCreateNamed", [Context, c_char_p])
 Struct.wrapConstructor("newAnonym", "LLVMStructType", [[Type], c_bool])
+Struct.wrapConstructor("newAnonymInContext", "LLVMStructTypeInContext", [Context, [Type], c_bool])
 
 Struct.wrapInstanceFunc("setBody", "LLVMStructSetBody", [[Type], c_bool])
 
@@ -467,7 +738,15 @@ Struct.wrapInstanceFunc("setBody", "LLVMStructSetBody", [[Type], c_bool])
 Block.wrapInstanceFunc("asValue", "LLVMBasicBlockAsValue", [], Value)
 Block.wrapInstanceFunc("getPrevious", "LLVMGetPreviousBasicBlock", [], Block, check_null=False)
 Block.wrapInstanceFunc("getNext", "LLVMGetNextBasicBlock", [], Block, check_null=False)
-Block.wrapInstanceFunc("insertBlock", "LLVMInsertBasicBlock", [c_char_p], Block)
+
+setTypes("LLVMInsertBasicBlockInContext", [Context, Block, c_char_p], Block)
+
+# Insert a block before this one, in the context of its function
+def Block_insertBlock(self, name:str):
+    context = self.asValue().type.context
+    return _lib.LLVMInsertBasicBlockInContext(context, self, name.encode("UTF-8"))
+_defineFlavours(Block, "insertBlock", Block_insertBlock,
+                logged("insertBlock", "LLVMInsertBasicBlockInContext")(Block_insertBlock))
 
 Block.wrapInstanceFunc("moveBefore", "LLVMMoveBasicBlockBefore", [Block])
 Block.wrapInstanceFunc("moveAfter", "LLVMMoveBasicBlockAfter", [Block])
@@ -562,7 +841,14 @@ class Opcode:
     Resume         = 58
     LandingPad     = 59
 
-FunctionValue.wrapInstanceFunc("appendBlock", "LLVMAppendBasicBlock", [c_char_p], Block)
+setTypes("LLVMAppendBasicBlockInContext", [Context, FunctionValue, c_char_p], Block)
+
+# Append a block to the function, in its context
+def FunctionValue_appendBlock(self, name:str):
+    context = self.type.context
+    return _lib.LLVMAppendBasicBlockInContext(context, self, name.encode("UTF-8"))
+_defineFlavours(FunctionValue, "appendBlock", FunctionValue_appendBlock,
+                logged("appendBlock", "LLVMAppendBasicBlockInContext")(FunctionValue_appendBlock))
 FunctionValue.wrapInstanceFunc("getLastBlock", "LLVMGetLastBasicBlock", [], Block)
 FunctionValue.wrapInstanceFunc("getFirstBlock", "LLVMGetFirstBasicBlock", [], Block)
 FunctionValue.wrapInstanceFunc("getParam", "LLVMGetParam", [c_uint], Value)
@@ -635,6 +921,82 @@ def PassManager_setOptSizeLevel(self, level:int):
     _lib.LLVMPassManagerBuilderDispose(builder)
 PassManager.setOptSizeLevel = PassManager_setOptSizeLevel
 
+FunctionPassManager.wrapConstructor("forModule", "LLVMCreateFunctionPassManagerForModule", [Module])
+
+FunctionPassManager.wrapInstanceFunc("initialize", "LLVMInitializeFunctionPassManager", [], c_bool)
+FunctionPassManager.wrapInstanceFunc("run", "LLVMRunFunctionPassManager", [FunctionValue], c_bool)
+FunctionPassManager.wrapInstanceFunc("finalize", "LLVMFinalizeFunctionPassManager", [], c_bool)
+
+# Individual passes, by the names opt knows them by
+FUNCTION_PASSES = {
+    "mem2reg": "LLVMAddPromoteMemoryToRegisterPass",
+    "scalarrepl": "LLVMAddScalarReplAggregatesPass",
+    "instcombine": "LLVMAddInstructionCombiningPass",
+    "reassociate": "LLVMAddReassociatePass",
+    "gvn": "LLVMAddGVNPass",
+    "simplifycfg": "LLVMAddCFGSimplificationPass",
+    "early-cse": "LLVMAddEarlyCSEPass",
+    "sccp": "LLVMAddSCCPPass",
+    "constprop": "LLVMAddConstantPropagationPass",
+    "dse": "LLVMAddDeadStoreEliminationPass",
+    "adce": "LLVMAddAggressiveDCEPass",
+    "jump-threading": "LLVMAddJumpThreadingPass",
+    "correlated-propagation": "LLVMAddCorrelatedValuePropagationPass",
+    "tailcallelim": "LLVMAddTailCallEliminationPass",
+    "memcpyopt": "LLVMAddMemCpyOptPass",
+    "licm": "LLVMAddLICMPass",
+    "loop-rotate": "LLVMAddLoopRotatePass",
+    "loop-unroll": "LLVMAddLoopUnrollPass",
+    "loop-deletion": "LLVMAddLoopDeletionPass",
+    "indvars": "LLVMAddIndVarSimplifyPass",
+    "loop-vectorize": "LLVMAddLoopVectorizePass",
+    "slp-vectorizer": "LLVMAddSLPVectorizePass",
+    "basicaa": "LLVMAddBasicAliasAnalysisPass",
+    "tbaa": "LLVMAddTypeBasedAliasAnalysisPass",
+}
+
+MODULE_PASSES = {
+    "inline": "LLVMAddFunctionInliningPass",
+    "always-inline": "LLVMAddAlwaysInlinerPass",
+    "globaldce": "LLVMAddGlobalDCEPass",
+    "globalopt": "LLVMAddGlobalOptimizerPass",
+    "ipsccp": "LLVMAddIPSCCPPass",
+    "deadargelim": "LLVMAddDeadArgEliminationPass",
+    "functionattrs": "LLVMAddFunctionAttrsPass",
+    "constmerge": "LLVMAddConstantMergePass",
+    "strip-dead-prototypes": "LLVMAddStripDeadPrototypesPass",
+    "argpromotion": "LLVMAddArgumentPromotionPass",
+    "prune-eh": "LLVMAddPruneEHPass",
+}
+
+for name in list(FUNCTION_PASSES.values()) + list(MODULE_PASSES.values()):
+    setTypes(name, [PassManager])
+
+# Add a pass by name, see FUNCTION_PASSES and MODULE_PASSES
+def PassManager_addPass(self, name:str):
+    getattr(_lib, FUNCTION_PASSES.get(name) or MODULE_PASSES[name])(self)
+PassManager.addPass = PassManager_addPass
+
+#
+# Memory Buffers
+#
+
+MemoryBuffer.wrapDestructor("LLVMDisposeMemoryBuffer")
+
+MemoryBuffer.wrapInstanceProp("start", "LLVMGetBufferStart", None, c_void_p)
+MemoryBuffer.wrapInstanceProp("size", "LLVMGetBufferSize", None, c_size_t)
+
+# A view of the buffer's contents, only valid as long as the buffer is alive
+def MemoryBuffer_view(self) -> memoryview:
+    if self.size == 0: return memoryview(b"")
+    return memoryview((c_char * self.size).from_address(self.start)).cast("B")
+MemoryBuffer.view = MemoryBuffer_view
+
+def MemoryBuffer_toBytes(self) -> bytes:
+    if self.size == 0: return b""
+    return string_at(self.start, self.size)
+MemoryBuffer.toBytes = MemoryBuffer_toBytes
+
 #
 # Target Data
 #
@@ -655,3 +1017,195 @@ class Visibility:
     protected = 2
 
 Value.wrapInstanceProp("visibility", "LLVMGetVisibility", "LLVMSetVisibility", c_uint)
+
+#
+# Execution and code generation
+#
+
+# The llvm target of each machine, as reported by platform.machine()
+NATIVE_TARGETS = {
+    "x86_64": "X86", "AMD64": "X86", "i386": "X86", "i686": "X86",
+    "aarch64": "AArch64", "arm64": "AArch64",
+    "armv7l": "ARM", "armv6l": "ARM",
+    "ppc64": "PowerPC", "ppc64le": "PowerPC",
+}
+
+_native_target_initialized = False
+
+# Initialise the native target, so that modules can be compiled and executed in
+# process. The C API's LLVMInitializeNativeTarget is inline and not part of
+# the library, so the target is picked by machine instead.
+# Raises a TargetError if the native target is unavailable.
+def initializeNativeTarget():
+    global _native_target_initialized
+    if _native_target_initialized: return
+
+    target = NATIVE_TARGETS.get(platform.machine())
+    if target is None:
+        raise TargetError("No llvm target for {}".format(platform.machine()))
+
+    try:
+        _lib.LLVMLinkInMCJIT()
+        for component in ["TargetInfo", "Target", "TargetMC", "AsmPrinter"]:
+            getattr(_lib, "LLVMInitialize{}{}".format(target, component))()
+    except AttributeError as e:
+        raise TargetError("llvm {} lacks support for the native target: {}".format(LLVM_VERSION, e))
+
+    _native_target_initialized = True
+
+class CodeModel:
+    Default = 0
+    JITDefault = 1
+    Small = 2
+    Kernel = 3
+    Medium = 4
+    Large = 5
+
+class MCJITCompilerOptions(Structure):
+    _fields_ = [
+        ("OptLevel", c_uint),
+        ("CodeModel", c_uint),
+        ("NoFramePointerElim", c_bool),
+        ("EnableFastISel", c_bool),
+        ("MCJMM", c_void_p),
+    ]
+
+setTypes("LLVMInitializeMCJITCompilerOptions", [POINTER(MCJITCompilerOptions), c_size_t])
+setTypes("LLVMCreateMCJITCompilerForModule",
+    [POINTER(ExecutionEngine), Module, POINTER(MCJITCompilerOptions), c_size_t, POINTER(c_char_p)], c_bool)
+
+# Create an execution engine for a module. The engine takes ownership of the
+# module, which has to be taken back with removeModule before the engine is
+# disposed. If creation fails, the module is gone.
+@logged("forModule", "LLVMCreateMCJITCompilerForModule")
+def ExecutionEngine_forModule(cls, module:Module, opt_level:int = 0):
+    initializeNativeTarget()
+
+    options = MCJITCompilerOptions()
+    _lib.LLVMInitializeMCJITCompilerOptions(byref(options), sizeof(options))
+    options.OptLevel = opt_level
+
+    engine = cls()
+    error_msg = c_char_p()
+    if _lib.LLVMCreateMCJITCompilerForModule(byref(engine), module,
+            byref(options), sizeof(options), byref(error_msg)):
+        message = error_msg.value.decode("UTF-8")
+        disposeError(error_msg)
+
+        # The module was disposed along with the failed engine
+        module.value = None
+        raise ExecutionEngineError(message)
+
+    engine.constructor_name = cls.__name__ + ".forModule"
+    engine.constructor_args = (module, opt_level)
+    return engine
+ExecutionEngine.forModule = classmethod(ExecutionEngine_forModule)
+
+ExecutionEngine.wrapDestructor("LLVMDisposeExecutionEngine")
+
+setTypes("LLVMRemoveModule", [ExecutionEngine, Module, POINTER(c_void_p), POINTER(c_char_p)], c_bool)
+
+# Take back ownership of a module from the engine. The module handed back is
+# the one given, so it is left unwrapped: a second Module would dispose it.
+@logged("removeModule", "LLVMRemoveModule", False)
+def ExecutionEngine_removeModule(self, module:Module):
+    out_module = c_void_p()
+    error_msg = c_char_p()
+
+    if _lib.LLVMRemoveModule(self, module, byref(out_module), byref(error_msg)):
+        message = error_msg.value.decode("UTF-8")
+        disposeError(error_msg)
+
+        raise ExecutionEngineError(message)
+ExecutionEngine.removeModule = ExecutionEngine_removeModule
+
+ExecutionEngine.wrapInstanceFunc("runStaticConstructors", "LLVMRunStaticConstructors")
+ExecutionEngine.wrapInstanceFunc("runStaticDestructors", "LLVMRunStaticDestructors")
+
+setTypes("LLVMRunFunctionAsMain",
+    [ExecutionEngine, FunctionValue, c_uint, POINTER(c_char_p), POINTER(c_char_p)], c_int)
+
+# Run a function as the main function of a program, returns its exit code
+@logged("runFunctionAsMain", "LLVMRunFunctionAsMain", False)
+def ExecutionEngine_runFunctionAsMain(self, function:FunctionValue, args:[str] = []):
+    argv = (c_char_p * (len(args) + 1))(*[arg.encode("UTF-8") for arg in args])
+    envp = (c_char_p * 1)()
+    return _lib.LLVMRunFunctionAsMain(self, function, len(args), argv, envp)
+ExecutionEngine.runFunctionAsMain = ExecutionEngine_runFunctionAsMain
+
+# The target triple of the machine we are running on
+setTypes("LLVMGetDefaultTargetTriple", [], POINTER(c_char))
+
+def getDefaultTargetTriple() -> str:
+    triple = _lib.LLVMGetDefaultTargetTriple()
+    value = string_at(triple).decode("UTF-8")
+    disposeError(cast(triple, c_char_p))
+    return value
+
+setTypes("LLVMGetTargetFromTriple", [c_char_p, POINTER(Target), POINTER(c_char_p)], c_bool)
+
+@logged("fromTriple", "LLVMGetTargetFromTriple")
+def Target_fromTriple(cls, triple:str):
+    target = cls()
+    error_msg = c_char_p()
+
+    if _lib.LLVMGetTargetFromTriple(triple.encode("UTF-8"), byref(target), byref(error_msg)):
+        message = error_msg.value.decode("UTF-8")
+        disposeError(error_msg)
+
+        raise TargetError(message)
+
+    target.constructor_name = cls.__name__ + ".fromTriple"
+    target.constructor_args = (triple,)
+    return target
+Target.fromTriple = classmethod(Target_fromTriple)
+
+class CodeGenOptLevel:
+    Nothing = 0
+    Less = 1
+    Default = 2
+    Aggressive = 3
+
+class RelocMode:
+    Default = 0
+    Static = 1
+    PIC = 2
+    DynamicNoPic = 3
+
+class CodeGenFileType:
+    AssemblyFile = 0
+    ObjectFile = 1
+
+TargetMachine.wrapConstructor("new", "LLVMCreateTargetMachine",
+    [Target, c_char_p, c_char_p, c_char_p, c_uint, c_uint, c_uint])
+TargetMachine.wrapDestructor("LLVMDisposeTargetMachine")
+
+# Create a target machine for the machine we are running on. Code is position
+# independent, as system linkers may default to position independent
+# executables.
+def TargetMachine_native(cls, opt_level:int = CodeGenOptLevel.Default):
+    initializeNativeTarget()
+
+    triple = getDefaultTargetTriple()
+    machine = cls.new(Target.fromTriple(triple), triple, "", "",
+                      opt_level, RelocMode.PIC, CodeModel.Default)
+    machine.triple = triple
+    return machine
+TargetMachine.native = classmethod(TargetMachine_native)
+
+setTypes("LLVMTargetMachineEmitToFile",
+    [TargetMachine, Module, c_char_p, c_uint, POINTER(c_char_p)], c_bool)
+
+# Generate code for a module, written to a file
+@logged("emitToFile", "LLVMTargetMachineEmitToFile", False)
+def TargetMachine_emitToFile(self, module:Module, path:str, file_type:int = CodeGenFileType.ObjectFile):
+    error_msg = c_char_p()
+
+    # LLVMTargetMachineEmitToFile takes a mutable path
+    path = create_string_buffer(path.encode("UTF-8"))
+    if _lib.LLVMTargetMachineEmitToFile(self, module, cast(path, c_char_p), file_type, byref(error_msg)):
+        message = error_msg.value.decode("UTF-8")
+        disposeError(error_msg)
+
+        raise TargetError(message)
+TargetMachine.emitToFile = TargetMachine_emitToFile
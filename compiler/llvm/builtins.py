@@ -7,9 +7,6 @@ from .. import lekvar
 from . import bindings as llvm
 
 def builtins(logger = logging.getLogger()):
-    global printf
-    printf = None
-
     string = LLVMType("String")
     size = LLVMType("Int64")
     ints = [
@@ -73,7 +70,7 @@ def builtins(logger = logging.getLogger()):
     for int_t in ints:
         for float_t in floats:
             name = int_t.name + "To" + float_t.name
-            wrap = partial(llvmInstructionWrapper, llvm.Builder.iToF, args_after=[float_t.emitType()])
+            wrap = partial(llvmInstructionWrapper, llvm.Builder.iToF, args_after=[float_t])
             function = LLVMFunction(name, [int_t], float_t, wrap)
             builtin_objects.append(function)
 
@@ -81,7 +78,7 @@ def builtins(logger = logging.getLogger()):
     for float_t in floats:
         for int_t in ints:
             name = float_t.name + "To" + int_t.name
-            wrap = partial(llvmInstructionWrapper, llvm.Builder.fToI, args_after=[int_t.emitType()])
+            wrap = partial(llvmInstructionWrapper, llvm.Builder.fToI, args_after=[int_t])
             function = LLVMFunction(name, [float_t], int_t, wrap)
             builtin_objects.append(function)
 
@@ -98,13 +95,19 @@ def builtins(logger = logging.getLogger()):
     builtin_objects.append(LLVMFunction("ptrOffset", [void, size], void, llvmOffsetWrapper))
 
     module = lekvar.Module("_builtins", builtin_objects)
-    module.verify()
+    # Backend builtins are only resolved through targeting, so none of them
+    # would be verified on demand
+    with lekvar.State.verifyingAll():
+        module.verify()
     return module
 
+# Types among the extra arguments are emitted along with the instruction, as
+# llvm types only exist within the session
 def llvmInstructionWrapper(instruction, self, args_before = [], args_after = []):
     entry = self.llvm_value.appendBlock("")
 
     with State.blockScope(entry):
+        args_after = [arg.emitType() if isinstance(arg, LLVMType) else arg for arg in args_after]
         args = [self.llvm_value.getParam(i) for i in range(len(self.type.arguments))]
         arguments = [State.builder] + args_before + args + args_after + [""]
         return_value = instruction(*arguments)
@@ -134,11 +137,10 @@ PRINTF_MAP = {
 }
 
 def llvmPrintfWrapper(type, self):
-    global printf
-
-    if printf is None:
-        func_type = llvm.Function.new(LLVMType("Int32").emitType(), [LLVMType("String").emitType()], True)
-        printf = State.module.addFunction("printf", func_type)
+    # printf is declared once per module
+    if State.printf is None:
+        func_type = functionType(LLVMType("Int32").emitType(), [LLVMType("String").emitType()], True)
+        State.printf = State.module.addFunction("printf", func_type)
     entry = self.llvm_value.appendBlock("")
 
     with State.blockScope(entry):
@@ -147,7 +149,7 @@ def llvmPrintfWrapper(type, self):
 
         value = self.llvm_value.getParam(0)
 
-        State.builder.call(printf, [fmt_string, value], "")
+        State.builder.call(State.printf, [fmt_string, value], "")
         State.builder.retVoid()
 
 #
@@ -178,34 +180,36 @@ class LLVMType(lekvar.Type, lekvar.BoundObject):
                 return True
         return False
 
+    def resolveNominal(self):
+        return (LLVMType, self.name)
+
     def __repr__(self):
         return "{}<{}>".format(self.__class__.__name__, self.name)
 
     # Emission
 
-    LLVM_MAP = None
-
-    def resetLocalEmission(self):
+    # Types are created in the context of the session, see util.py
+    LLVM_MAP = {
+        "String": lambda: pointerType(intType(8)),
+        "Bool": lambda: intType(1),
+        "Int8": lambda: intType(8),
+        "Int16": lambda: intType(16),
+        "Int32": lambda: intType(32),
+        "Int64": lambda: intType(64),
+        "Int128": lambda: intType(128),
+        "Float16": halfType,
+        "Float32": floatType,
+        "Float64": doubleType,
+    }
+
+    def emissionOwner(self):
         return None
 
     def emit(self):
         pass
 
     def emitType(self):
-        if LLVMType.LLVM_MAP is None:
-            LLVMType.LLVM_MAP = {
-                "String": llvm.Pointer.new(llvm.Int.new(8), 0),
-                "Bool": llvm.Int.new(1),
-                "Int8": llvm.Int.new(8),
-                "Int16": llvm.Int.new(16),
-                "Int32": llvm.Int.new(32),
-                "Int64": llvm.Int.new(64),
-                "Int128": llvm.Int.new(128),
-                "Float16": llvm.Float.half(),
-                "Float32": llvm.Float.float(),
-                "Float64": llvm.Float.double(),
-            }
-        return LLVMType.LLVM_MAP[self.name]
+        return LLVMType.LLVM_MAP[self.name]()
 
 class LLVMFunction(lekvar.ExternalFunction):
     generator = None
@@ -220,7 +224,7 @@ class LLVMFunction(lekvar.ExternalFunction):
 
     # Emission
 
-    def resetLocalEmission(self):
+    def emissionOwner(self):
         return None
 
     def emit(self):
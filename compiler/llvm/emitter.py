@@ -1,5 +1,5 @@
 from abc import abstractmethod as abstract
-from itertools import chain
+from collections import deque
 from contextlib import contextmanager, ExitStack
 
 from .. import lekvar
@@ -9,14 +9,36 @@ from .state import State
 from .util import *
 from . import bindings as llvm
 
+# Emission state, which is kept per emission scope for the objects belonging
+# to one, see Object_resetEmission
+class EmissionAttribute:
+    def __init__(self, name:str):
+        self.name = name
+
+    def __get__(self, object, owner):
+        if object is None: return self
+
+        values = State.emissionValues(object)
+        if values is None:
+            return object.__dict__.get(self.name)
+        return values.get(self.name)
+
+    def __set__(self, object, value):
+        values = State.emissionValues(object)
+        if values is None:
+            object.__dict__[self.name] = value
+        else:
+            values[self.name] = value
+
 # Abstract extensions
 
-lekvar.BoundObject.llvm_value = None
+lekvar.BoundObject.llvm_value = EmissionAttribute("llvm_value")
 
 # Extension abstract methods apparently don't work
 
+# The object whose emission state is reset along with this object
 @patch
-def Object_resetLocalEmission(self):
+def Object_emissionOwner(self):
     raise InternalError("Not Implemented")
 
 @patch
@@ -50,33 +72,47 @@ def Type_emitInstanceAssignment(self, value:lekvar.Object, type:lekvar.Type) ->
 # class Object
 #
 
-# Context for resetting the emission of a value
+# Context for resetting the emission of a value, and everything belonging to it
 @patch
 def Object_resetEmission(self):
-    cache = set()
-    stack = ExitStack()
-    objects = iter([self])
+    return State.emissionScope(self.emissionDomain())
+
+# The objects belonging to the emission of a value, by id.
+# The walk is only repeated for new targetings when it passes forward objects.
+@patch
+def Object_emissionDomain(self):
+    generation = lekvar.State.targeting_generation
+    entry = State.emission_domains.get(id(self))
+    if entry is not None and entry[0] is self and entry[2] in (None, generation):
+        return entry[1]
 
-    while True:
-        obj = next(objects, None)
-        if obj is None: break
-        if obj in cache: continue
+    State.emission_forward = False
+    domain = {}
+    visited = {}
+    objects = deque([self])
 
-        cache.add(obj)
-        local_resets = obj.resetLocalEmission()
-        if local_resets is not None:
-            stack.enter_context(local_resets)
-        objects = chain(objects, obj.gatherEmissionResets())
+    while len(objects) > 0:
+        obj = objects.popleft()
+        if id(obj) in visited: continue
+        # Keep the objects alive, so that their ids are not reused
+        visited[id(obj)] = obj
 
-    return stack
+        owner = obj.emissionOwner()
+        if owner is not None:
+            domain[id(owner)] = owner
+        objects.extend(obj.gatherEmissionResets())
+
+    dependency = generation if State.emission_forward else None
+    State.emission_domains[id(self)] = (self, domain, dependency)
+    return domain
 
 #
 # class Link
 #
 
 @patch
-def Link_resetLocalEmission(self):
-    return self.value.resetLocalEmission()
+def Link_emissionOwner(self):
+    return self.value.emissionOwner()
 
 @patch
 def Link_gatherEmissionResets(self):
@@ -150,11 +186,11 @@ def emitConstant(value):
     if isinstance(value, str):
         return State.builder.globalString(value, "")
     elif isinstance(value, bool):
-        return llvm.Value.constInt(llvm.Int.new(1), value, False)
+        return llvm.Value.constInt(intType(1), value, False)
     elif isinstance(value, int):
-        return llvm.Value.constInt(llvm.Int.new(64), value, False)
+        return llvm.Value.constInt(intType(64), value, False)
     elif isinstance(value, float):
-        return llvm.Value.constFloat(llvm.Float.double(), value)
+        return llvm.Value.constFloat(doubleType(), value)
     elif isinstance(value, dict) and len(value) == 1 and "value" in value:
         return emitConstant(value["value"].data)
     else:
@@ -168,12 +204,8 @@ lekvar.Variable.llvm_context_index = -1
 lekvar.Variable.llvm_self_index = -1
 
 @patch
-@contextmanager
-def Variable_resetLocalEmission(self):
-    old_value = self.llvm_value
-    self.llvm_value = None
-    yield
-    self.llvm_value = old_value
+def Variable_emissionOwner(self):
+    return self
 
 @patch
 def Variable_emit(self):
@@ -249,7 +281,7 @@ def Module_emit(self):
     if self.llvm_value is not None: return
     self.llvm_value = State.main
 
-    for child in self.context:
+    for child in self.context.verifiedChildren():
         child.emit()
 
     State.addMainInstructions(self.main)
@@ -277,14 +309,14 @@ def Call_emitValue(self, type):
         context = self.function.emitContext()
 
     if context is not None:
-        arguments = [State.builder.cast(context, llvm.Type.void_p(), "")]
+        arguments = [State.builder.cast(context, voidPointerType(), "")]
     else:
         arguments = []
 
     # Hack, for now
     scope = ExitStack()
     if isinstance(self.function, lekvar.ForwardTarget):
-        scope = self.function.target()
+        scope = self.function.instantiate()
 
     # TODO: Emit arguments before function
     with scope:
@@ -331,7 +363,7 @@ def Return_emitValue(self, type):
 # class Context
 #
 
-lekvar.Context.llvm_type = None
+lekvar.Context.llvm_type = EmissionAttribute("llvm_type")
 
 @patch
 def Context_gatherEmissionResets(self):
@@ -339,12 +371,8 @@ def Context_gatherEmissionResets(self):
         yield child
 
 @patch
-@contextmanager
-def Context_resetLocalEmission(self):
-    old_type = self.llvm_type
-    self.llvm_type = None
-    yield
-    self.llvm_type = old_type
+def Context_emissionOwner(self):
+    return self
 
 @patch
 def Context_emitType(self):
@@ -359,7 +387,7 @@ def Context_emitType(self):
         self_value.llvm_context_index = index
         index += 1
         self_type = self_value.resolveType().emitType()
-        types.append(llvm.Pointer.new(self_type, 0))
+        types.append(pointerType(self_type))
 
     for child in self.children.values():
         if child.name == "self": continue
@@ -370,9 +398,9 @@ def Context_emitType(self):
         types.append(child.resolveType().emitType())
 
     if len(types) == 0:
-        types = [llvm.Pointer.void_p()]
+        types = [voidPointerType()]
 
-    self.llvm_type = llvm.Struct.newAnonym(types, False)
+    self.llvm_type = structType(types)
 
     return self.llvm_type
 
@@ -382,17 +410,17 @@ def Context_emitType(self):
 
 @patch
 def ForwardObject_gatherEmissionResets(self):
+    State.emission_forward = True
     if self.target is None:
         return []
-    assert self.target is not None
     return self.target.gatherEmissionResets()
 
 @patch
-def ForwardObject_resetLocalEmission(self):
+def ForwardObject_emissionOwner(self):
+    State.emission_forward = True
     if self.target is None:
-        return
-    assert self.target is not None
-    return self.target.resetLocalEmission()
+        return None
+    return self.target.emissionOwner()
 
 @patch
 def ForwardObject_emit(self):
@@ -433,7 +461,7 @@ def ForwardTarget_emitValue(self, type):
         self.value.emitted_cache = {}
     cache = self.value.emitted_cache
 
-    with self.target():
+    with self.instantiate():
         #TODO: Make this generic, currently specific for Function
         # Maybe turn the entire emitter into a sequenced collection of generators,
         # like forward object targeting, which would also allow for multithreading
@@ -450,26 +478,22 @@ def ForwardTarget_emitValue(self, type):
 
 @patch
 def ForwardTarget_emitContext(self):
-    with self.target():
+    with self.instantiate():
         return self.value.emitContext()
 
 #
 # class ClosedLink
 #
 
-lekvar.ClosedLink.llvm_value = None
+lekvar.ClosedLink.llvm_value = EmissionAttribute("llvm_value")
 
 @patch
 def ClosedLink_gatherEmissionResets(self):
     return []
 
 @patch
-@contextmanager
-def ClosedLink_resetLocalEmission(self):
-    old_value = self.llvm_value
-    self.llvm_value = None
-    yield
-    self.llvm_value = old_value
+def ClosedLink_emissionOwner(self):
+    return self
 
 @patch
 def ClosedLink_emitValue(self, type):
@@ -525,7 +549,7 @@ def ClosedTarget_emitType(self):
 
 lekvar.Function.llvm_return = None
 lekvar.Function.llvm_context = None
-lekvar.Function.llvm_closure_type = None
+lekvar.Function.llvm_closure_type = EmissionAttribute("llvm_closure_type")
 lekvar.Function.emitted_cache = None
 
 @patch
@@ -539,15 +563,8 @@ def Function_gatherEmissionResets(self):
         yield child
 
 @patch
-@contextmanager
-def Function_resetLocalEmission(self):
-    old_value = self.llvm_value
-    self.llvm_value = None
-    old_closure_type = self.llvm_closure_type
-    self.llvm_closure_type = None
-    yield
-    self.llvm_value = old_value
-    self.llvm_closure_type = old_closure_type
+def Function_emissionOwner(self):
+    return self
 
 @patch
 def Function_emit(self):
@@ -617,7 +634,7 @@ def Function_emitInstructions(self):
 @patch
 def Function_emitEntry(self):
     context_param = self.llvm_value.getParam(0)
-    context_type = llvm.Pointer.new(self.llvm_closure_type, 0)
+    context_type = pointerType(self.llvm_closure_type)
     self.llvm_context = State.builder.cast(context_param, context_type, "context")
 
 @patch
@@ -665,7 +682,7 @@ def Function_emitContext(self):
 
         return context
 
-    return llvm.Value.null(llvm.Pointer.new(closure_type, 0))
+    return llvm.Value.null(pointerType(closure_type))
 
 #
 # Contructor
@@ -711,17 +728,17 @@ def FunctionType_gatherEmissionResets(self):
         yield type
 
 @patch
-def FunctionType_resetLocalEmission(self):
+def FunctionType_emissionOwner(self):
     return None
 
 @patch
 def FunctionType_emitType(self):
-    return llvm.Pointer.new(self.emitFunctionType(), 0)
+    return pointerType(self.emitFunctionType())
 
 @patch
 def FunctionType_emitFunctionType(self, has_context = True):
     if has_context:
-        arguments = [llvm.Type.void_p()]
+        arguments = [voidPointerType()]
     else:
         arguments = []
 
@@ -730,9 +747,9 @@ def FunctionType_emitFunctionType(self, has_context = True):
     if self.return_type is not None:
         return_type = self.return_type.emitType()
     else:
-        return_type = llvm.Type.void()
+        return_type = voidType()
 
-    return llvm.Function.new(return_type, arguments, False)
+    return functionType(return_type, arguments)
 
 #
 # class FunctionInstance
@@ -748,7 +765,7 @@ def FunctionInstance_emitAssignment(self):
 
 @patch
 def FunctionInstance_emitContext(self):
-    return llvm.Value.null(llvm.Type.void_p())
+    return llvm.Value.null(voidPointerType())
 
 #
 # class ExternalFunction
@@ -780,7 +797,7 @@ def Method_gatherEmissionResets(self):
     yield self.overload_context
 
 @patch
-def Method_resetLocalEmission(self):
+def Method_emissionOwner(self):
     return None
 
 @patch
@@ -842,14 +859,14 @@ def MethodType_gatherEmissionResets(self):
         yield fn_type
 
 @patch
-def MethodType_resetLocalEmission(self):
+def MethodType_emissionOwner(self):
     return None
 
 @patch
 def MethodType_emitType(self):
     if self.llvm_type is None:
         fn_types = [type.emitType() for type in self.used_overload_types]
-        self.llvm_type = llvm.Struct.newAnonym(fn_types, False)
+        self.llvm_type = structType(fn_types)
     return self.llvm_type
 
 #
@@ -873,13 +890,13 @@ def MethodInstance_emitAssignment(self):
 
 @patch
 def MethodInstance_emitContext(self):
-    return llvm.Value.null(llvm.Type.void_p())
+    return llvm.Value.null(voidPointerType())
 
 #
 # class Class
 #
 
-lekvar.Class.llvm_type = None
+lekvar.Class.llvm_type = EmissionAttribute("llvm_type")
 
 @patch
 def Class_gatherEmissionResets(self):
@@ -889,19 +906,15 @@ def Class_gatherEmissionResets(self):
         yield child
 
 @patch
-@contextmanager
-def Class_resetLocalEmission(self):
-    old_type = self.llvm_type
-    self.llvm_type = None
-    yield
-    self.llvm_type
+def Class_emissionOwner(self):
+    return self
 
 @patch
 def Class_emit(self):
     if self.constructor is not None:
         self.constructor.emit()
 
-    for child in self.instance_context:
+    for child in self.instance_context.verifiedChildren():
         child.emit()
 
 @patch
@@ -940,7 +953,7 @@ def Class_emitType(self):
                 child.llvm_self_index = len(var_types)
                 var_types.append(child.type.emitType())
 
-        self.llvm_type = llvm.Struct.newAnonym(var_types, False)
+        self.llvm_type = structType(var_types)
     return self.llvm_type
 
 @patch
@@ -964,7 +977,7 @@ def Reference_emitValue(self, type):
 
 @patch
 def Reference_emitType(self):
-    return llvm.Pointer.new(referenceType(self.value.emitType()), 0)
+    return pointerType(referenceType(self.value.emitType()))
 
 @patch
 def Reference_emitInstanceValue(self, value, type):
@@ -1075,14 +1088,14 @@ def VoidType_emit(self):
 
 @patch
 def VoidType_emitType(self):
-    return llvm.Type.void_p()
+    return voidPointerType()
 
 @patch
 def VoidType_emitInstanceValue(self, value, type):
     value = value.emitValue(type)
     if isinstance(type.resolveValue(), lekvar.VoidType):
         return value
-    value = State.builder.cast(value, llvm.Pointer.new(type.emitType(), 0), "")
+    value = State.builder.cast(value, pointerType(type.emitType()), "")
     return State.builder.load(value, "")
 
 @patch
@@ -1091,4 +1104,4 @@ def VoidType_emitInstanceAssignment(self, value, type):
     if isinstance(type.resolveValue(), lekvar.VoidType):
         return value
     value = State.builder.load(value, "")
-    return State.builder.cast(value, llvm.Pointer.new(type.emitType(), 0), "")
+    return State.builder.cast(value, pointerType(type.emitType()), "")
@@ -0,0 +1,119 @@
+import logging
+from time import perf_counter
+
+from . import bindings
+
+# Optimisation pipelines
+#
+# By default modules are optimised by the standard pipeline of their -O level.
+# Instead, an explicit pipeline of passes can be given, by name. Function
+# passes run over every function through a function pass manager, module
+# passes over the whole module. Consecutive passes of the same kind share a
+# pass manager.
+#
+# When timed, every pass runs on its own and its wall time, along with the
+# number of instructions before and after it, is logged.
+
+# Named pipelines
+PIPELINES = {
+    "basic": ["mem2reg", "instcombine", "reassociate", "gvn", "simplifycfg"],
+    "standard": ["mem2reg", "early-cse", "instcombine", "simplifycfg",
+                 "inline", "functionattrs", "sccp", "instcombine", "jump-threading",
+                 "correlated-propagation", "simplifycfg", "reassociate",
+                 "loop-rotate", "licm", "indvars", "loop-deletion", "loop-unroll",
+                 "gvn", "memcpyopt", "dse", "adce", "simplifycfg", "instcombine",
+                 "globaldce", "constmerge"],
+}
+
+# The pipeline to optimise with, None for that of the -O level
+pipeline = None
+# Whether to log the time taken by each pass
+timed = False
+
+# Parse a pipeline, given either by name or as a comma separated list of passes
+def parse(spec:str) -> [str]:
+    if spec in PIPELINES:
+        return PIPELINES[spec]
+
+    passes = [name.strip() for name in spec.split(",") if name.strip()]
+    for name in passes:
+        if name not in bindings.FUNCTION_PASSES and name not in bindings.MODULE_PASSES:
+            raise ValueError("Unknown pass {}, expected one of: {}".format(name,
+                ", ".join(sorted(list(bindings.FUNCTION_PASSES) + list(bindings.MODULE_PASSES)))))
+    return passes
+
+# Optimise a module, returns whether or not it was changed
+def optimise(module:bindings.Module, level:int, size_level:int, logger = logging.getLogger()):
+    logger = logger.getChild("passes")
+    if pipeline is None:
+        return _timed(module, "-O{}".format(level), logger,
+                      lambda: _optimiseLevel(module, level, size_level))
+
+    if timed:
+        start = perf_counter()
+        changed = any([_timed(module, name, logger, lambda: _runStage(module, [name]))
+                       for name in pipeline])
+        logger.info("Pipeline: {:.2f} ms".format((perf_counter() - start) * 1000))
+        return changed
+    return any([_runStage(module, stage) for stage in _stages(pipeline)])
+
+def _optimiseLevel(module:bindings.Module, level:int, size_level:int):
+    manager = bindings.PassManager.new()
+    try:
+        manager.setOptLevel(level)
+        manager.setOptSizeLevel(size_level)
+        return bool(manager.run(module))
+    finally:
+        manager.dispose()
+
+# Split a pipeline into runs of passes of the same kind
+def _stages(passes:[str]) -> [[str]]:
+    stages = []
+    for name in passes:
+        if stages and _isFunctionPass(stages[-1][0]) == _isFunctionPass(name):
+            stages[-1].append(name)
+        else:
+            stages.append([name])
+    return stages
+
+def _isFunctionPass(name:str):
+    return name in bindings.FUNCTION_PASSES
+
+# Run passes of the same kind. Managers are disposed as soon as they are done,
+# a function pass manager refers to its module so mustn't outlive it.
+def _runStage(module:bindings.Module, passes:[str]):
+    if not _isFunctionPass(passes[0]):
+        manager = bindings.PassManager.new()
+        try:
+            for name in passes:
+                manager.addPass(name)
+            return bool(manager.run(module))
+        finally:
+            manager.dispose()
+
+    manager = bindings.FunctionPassManager.forModule(module)
+    try:
+        for name in passes:
+            manager.addPass(name)
+
+        changed = bool(manager.initialize())
+        for function in module.functions():
+            changed = bool(manager.run(function)) or changed
+        return bool(manager.finalize()) or changed
+    finally:
+        manager.dispose()
+
+# Run an optimisation, logging its time and effect if timed
+def _timed(module:bindings.Module, name:str, logger:logging.Logger, optimisation):
+    if not timed:
+        return optimisation()
+
+    before = module.countInstructions()
+    start = perf_counter()
+    changed = optimisation()
+    elapsed = perf_counter() - start
+    after = module.countInstructions()
+
+    logger.info("{}: {:.2f} ms, {} -> {} instructions".format(
+        name, elapsed * 1000, before, after))
+    return changed
@@ -1,40 +1,73 @@
 import logging
-from contextlib import contextmanager
+from contextlib import contextmanager, ExitStack
 
 from .. import lekvar
+from .. import session
+from ..session import SessionState
 
 from . import bindings as llvm
 
-# Global state for the llvm emitter
+# Global state for the llvm emitter, kept per compilation session
 # Wraps a single llvm module
-class State:
+class State(metaclass=SessionState):
+    logger = None
+    self = None
+
+    # Sessions emit in an llvm context of their own, so that they can do so
+    # concurrently
+    context = None
+    builder = None
+    module = None
+    target_data = None
+    main = None
+    # The declaration of printf in the module, once used by the builtins
+    printf = None
+
+    # Interned types, see util.py
+    types = {}
+
+    # Emission scopes, see emissionScope
+    emission_frames = []
+    emission_domains = None
+    emission_forward = False
+
     @classmethod
     @contextmanager
     def begin(cls, logger:logging.Logger):
         cls.logger = logger
 
-        # Dirty hack for circular import. Hook this state into the llvm bindigns
-        llvm.State = cls
-
-        cls.self = None
-        cls.builder = llvm.Builder.new()
-        cls.module = llvm.Module.fromName("")
-        cls.target_data = llvm.TargetData.new("")
-
-        main_type = llvm.Function.new(llvm.Int.new(32), [], False)
-        cls.main = cls.module.addFunction("main", main_type)
-        cls.main.appendBlock("entry")
-        main_exit = cls.main.appendBlock("exit")
-
-        yield
-
-        # add a goto exit for the last block
-        with cls.blockScope(cls.main.getLastBlock().getPrevious()):
-            State.builder.br(main_exit)
-
-        with cls.blockScope(main_exit):
-            return_value = llvm.Value.constInt(llvm.Int.new(32), 0, False)
-            cls.builder.ret(return_value)
+        # Log the calls of the llvm bindings, which needs their instrumented
+        # flavour for the duration of the session
+        session.current().logger = logger
+        with ExitStack() as stack:
+            if logger.isEnabledFor(logging.DEBUG):
+                stack.enter_context(llvm.instrumenting())
+
+            cls.self = None
+            cls.emission_frames = []
+            cls.emission_domains = {}
+            cls.emission_forward = False
+            cls.types = {}
+            cls.printf = None
+            cls.context = llvm.Context.new()
+            cls.builder = llvm.Builder.inContext(cls.context)
+            cls.module = llvm.Module.inContext("", cls.context)
+            cls.target_data = llvm.TargetData.new("")
+
+            main_type = llvm.Function.new(llvm.Int.newInContext(cls.context, 32), [], False)
+            cls.main = cls.module.addFunction("main", main_type)
+            cls.main.appendBlock("entry")
+            main_exit = cls.main.appendBlock("exit")
+
+            yield
+
+            # add a goto exit for the last block
+            with cls.blockScope(cls.main.getLastBlock().getPrevious()):
+                State.builder.br(main_exit)
+
+            with cls.blockScope(main_exit):
+                return_value = llvm.Value.constInt(llvm.Int.newInContext(cls.context, 32), 0, False)
+                cls.builder.ret(return_value)
 
     @classmethod
     def addMainInstructions(cls, instructions:[lekvar.Object]):
@@ -58,6 +91,26 @@ class State:
         yield
         cls.self = previous_self
 
+    # Emit objects afresh within the context. The emission state of the objects
+    # in the domain, by id, starts out empty and is discarded afterwards.
+    @classmethod
+    @contextmanager
+    def emissionScope(cls, domain:{int: lekvar.Object}):
+        cls.emission_frames.append((domain, {}))
+        try:
+            yield
+        finally:
+            cls.emission_frames.pop()
+
+    # Get the emission state of an object in the innermost emission scope it
+    # belongs to. Returns None if it does not belong to any.
+    @classmethod
+    def emissionValues(cls, object:lekvar.Object):
+        for domain, values in reversed(cls.emission_frames):
+            if domain.get(id(object)) is object:
+                return values.setdefault(id(object), {})
+        return None
+
     # Emmit an allocation as an instruction
     # Enforces allocation to happen early
     @classmethod
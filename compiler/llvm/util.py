@@ -1,10 +1,55 @@
+from .state import State
 from . import bindings as llvm
 
 from ..backend.util import *
 
+# Interned llvm types
+#
+# llvm uniques types by their structure, but getting one still takes a call
+# through the bindings for the type itself and for each of its elements. Types
+# are therefore interned per module, keyed by their elements, which are
+# interned in turn. Each distinct type is only created once, in the context of
+# the session.
+
+def _intern(key:tuple, make):
+    type = State.types.get(key)
+    if type is None:
+        type = State.types[key] = make()
+    return type
+
+def intType(bits:int):
+    return _intern(("int", bits), lambda: llvm.Int.newInContext(State.context, bits))
+
+def halfType():
+    return _intern(("half",), lambda: llvm.Float.halfInContext(State.context))
+
+def floatType():
+    return _intern(("float",), lambda: llvm.Float.floatInContext(State.context))
+
+def doubleType():
+    return _intern(("double",), lambda: llvm.Float.doubleInContext(State.context))
+
+def voidType():
+    return _intern(("void",), lambda: llvm.Type.voidInContext(State.context))
+
+def voidPointerType():
+    return _intern(("void_p",), lambda: pointerType(intType(8)))
+
+def pointerType(type:llvm.Type, address_space = 0):
+    return _intern(("pointer", type.value, address_space),
+                   lambda: llvm.Pointer.new(type, address_space))
+
+def functionType(return_type:llvm.Type, arguments:[llvm.Type], var_arg = False):
+    key = ("function", return_type.value, tuple(argument.value for argument in arguments), var_arg)
+    return _intern(key, lambda: llvm.Function.new(return_type, arguments, var_arg))
+
+def structType(types:[llvm.Type], packed = False):
+    key = ("struct", tuple(type.value for type in types), packed)
+    return _intern(key, lambda: llvm.Struct.newAnonymInContext(State.context, types, packed))
+
 # Create a reference counted type from a normal type
 def referenceType(type):
-    return llvm.Struct.newAnonym([llvm.Type.void_p(), type], False)
+    return structType([voidPointerType(), type])
 
 # Emit a value targeting a specific type
 def emitValue(value, type):
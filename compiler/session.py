@@ -0,0 +1,101 @@
+import threading
+from copy import copy
+from contextlib import contextmanager
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+# Compilation sessions
+#
+# A session holds the global state of a compilation: the state of the
+# verifier, the LLVM module and builder, the interpreter output and the
+# loggers. Separate sessions can be used concurrently, from separate threads or
+# contexts. Each thread starts out with a session of its own, which is used
+# unless another one is begun.
+
+class CompilationSession:
+    # The logger for the bindings of the current backend
+    logger = None
+
+    def __init__(self):
+        self.states = {}
+
+    # Get the values of a state class in this session, by name
+    def state(self, cls) -> {str: object}:
+        state = self.states.get(cls)
+        if state is None:
+            # Defaults are copied, so that mutable ones aren't shared
+            state = {name: copy(value) for name, value in cls._session_defaults.items()}
+            self.states[cls] = state
+        return state
+
+if contextvars is not None:
+    _current = contextvars.ContextVar("compilation_session")
+    _lookup = _current.get
+
+    def _swap(session:CompilationSession):
+        previous = _current.get(None)
+        _current.set(session)
+        return previous
+else:
+    _local = threading.local()
+
+    def _lookup(default):
+        return getattr(_local, "session", default)
+
+    def _swap(session:CompilationSession):
+        previous = getattr(_local, "session", None)
+        _local.session = session
+        return previous
+
+def current() -> CompilationSession:
+    session = _lookup(None)
+    if session is None:
+        session = CompilationSession()
+        _swap(session)
+    return session
+
+# Use a session, a new one by default, within the context
+@contextmanager
+def begin(session:CompilationSession = None):
+    session = session or CompilationSession()
+    previous = _swap(session)
+    try:
+        yield session
+    finally:
+        _swap(previous)
+
+# Metaclass for classes holding global state. The class level attributes of
+# such a class are its defaults, the actual values are kept per session.
+class SessionState(type):
+    def __new__(mcls, name, bases, namespace):
+        defaults = {}
+        for base in reversed(bases):
+            defaults.update(getattr(base, "_session_defaults", {}))
+
+        for attr, value in list(namespace.items()):
+            if not attr.startswith("__") and not hasattr(value, "__get__"):
+                defaults[attr] = namespace.pop(attr)
+        namespace["_session_defaults"] = defaults
+
+        # Each class gets a metaclass of its own, holding its fields
+        fields = {attr: _SessionField(attr) for attr in defaults}
+        meta = type.__new__(type, name + "Session", (mcls,), fields)
+        return type.__new__(meta, name, bases, namespace)
+
+# A session value of a state class
+class _SessionField:
+    def __init__(self, name:str):
+        self.name = name
+
+    def __get__(self, cls, meta = None):
+        if cls is None: return self
+
+        session = _lookup(None) or current()
+        state = session.states.get(cls) or session.state(cls)
+        return state[self.name]
+
+    def __set__(self, cls, value):
+        current().state(cls)[self.name] = value
@@ -1,5 +1,7 @@
 import pytest
 
+from compiler import cache
+
 def pytest_addoption(parser):
     parser.addoption("--valgrind", action="store_true", default=False,
         help="Use valagrind to check for memory leaks in compiled programs")
@@ -14,3 +16,9 @@ def pytest_generate_tests(metafunc):
 
 def pytest_collection_modifyitems(items):
     items[:] = reversed(sorted(items, key=lambda a: a.module.__name__ + a.name))
+
+# Never let tests touch a real cache. Tests of the cache enable it themselves.
+@pytest.fixture(autouse=True)
+def isolated_cache(tmpdir, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_PATH", str(tmpdir.join("cache")))
+    monkeypatch.setattr(cache, "enabled", False)
@@ -1,8 +1,10 @@
+import io
 import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
-from compiler import jam, lekvar, interpreter, errors
+from compiler import jam, lekvar, interpreter, errors, session
 from programs import TEST_FILES
 
 for file in TEST_FILES:
@@ -22,3 +24,43 @@ for file in TEST_FILES:
     globals()["test_interpreter_" + file.name] = test
 
 del test
+
+def test_instantiations():
+    source = io.StringIO("""
+def id(x)
+  return x
+end
+
+puts(id(1))
+puts(id(2))
+puts(id("a"))
+""")
+
+    with lekvar.use(jam, interpreter):
+        assert lekvar.run(source, jam, interpreter) == b"1\n2\na\n"
+    # One per distinct argument type, reused for each call
+    assert lekvar.State.instantiations == 2
+    assert lekvar.State.instantiation_uses > 3
+
+def test_concurrent_sessions():
+    def run(value):
+        source = io.StringIO("""
+def id(x)
+  return x
+end
+
+puts(id({}))
+""".format(value))
+
+        # Every thread starts out with a session of its own
+        with lekvar.use(jam, interpreter):
+            return lekvar.run(source, jam, interpreter)
+
+    with ThreadPoolExecutor(4) as pool:
+        outputs = list(pool.map(run, range(8)))
+    assert outputs == ["{}\n".format(value).encode("UTF-8") for value in range(8)]
+
+    # Sessions can also be switched explicitly
+    with session.begin() as first:
+        assert run(1) == b"1\n"
+    assert session.current() is not first
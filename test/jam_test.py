@@ -1,11 +1,18 @@
+import os
 import sys
 from io import StringIO
+from subprocess import check_output
 
 import pytest
 import logging
 
-from compiler import jam, lekvar, llvm
-from compiler.jam.lexer import Tokens, Lexer
+from compiler import jam, lekvar, llvm, errors, cache, artifacts
+from compiler.jam.lexer import Tokens, Lexer, Node, TREE, START_STATE, _gatherNodes, _characterClasses, _determinize
+from compiler.jam.parser import Parser
+from compiler.jam.source import SourceBuffer
+from compiler.jam.builtins import BUILTINS_PATH
+from programs import TEST_FILES
+from nfa_lexer import NFALexer
 
 def test_lexer():
     test = """# def:end )=
@@ -62,6 +69,284 @@ defend+_- end"""
             assert token is not None
             assert token.type == output
 
+def lexAll(lexer_class, input):
+    if isinstance(input, str):
+        with open(input, "r") as f:
+            return lexAll(lexer_class, f)
+
+    tokens = []
+    lexer = lexer_class(input)
+    try:
+        token = lexer.lex()
+        while token is not None:
+            tokens.append((token.type, token.start, token.end, token.data))
+            token = lexer.lex()
+    except errors.SyntaxError:
+        tokens.append(errors.SyntaxError)
+    return tokens
+
+def test_lexer_dfa():
+    # The determinized lexer must produce the same tokens as the tree it was built from
+    for path in [file.path for file in TEST_FILES] + [BUILTINS_PATH]:
+        assert lexAll(Lexer, path) == lexAll(NFALexer, path)
+
+def test_lexer_restart():
+    # Two nodes linking back to the root on the same character
+    root, first, second = Node(), Node(), Node()
+    root.links += [(first, lambda c: c == "x"), (second, lambda c: c == "x")]
+    first.links.append((root, lambda c: c == " "))
+    second.links.append((root, lambda c: c == " "))
+
+    classes, representatives = _characterClasses(_gatherNodes(root))
+    transitions, accepting = _determinize(root, representatives)
+    state = transitions[START_STATE * len(representatives) + classes["x"]]
+
+    # Determinizing merges the root reached twice into the start state, which
+    # Lexer restarts at, while NFALexer only restarts at a single root
+    assert transitions[state * len(representatives) + classes[" "]] == START_STATE
+    assert first.evaluate(" ") + second.evaluate(" ") == [root, root]
+
+    # Only the tree itself links back to it, so the two never differ in jam
+    assert [node for node in _gatherNodes(TREE) if any(target is TREE for target, condition in node.links)] == [TREE]
+
+def test_token_store():
+    with StringIO("def f(`abc`)") as input:
+        lexer = Lexer(input)
+        tokens = [lexer.lex() for _ in range(4)]
+
+    store = lexer.store
+    assert len(store) == 4
+    assert list(store.types) == [Tokens.def_kwd.value, Tokens.identifier.value,
+                                 Tokens.group_start.value, Tokens.string.value]
+
+    # Handles read through to the store
+    assert [token.start for token in tokens] == [0, 4, 5, 6]
+    assert [token.end for token in tokens] == [3, 5, 6, 11]
+    assert store[1].data == "f"
+    assert store[3].data == "abc"
+
+def test_lexer_long_literal():
+    data = "a\\n" * 100000
+    with StringIO("x = `{0}` \"{0}\"".format(data)) as input:
+        lex = Lexer(input).lex
+
+        assert lex().type == Tokens.identifier
+        assert lex().type == Tokens.assign
+
+        token = lex()
+        assert token.type == Tokens.string
+        assert token.data == data
+
+        token = lex()
+        assert token.type == Tokens.format_string
+        assert token.data == data
+
+        assert lex() is None
+
+SOURCE = "def main()\r\n    puts(`a\r\nb`)\nend\n"
+SOURCE_TRANSLATED = SOURCE.replace("\r\n", "\n")
+
+# Reader only implementing read, like the interactive prompt
+class CharReader:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, n):
+        out, self.data = self.data[:n], self.data[n:]
+        return out or None
+
+def test_source_buffer(tmpdir):
+    path = tmpdir.join("source.jm")
+    path.write_binary(SOURCE.encode("UTF-8"))
+
+    with open(str(path), "r") as input:
+        assert SourceBuffer(input).data == SOURCE_TRANSLATED
+
+    with StringIO(SOURCE_TRANSLATED) as input:
+        assert SourceBuffer(input).data == SOURCE_TRANSLATED
+
+    buffer = SourceBuffer(CharReader(SOURCE_TRANSLATED))
+    assert buffer.data == ""
+    while buffer.fill(): pass
+
+    # Reads are kept apart until all the data is needed
+    assert len(buffer.chunks) == len(buffer) == len(SOURCE_TRANSLATED)
+    assert buffer.slice(3, 11) == SOURCE_TRANSLATED[3:11]
+    assert buffer.chunkAt(5) == (5, SOURCE_TRANSLATED[5])
+    assert buffer.data == SOURCE_TRANSLATED
+    assert buffer.slice(3, 11) == SOURCE_TRANSLATED[3:11]
+
+    # All inputs should lex the same
+    expected = lexAll(Lexer, str(path))
+    assert lexAll(Lexer, StringIO(SOURCE_TRANSLATED)) == expected
+    assert lexAll(Lexer, CharReader(SOURCE_TRANSLATED)) == expected
+
+def parseValue(source):
+    with StringIO(source) as input:
+        return Parser(Lexer(input), logging.getLogger()).parseValue(allow_assign = True)
+
+# Render the grouping of a parsed binary operation
+def grouping(value):
+    if isinstance(value, lekvar.Assignment):
+        return "({} = {})".format(grouping(value.assigned), grouping(value.value))
+    elif isinstance(value, lekvar.Operation):
+        # Global function operations
+        if isinstance(value.called, lekvar.Identifier):
+            lhs, rhs = value.values
+            return "({} {} {})".format(grouping(lhs), value.called.name, grouping(rhs))
+        return "({} {} {})".format(grouping(value.called.object), value.called.name, grouping(value.values[0]))
+    return str(value)
+
+def test_binary_operation_grouping():
+    tests = [
+        ("a + b * c - d", "((a + (b * c)) - d)"),
+        ("a - b - c // d % e", "((a - b) - ((c // d) % e))"),
+        ("a = b || c && d == e + f * g", "(a = ((b || c) && (d == (e + (f * g)))))"),
+        ("a < b != c >= d", "(((a < b) != c) >= d)"),
+        ("a = b = c", "((a = b) = c)"),
+    ]
+
+    for source, expected in tests:
+        assert grouping(parseValue(source)) == expected
+
+def test_long_binary_operation_chain():
+    length = 20000
+    value = parseValue(" + ".join(["a * b"] * length) + " == c")
+
+    assert value.called.name == "=="
+
+    # Additions are grouped left to right, each with a multiplication on the rhs
+    value = value.called.object
+    for _ in range(length - 1):
+        assert value.called.name == "+"
+        assert grouping(value.values[0]) == "(a * b)"
+        value = value.called.object
+    assert grouping(value) == "(a * b)"
+
+CACHED_SOURCE = """
+def double(a:Int) -> Int
+    return a * 2
+end
+puts(double(4))
+"""
+
+def test_parse_cache(tmpdir, monkeypatch):
+    monkeypatch.setattr(cache, "enabled", True)
+
+    path = tmpdir.join("cached.jm")
+    path.write(CACHED_SOURCE)
+
+    with open(str(path), "r") as f:
+        parsed = jam.parse(f)
+
+    # Parsing again must be served from the cache
+    def fail(*args):
+        raise AssertionError("Parsed a cached source")
+    with monkeypatch.context() as m:
+        m.setattr(Parser, "parseModule", fail)
+
+        with open(str(path), "r") as f:
+            cached = jam.parse(f)
+            assert cached.name == parsed.name
+            assert list(cached.context.children) == list(parsed.context.children)
+            assert repr(cached.main) == repr(parsed.main)
+            # Objects are bound to the new source
+            assert cached.context["double"].source is f
+
+    # Changed sources are parsed again
+    path.write(CACHED_SOURCE + "puts(1)\n")
+    with open(str(path), "r") as f:
+        assert len(jam.parse(f).main) == 2
+
+def test_cache_eviction(tmpdir, monkeypatch):
+    monkeypatch.setattr(cache, "enabled", True)
+    monkeypatch.setattr(cache, "size_limit", 250)
+
+    # Entries of other compiler versions are left alone
+    other_version = tmpdir.join("cache", "0" * 32, "test", "a")
+    other_version.write(b"x" * 1000, ensure=True)
+
+    cache.write("test", "a", b"a" * 100)
+    cache.write("test", "b", b"b" * 100)
+    os.utime(cache.path("test", "a"), (0, 0))
+    os.utime(cache.path("test", "b"), (1, 1))
+
+    # Reading an entry marks it as recently used
+    assert cache.read("test", "a") == b"a" * 100
+
+    # The least recently used entry is evicted
+    cache.write("test", "c", b"c" * 100)
+    assert cache.read("test", "b") is None
+    assert cache.read("test", "a") == b"a" * 100
+    assert cache.read("test", "c") == b"c" * 100
+    assert other_version.check()
+
+    # The index keeps track of the size, without walking the cache
+    assert cache._readSize() == 200
+    monkeypatch.setattr(cache, "_evict", lambda: pytest.fail("Evicted below the limit"))
+    cache.write("test", "a", b"a" * 50)
+    assert cache._readSize() == 150
+
+def test_artifact_cache(tmpdir, monkeypatch):
+    monkeypatch.setattr(cache, "enabled", True)
+
+    tmpdir.join("main.jm").write("import lib\nlib.foo()\n")
+    tmpdir.join("lib.jm").write("def foo()\n  puts(\"foo\")\nend\n")
+
+    # Imported files are dependencies of the program
+    with lekvar.useFrontend(jam), open(str(tmpdir.join("main.jm")), "r") as f:
+        lekvar.verify(jam.parse(f))
+        dependencies = lekvar.State.dependencies
+        assert dependencies == [str(tmpdir.join("lib.jm"))]
+
+        key = artifacts.key(f, ".ll", 1)
+        assert artifacts.load(key) is None
+        artifacts.store(key, dependencies, b"artifact")
+        assert artifacts.load(key) == b"artifact"
+
+        # Keys depend on the options
+        assert artifacts.key(f, ".ll", 2) != key
+
+    # Changing a dependency invalidates the artifact
+    tmpdir.join("lib.jm").write("def foo()\n  puts(\"bar\")\nend\n")
+    assert artifacts.load(key) is None
+
+    # As does changing the source
+    artifacts.store(key, dependencies, b"artifact")
+    tmpdir.join("main.jm").write("import lib\nlib.foo()\nlib.foo()\n")
+    with open(str(tmpdir.join("main.jm")), "r") as f:
+        assert artifacts.key(f, ".ll", 1) != key
+
+JAM_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "jam")
+
+def test_compile_cache(tmpdir):
+    tmpdir.join("main.jm").write(CACHED_SOURCE)
+    home = tmpdir.mkdir("home")
+
+    def compile(**variables):
+        env = dict(os.environ, HOME=str(home))
+        env.pop("JAM_CACHE", None)
+        env.update(variables)
+        return check_output([sys.executable, JAM_PATH, "compile", "-v", "-s",
+                             "-o", "main.ll", "main.jm"],
+                            cwd=str(tmpdir), env=env, universal_newlines=True)
+
+    # The cache is off unless it is given a location
+    assert "Using cached build" not in compile()
+    assert "Using cached build" not in compile()
+    assert home.listdir() == []
+
+    # Entries of other compiler versions are left alone
+    other_version = tmpdir.join("cache", "0" * 32, "artifacts", "a")
+    other_version.write(b"x" * 1000, ensure=True)
+
+    ir = tmpdir.join("main.ll").read()
+    location = str(tmpdir.join("cache"))
+    assert "Using cached build" not in compile(JAM_CACHE=location)
+    assert "Using cached build" in compile(JAM_CACHE=location)
+    assert tmpdir.join("main.ll").read() == ir
+    assert other_version.check()
+
 def test_builtin_lib(verbosity):
     logging.basicConfig(level=logging.WARNING - verbosity*10, stream=sys.stdout)
 
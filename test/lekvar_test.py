@@ -1,3 +1,4 @@
+import io
 import sys
 import logging
 
@@ -24,3 +25,294 @@ for file in TEST_FILES:
     globals()["test_lekvar_" + file.name] = test
 
 del test
+
+def test_resolution_cache():
+    lekvar.State.init(logging.getLogger())
+    value = lekvar.Variable("value")
+    inner = lekvar.Module("inner", [])
+    sibling = lekvar.Module("sibling", [])
+    outer = lekvar.Module("outer", [inner, sibling, value])
+
+    assert inner.resolveIdentifier("value") == [value]
+
+    hits = lekvar.State.resolution_hits
+    assert inner.resolveIdentifier("value") == [value]
+    assert lekvar.State.resolution_hits == hits + 1
+
+    # Binding the name elsewhere leaves cached resolutions alone
+    sibling.context.addChild(lekvar.Variable("value"))
+    lekvar.Module("unrelated", [lekvar.Variable("value")])
+    assert inner.resolveIdentifier("value") == [value]
+    assert lekvar.State.resolution_hits == hits + 2
+
+    # Binding the name in a scope resolved through invalidates them
+    shadow = lekvar.Variable("value")
+    inner.context.addChild(shadow)
+    assert inner.resolveIdentifier("value") == [value, shadow]
+    outer.context["value"] = lekvar.Variable("value")
+    assert inner.resolveIdentifier("value")[0] is not value
+
+    # As does moving scopes
+    other = lekvar.Module("other", [])
+    other.context.addChild(inner)
+    assert inner.resolveIdentifier("value") == [shadow]
+
+class CountingType(lekvar.Type):
+    checks = 0
+
+    def verify(self):
+        pass
+
+    def checkCompatibility(self, other, check_cache = None):
+        CountingType.checks += 1
+        return other.resolveValue() is self
+
+def test_verifier_stats():
+    source = io.StringIO("""
+def f(x)
+  return x
+end
+
+f(1)
+""")
+
+    lekvar.stats.enabled = True
+    try:
+        with lekvar.use(jam, llvm):
+            lekvar._verify(source, jam)
+    finally:
+        lekvar.stats.enabled = False
+
+    # Counts are attributed to the function being verified
+    counters = lekvar.stats.Counters
+    name = next(name for name in counters.counters if name.endswith(".f.0"))
+    assert counters.counters[name]["identifier lookups"] == 1
+    assert counters.timers[name] > 0
+
+    # Nothing is counted while disabled
+    with lekvar.use(jam, llvm):
+        lekvar._verify(io.StringIO("f = 1\n"), jam)
+    assert counters.counters == {}
+
+def test_demand_verification():
+    source = """
+class Foo
+  new() end
+
+  def broken()
+    return missing
+  end
+end
+
+def unused()
+  return missing
+end
+
+def used(x)
+  return x
+end
+
+Foo()
+used(1)
+"""
+
+    with lekvar.State.verifyingOnDemand(), lekvar.use(jam, llvm):
+        module = lekvar._verify(io.StringIO(source), jam)
+
+    # Only definitions reachable from the main instructions are verified
+    context = module.context
+    assert context["used"].verified and context["Foo"].verified
+    assert not context["unused"].verified
+    assert not context["Foo"].instance_context["broken"].verified
+    assert len(context.verifiedChildren()) == 2
+
+    # Everything is verified by default
+    with pytest.raises(errors.MissingReferenceError):
+        with lekvar.use(jam, llvm):
+            lekvar._verify(io.StringIO(source), jam)
+
+def test_builtin_snapshot():
+    with lekvar.State.verifyingOnDemand():
+        with lekvar.use(jam, llvm):
+            first = lekvar.State.builtins
+            lekvar._verify(io.StringIO("1 + 2\n"), jam)
+        assert first.context["Int"].verified
+
+        # Later uses start from a copy of the builtins, as they were once verified
+        with lekvar.use(jam, llvm):
+            second = lekvar.State.builtins
+    assert second is not first and second.verified
+    assert not second.context["Int"].verified
+
+    # Calls on forward objects are found by their type in copies
+    with lekvar.use(jam, llvm):
+        pass
+    builtins = lekvar.snapshot.load(lekvar.snapshot.key(jam))
+
+    forwards = list(builtins.context["_builtins"].context)
+    assert any(forward.resolved_calls for forward in forwards)
+    for forward in forwards:
+        for call in forward.resolved_calls:
+            assert call in forward.resolved_calls
+
+def test_compatibility_memo(monkeypatch):
+    monkeypatch.setattr(lekvar.util, "memoize_compatibility", True)
+    lekvar.State.init(logging.getLogger())
+    a, b = CountingType(), CountingType()
+
+    assert lekvar.util.checkCompatibility(a, a)
+    checks = CountingType.checks
+    assert lekvar.util.checkCompatibility(a, a)
+    assert CountingType.checks == checks
+
+    # Results follow the targeting of variables
+    variable = lekvar.Variable("x", a)
+    for _ in range(2):
+        with variable.targetValue(a):
+            assert lekvar.util.checkCompatibility(variable, a)
+        with variable.targetValue(b):
+            assert not lekvar.util.checkCompatibility(variable, a)
+
+    # Repeated targetings share results
+    checks = CountingType.checks
+    with variable.targetValue(b):
+        assert not lekvar.util.checkCompatibility(variable, a)
+    assert CountingType.checks == checks
+
+class TypedObject(lekvar.Object):
+    def __init__(self, type):
+        lekvar.Object.__init__(self)
+        self.type = type
+
+    def verify(self):
+        pass
+
+    def resolveType(self):
+        return self.type
+
+def test_compatibility_memo_inferred_return(monkeypatch):
+    monkeypatch.setattr(lekvar.util, "memoize_compatibility", True)
+    lekvar.State.init(logging.getLogger())
+    a, b = CountingType(), CountingType()
+    function = lekvar.Function("f", [], [lekvar.Return(TypedObject(a))], [])
+    lekvar.Module("m", [function])
+    call = lekvar.FunctionType([], b)
+
+    # Without a return type, the function is compatible with any call
+    assert lekvar.util.checkCompatibility(function.type, call)
+
+    # Inferring the return type invalidates the memoized result
+    function.verify()
+    assert function.type.return_type is a
+    assert not lekvar.util.checkCompatibility(function.type, call)
+
+def test_forward_targeting():
+    lekvar.State.init(logging.getLogger())
+    a, b = lekvar.Class("A", None, []), lekvar.Class("B", None, [])
+    module = lekvar.Module("m", [a, b])
+    module.verify()
+    x, y = lekvar.ForwardObject(module, "x"), lekvar.ForwardObject(module, "y")
+
+    with lekvar.forward.target([(x, a), (y, b)], False):
+        assert x.target is a and y.target is b
+        with lekvar.forward.target([(x, b)], False):
+            assert x.target is b and y.target is b
+        assert x.target is a
+    assert x.target is None and y.target is None
+
+    # Failed targetings are undone
+    with lekvar.State.scoped(module):
+        x.context["missing"]
+    with pytest.raises(errors.DependencyError):
+        with lekvar.forward.target([(y, a), (x, a)], False):
+            pass
+    assert x.target is None and y.target is None
+
+class NominalType(CountingType):
+    def resolveNominal(self):
+        return self
+
+# A distinct type, resolving to another
+class AliasType(CountingType):
+    def __init__(self, value):
+        CountingType.__init__(self)
+        self.value = value
+
+    def resolveValue(self):
+        return self.value
+
+    def checkCompatibility(self, other, check_cache = None):
+        return self.value.checkCompatibility(other, check_cache)
+
+def test_constraint_store():
+    lekvar.State.init(logging.getLogger())
+    a, b = NominalType(), NominalType()
+
+    store = lekvar.constraints.ConstraintStore()
+    for _ in range(3):
+        assert store.add((AliasType(a),))
+    assert len(store) == 3
+
+    # Equivalent constraints are checked once, and results are memoized
+    checks = CountingType.checks
+    assert store.check(a, set(), {None: set()})
+    assert CountingType.checks == checks + 1
+    assert store.check(a, set(), {None: set()})
+    assert CountingType.checks == checks + 1
+
+    # Types of other nominal keys never match
+    assert not store.check(b, set(), {None: set()})
+    assert CountingType.checks == checks + 1
+
+    assert store.add((a, b))
+    assert not store.add((a, b))
+    assert store.check(a, set(), {None: set()})
+
+def test_overload_index():
+    a, b = lekvar.Class("A", None, []), lekvar.Class("B", None, [])
+    forward = lekvar.ForwardObject(None)
+
+    overloads = [
+        lekvar.FunctionType([a, a]),
+        lekvar.FunctionType([b]),
+        lekvar.FunctionType([a, b]),
+        lekvar.FunctionType([forward, b]),
+    ]
+    index = lekvar.method.OverloadIndex([(overload, overload) for overload in overloads])
+
+    assert index.candidates(lekvar.FunctionType([a, b])) == [overloads[2], overloads[3]]
+    assert index.candidates(lekvar.FunctionType([b])) == [overloads[1]]
+    assert index.candidates(lekvar.FunctionType([forward, a])) == [overloads[0]]
+    assert index.candidates(lekvar.FunctionType([])) == []
+
+def test_overload_use():
+    lekvar.State.init(logging.getLogger())
+    a, b = lekvar.Class("A", None, []), lekvar.Class("B", None, [])
+    lekvar.Module("m", [a, b]).verify()
+
+    method_type = lekvar.MethodType([lekvar.FunctionType([a]), lekvar.FunctionType([b])])
+    method_type.verify()
+
+    state = lekvar.State.targetingState()
+    method_type.resolveInstanceCall(lekvar.FunctionType([a]))
+    assert lekvar.State.targetingState() != state
+
+    # Resolving to an overload already in use keeps memoized checks
+    state = lekvar.State.targetingState()
+    method_type.resolveInstanceCall(lekvar.FunctionType([a]))
+    assert lekvar.State.targetingState() == state
+    assert method_type.used_overload_types == [method_type.overloads[0]]
+
+def test_canonical_function_type():
+    lekvar.State.init(logging.getLogger())
+    a, b = lekvar.Class("A", None, []), lekvar.Class("B", None, [])
+
+    type = lekvar.FunctionType.canonical([a, b])
+    assert lekvar.FunctionType.canonical([a, b]) is type
+    assert lekvar.FunctionType.canonical([b, a]) is not type
+    assert lekvar.FunctionType.canonical([a, b], a) is not type
+
+    # Identifiers are interchangeable with their value
+    identifier = lekvar.Identifier("A")
+    identifier.value = a
+    assert lekvar.FunctionType.canonical([identifier]) is lekvar.FunctionType.canonical([a])
@@ -1,22 +1,29 @@
+import gc
+import io
 import os
 import sys
 import logging
 from subprocess import check_output
+from concurrent.futures import ThreadPoolExecutor
+from ctypes import c_uint
 
 import pytest
 
-from compiler import jam, lekvar, llvm, errors
+from compiler import jam, lekvar, llvm, errors, session
 from compiler.llvm import bindings as c
 from programs import TEST_FILES
 
 BUILD_PATH = "build/tests"
 
 @pytest.yield_fixture(autouse=True)
-def setup_teardown():
+def setup_teardown(monkeypatch):
     os.makedirs(BUILD_PATH, exist_ok=True)
     yield
 
 def hello_world():
+    return hello_world_module().toString()
+
+def hello_world_module():
     i32 = c.Int.new(32)
     module = c.Module.fromName("test")
     builder = c.Builder.new()
@@ -37,7 +44,7 @@ def hello_world():
     builder.ret(c.Value.constInt(i32, 0, False))
 
     module.verify()
-    return module.toString()
+    return module
 
 def test_llvm_running():
     source = hello_world()
@@ -48,6 +55,51 @@ def test_llvm_running():
 
     assert b"Hello World!\n" == llvm.interpret(source)
 
+def test_llvm_executing():
+    module = hello_world_module()
+
+    # Executing in process leaves the module usable
+    assert b"Hello World!\n" == llvm.execute(module)
+    assert b"Hello World!\n" == llvm.execute(module)
+    assert b"Hello World!\n" == llvm.interpret(module.toString())
+
+def test_jit_default():
+    # Modules are executed in process unless JAM_JIT=0
+    command = [sys.executable, "-c", "from compiler import llvm; print(llvm.jit)"]
+    for value, jit in [(None, b"True"), ("1", b"True"), ("0", b"False")]:
+        env = dict(os.environ)
+        env.pop("JAM_JIT", None)
+        if value is not None:
+            env["JAM_JIT"] = value
+        assert check_output(command, env=env).strip() == jit
+
+def test_llvm_bitcode():
+    module = hello_world_module()
+    bitcode = module.toBitcode()
+    assert c.isBitcode(bitcode)
+
+    path = os.path.join(BUILD_PATH, "llvm_bitcode.bc")
+    module.writeBitcodeToFile(path)
+    with open(path, 'rb') as f:
+        assert bitcode == f.read()
+
+    assert b"Hello World!\n" == llvm.interpret(bitcode)
+
+    path = os.path.join(BUILD_PATH, "llvm_bitcode.out")
+    with open(path, 'wb') as f:
+        f.write(llvm.compile(bitcode))
+
+    os.chmod(path, 0o775)
+    assert b"Hello World!\n" == check_output("./{}".format(path))
+
+def test_llvm_print_to_file():
+    module = hello_world_module()
+
+    path = os.path.join(BUILD_PATH, "llvm_print_to_file.ll")
+    module.printToFile(path)
+    with open(path, 'rb') as f:
+        assert module.toString() == f.read()
+
 def test_llvm_compiling():
     source = hello_world()
 
@@ -58,6 +110,184 @@ def test_llvm_compiling():
     os.chmod(path, 0o775)
     assert b"Hello World!\n" == check_output("./{}".format(path))
 
+def test_llvm_compiling_module():
+    path = os.path.join(BUILD_PATH, "llvm_compiling_module.out")
+    with open(path, 'wb') as f:
+        f.write(llvm.compile_module(hello_world_module()))
+
+    os.chmod(path, 0o775)
+    assert b"Hello World!\n" == check_output("./{}".format(path))
+
+def test_target_machine():
+    machine = c.TargetMachine.native(c.CodeGenOptLevel.Default)
+    assert machine.triple == c.getDefaultTargetTriple()
+
+    # Module properties take and give bytes
+    module = hello_world_module()
+    module.target_triple = machine.triple.encode("UTF-8")
+    assert module.target_triple == machine.triple.encode("UTF-8")
+    module.verify()
+
+    path = os.path.join(BUILD_PATH, "target_machine.s")
+    machine.emitToFile(module, path, c.CodeGenFileType.AssemblyFile)
+    with open(path, 'r') as f:
+        assert "main" in f.read()
+
+    path = os.path.join(BUILD_PATH, "target_machine.o")
+    machine.emitToFile(module, path)
+    assert os.path.getsize(path) > 0
+
+    with pytest.raises(c.TargetError):
+        machine.emitToFile(module, os.path.join(BUILD_PATH, "missing", "target_machine.o"))
+
+def test_pass_pipeline(monkeypatch):
+    assert llvm.passes.parse("basic") == llvm.passes.PIPELINES["basic"]
+    with pytest.raises(ValueError):
+        llvm.passes.parse("mem2reg,nonsense")
+
+    # Consecutive passes of the same kind share a pass manager
+    stages = llvm.passes._stages(["mem2reg", "gvn", "inline", "globaldce", "gvn"])
+    assert stages == [["mem2reg", "gvn"], ["inline", "globaldce"], ["gvn"]]
+
+    # Every pass manager is disposed exactly once, as soon as it is done
+    disposed = []
+    dispose = c._lib.LLVMDisposePassManager
+    def recordDispose(manager):
+        disposed.append(manager.value)
+        dispose(manager)
+    monkeypatch.setattr(c._lib, "LLVMDisposePassManager", recordDispose)
+
+    for timed in [False, True]:
+        monkeypatch.setattr(llvm.passes, "pipeline", llvm.passes.parse("mem2reg,inline,instcombine"))
+        monkeypatch.setattr(llvm.passes, "timed", timed)
+
+        module = hello_world_module()
+        del disposed[:]
+        llvm.passes.optimise(module, 1, 1)
+        assert len(disposed) == 3
+        module.verify()
+        assert module.countInstructions() > 0
+        assert b"Hello World!\n" == llvm.execute(module)
+
+    gc.collect()
+    assert len(disposed) == 3
+
+def test_binding_flavours(monkeypatch, caplog):
+    # Wrap a spied on symbol in flavours of its own
+    monkeypatch.setattr(c, "_flavours", [])
+    monkeypatch.setattr(c, "instrumented", False)
+
+    calls = []
+    count_params = c._lib.LLVMCountParams
+    def spy(function):
+        calls.append(function)
+        return count_params(function)
+    monkeypatch.setattr(c._lib, "LLVMSpiedCountParams", spy, raising=False)
+
+    class Spied(c.FunctionValue):
+        pass
+    Spied.wrapInstanceFunc("countParams", "LLVMSpiedCountParams", [], c_uint)
+
+    [(cls, attr, direct, instrumented)] = c._flavours
+    assert (cls, attr) == (Spied, "countParams")
+
+    module = hello_world_module()
+    main = Spied(module.getFunction("main").value)
+
+    logger = logging.getLogger("test_binding_flavours")
+    monkeypatch.setattr(session.current(), "logger", logger)
+    caplog.set_level(logging.DEBUG, logger.name)
+
+    # The direct flavour calls the symbol, without going through the logging
+    # wrapper even when debug logging is enabled
+    assert Spied.countParams is direct
+    assert main.countParams() == 0
+    assert calls == [main]
+    assert caplog.records == []
+
+    # The instrumented flavour calls the same symbol, and logs the call
+    c.instrument()
+    assert Spied.countParams is instrumented
+    assert main.countParams() == 0
+    assert calls == [main, main]
+    assert [record.getMessage() for record in caplog.records] == [
+        "Spied.countParams calling LLVMSpiedCountParams({},)".format(main)]
+
+    # Switching back uses the direct flavour again
+    c.instrument(False)
+    assert Spied.countParams is direct
+    assert main.countParams() == 0
+    assert len(caplog.records) == 1
+
+def test_debug_session_flavour():
+    logger = logging.getLogger("test_debug_session_flavour")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+
+    direct = c.Module.__dict__["toString"]
+    assert not c.instrumented
+
+    # Debug sessions use the instrumented flavour, while any of them lasts
+    with session.begin(), llvm.State.begin(logger):
+        assert c.instrumented
+        with session.begin(), llvm.State.begin(logger):
+            assert c.instrumented
+        assert c.instrumented
+
+    # After which the direct flavour is back, for every session
+    assert not c.instrumented
+    assert c.Module.__dict__["toString"] is direct
+
+    logger.setLevel(logging.WARNING)
+    with session.begin(), llvm.State.begin(logger):
+        assert not c.instrumented
+
+def test_debug_repr(monkeypatch):
+    monkeypatch.setattr(c, "instrumented", c.instrumented)
+    c.instrument()
+    try:
+        i32 = c.Int.new(32)
+        module = c.Module.fromName("test")
+        builder = c.Builder.new()
+        function = module.addFunction("f", c.Function.new(i32, [i32], False))
+        builder.positionAtEnd(function.appendBlock("entry"))
+
+        # Values name the calls they came from, as deep as is readable
+        value = function.getParam(0)
+        for _ in range(2000):
+            value = builder.iAdd(value, c.Value.constInt(i32, 1, False), "")
+        assert repr(value).startswith("Builder.new().iAdd(Builder.new().iAdd(")
+        assert "Value(0x" in repr(value)
+    finally:
+        c.instrument(False)
+
+def test_type_interning():
+    from compiler.llvm import util
+
+    with llvm.State.begin(logging.getLogger()):
+        context = llvm.State.context
+        i32 = c.Int.newInContext(context, 32)
+        assert util.intType(32) is util.intType(32)
+        assert util.intType(32).value == i32.value
+
+        # Equal types are only created once
+        struct = util.structType([util.pointerType(i32), c.Int.newInContext(context, 32)])
+        assert struct is util.structType([util.pointerType(c.Int.newInContext(context, 32)), i32])
+        assert struct is not util.structType([util.pointerType(i32), i32], True)
+
+        function = util.functionType(i32, [struct])
+        assert function is util.functionType(i32, [struct])
+        assert function is not util.functionType(i32, [struct], True)
+
+        assert util.referenceType(i32) is util.referenceType(i32)
+        assert util.voidPointerType().value == c.Type.void_p(0, context).value
+
+    # Each module interns its own, in a context of its own
+    with llvm.State.begin(logging.getLogger()):
+        assert llvm.State.context.value != context.value
+        assert util.intType(32).value != i32.value
+
 def test_module_verification_handling():
     module = c.Module.fromName("test")
     builder = c.Builder.new()
@@ -92,19 +322,79 @@ def test_builtin_lib():
     with open(BUILD_PATH + "/builtins.ll", "wb") as f:
         f.write(source)
 
+def test_concurrent_sessions():
+    global_context = c.BorrowedContext.getGlobal().value
+
+    def compile(value):
+        source = io.StringIO("""
+def double(x:Int) -> Int
+  return x * 2
+end
+
+puts(double({}))
+puts({}.5)
+""".format(value, value))
+
+        # Every thread starts out with a session of its own, emitting in an
+        # llvm context of its own
+        with lekvar.use(jam, llvm):
+            ir = lekvar.compile(source, jam, llvm)
+            context = llvm.State.context
+            assert llvm.State.module.context.value == context.value
+            return ir, context
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(compile, range(16)))
+
+    contexts = {context.value for ir, context in results}
+    assert len(contexts) == len(results)
+    assert global_context not in contexts
+
+    # Each module declares the functions it uses itself
+    for value, (ir, context) in enumerate(results):
+        assert b"@printf(" in ir
+        expected = "{}\n{}.5".format(value * 2, value)
+        assert llvm.interpret(ir).decode("UTF-8").startswith(expected)
+
+    with session.begin():
+        assert b"@printf(" in compile(1)[0]
+
+def test_emission_scope():
+    lekvar.State.init(logging.getLogger())
+    inner, outer = lekvar.Variable("inner"), lekvar.Variable("outer")
+    function = lekvar.Function("function", [], [], [inner])
+    lekvar.Module("module", [function, outer])
+
+    with llvm.State.begin(logging.getLogger()):
+        inner.llvm_value, outer.llvm_value = 1, 2
+
+        # Only the emission state of what belongs to the function is reset
+        with function.resetEmission():
+            assert inner.llvm_value is None and outer.llvm_value == 2
+            inner.llvm_value, outer.llvm_value = 3, 4
+            with function.resetEmission():
+                assert inner.llvm_value is None
+            assert inner.llvm_value == 3
+
+        assert inner.llvm_value == 1 and outer.llvm_value == 4
+
 
 for file in TEST_FILES:
     if file.has_error:
         continue
 
-    def _test(verbosity, file = file):
+    def _test(verbosity, monkeypatch, file = file):
         logging.basicConfig(level=logging.WARNING - verbosity*10, stream=sys.stdout)
 
+        # Programs expected to fail may crash, which must not take pytest with them
+        if file.expect_fail:
+            monkeypatch.setattr(llvm, "jit", False)
+
         with open(file.path, "r") as f_in, open(file.build + ".ll", "wb") as f_out:
             with lekvar.use(jam, llvm):
                 code = lekvar.compile(f_in, jam, llvm)
                 f_out.write(code)
-                output = llvm.interpret(code)
+                output = llvm.execute(llvm.State.module)
                 assert file.output == output
 
     if file.expect_fail:
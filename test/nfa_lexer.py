@@ -0,0 +1,42 @@
+from compiler.errors import InternalError
+from compiler.jam.lexer import TREE, Lexer
+
+# Reference lexer walking the non-deterministic tree directly.
+# Much slower than Lexer, kept for testing and benchmarking the DFA against.
+#
+# It restarts only when TREE is the single next node, where Lexer restarts on
+# any transition into START_STATE. See test_lexer_restart for where these differ.
+class NFALexer(Lexer):
+    def lex(self):
+        token_start = self.position - 1
+        current_nodes = [TREE]
+
+        while True:
+            next_nodes = []
+
+            for node in current_nodes:
+                next_nodes += node.evaluate(self.current)
+
+            if len(next_nodes) == 0:
+                if len(current_nodes) > 0:
+                    return self.outputNode(current_nodes, token_start)
+                raise InternalError("Zero current nodes in lex tree.")
+
+            elif len(next_nodes) == 1 and next_nodes[0] is TREE:
+                # Restart
+                token_start = self.position
+                current_nodes = [TREE]
+
+            if not self.current:
+                return None
+            self.next()
+
+            current_nodes = next_nodes
+
+    def outputNode(self, nodes, start):
+        for node in nodes:
+            if node.token_type is not None:
+                return self.store.append(node.token_type, start, self.position - 1)
+            elif node is TREE and not self.current:
+                return None
+        self.unexpectedCharacter()